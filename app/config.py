@@ -22,6 +22,61 @@ class Settings:
     price_currency: str
     support_contact: str
     text_overrides: dict[str, str]
+    user_cache_size: int
+    user_cache_ttl: float
+    bot_mode: str
+    webhook_base_url: str | None
+    webhook_path: str
+    webhook_secret: str | None
+    web_host: str
+    web_port: int
+    notify_concurrency: int
+    telegram_global_rate: float
+    telegram_chat_rate: float
+    reconcile_interval: float
+    reconcile_batch_size: int
+    cryptobot_webhook_path: str | None
+    cryptobot_coalesce_ms: float
+    cryptobot_max_retries: int
+    cryptobot_backoff_base: float
+    cryptobot_backoff_max: float
+    cryptobot_breaker_threshold: int
+    cryptobot_breaker_reset: float
+    cryptobot_timeout: float
+    cryptobot_connect_timeout: float
+    cryptobot_read_timeout: float
+    cryptobot_pool_size: int
+    cryptobot_pool_per_host: int
+    cryptobot_dns_ttl: int
+    cryptobot_keepalive: float
+    cryptobot_warm_connections: int
+    registration_flush_ms: float
+    registration_batch_size: int
+    sqlite_tuning: bool
+    sqlite_read_pool_size: int
+    sqlite_busy_timeout_ms: int
+    sqlite_cache_size_kb: int
+    sqlite_mmap_size: int
+    db_pool_size: int
+    db_max_overflow: int
+    db_pool_timeout: float
+    db_pool_recycle: int
+    db_pool_pre_ping: bool
+    db_statement_timeout_ms: int
+    db_statement_cache_size: int
+    throttle_rate: float
+    throttle_burst: float
+    throttle_max_keys: int
+    broadcast_rate: float
+    broadcast_batch_size: int
+    metrics_host: str
+    metrics_port: int
+    profiling: bool
+    profile_sample_rate: float
+    slow_update_ms: float
+    profile_dir: str
+    workers: int
+    drain_timeout: float
 
 
 def _parse_admin_chat_ids(value: str | None, fallback: str | None) -> tuple[int, ...]:
@@ -40,6 +95,13 @@ def _parse_admin_chat_ids(value: str | None, fallback: str | None) -> tuple[int,
     return tuple(result)
 
 
+def _env_flag(name: str, default: bool) -> bool:
+    value = os.getenv(name)
+    if value is None:
+        return default
+    return value.strip().lower() in ("1", "true", "yes", "on")
+
+
 @lru_cache
 def get_settings() -> Settings:
     load_dotenv()
@@ -60,6 +122,61 @@ def get_settings() -> Settings:
         price_currency=os.getenv("PRICE_CURRENCY", "₽"),
         support_contact=os.getenv("SUPPORT_CONTACT", ""),
         text_overrides=text_overrides,
+        user_cache_size=int(os.getenv("USER_CACHE_SIZE", "10000")),
+        user_cache_ttl=float(os.getenv("USER_CACHE_TTL", "60")),
+        bot_mode=os.getenv("BOT_MODE", "polling").lower(),
+        webhook_base_url=os.getenv("WEBHOOK_BASE_URL"),
+        webhook_path=os.getenv("WEBHOOK_PATH", "/telegram/webhook"),
+        webhook_secret=os.getenv("WEBHOOK_SECRET"),
+        web_host=os.getenv("WEB_HOST", "0.0.0.0"),
+        web_port=int(os.getenv("WEB_PORT", "8080")),
+        notify_concurrency=int(os.getenv("NOTIFY_CONCURRENCY", "10")),
+        telegram_global_rate=float(os.getenv("TELEGRAM_GLOBAL_RATE", "30")),
+        telegram_chat_rate=float(os.getenv("TELEGRAM_CHAT_RATE", "1")),
+        reconcile_interval=float(os.getenv("RECONCILE_INTERVAL", "60")),
+        reconcile_batch_size=int(os.getenv("RECONCILE_BATCH_SIZE", "100")),
+        cryptobot_webhook_path=os.getenv("CRYPTOBOT_WEBHOOK_PATH") or None,
+        cryptobot_coalesce_ms=float(os.getenv("CRYPTOBOT_COALESCE_MS", "5")),
+        cryptobot_max_retries=int(os.getenv("CRYPTOBOT_MAX_RETRIES", "3")),
+        cryptobot_backoff_base=float(os.getenv("CRYPTOBOT_BACKOFF_BASE", "0.2")),
+        cryptobot_backoff_max=float(os.getenv("CRYPTOBOT_BACKOFF_MAX", "2")),
+        cryptobot_breaker_threshold=int(os.getenv("CRYPTOBOT_BREAKER_THRESHOLD", "5")),
+        cryptobot_breaker_reset=float(os.getenv("CRYPTOBOT_BREAKER_RESET", "30")),
+        cryptobot_timeout=float(os.getenv("CRYPTOBOT_TIMEOUT", "10")),
+        cryptobot_connect_timeout=float(os.getenv("CRYPTOBOT_CONNECT_TIMEOUT", "3")),
+        cryptobot_read_timeout=float(os.getenv("CRYPTOBOT_READ_TIMEOUT", "8")),
+        cryptobot_pool_size=int(os.getenv("CRYPTOBOT_POOL_SIZE", "100")),
+        cryptobot_pool_per_host=int(os.getenv("CRYPTOBOT_POOL_PER_HOST", "0")),
+        cryptobot_dns_ttl=int(os.getenv("CRYPTOBOT_DNS_TTL", "300")),
+        cryptobot_keepalive=float(os.getenv("CRYPTOBOT_KEEPALIVE", "30")),
+        cryptobot_warm_connections=int(os.getenv("CRYPTOBOT_WARM_CONNECTIONS", "4")),
+        registration_flush_ms=float(os.getenv("REGISTRATION_FLUSH_MS", "200")),
+        registration_batch_size=int(os.getenv("REGISTRATION_BATCH_SIZE", "500")),
+        sqlite_tuning=_env_flag("SQLITE_TUNING", False),
+        sqlite_read_pool_size=int(os.getenv("SQLITE_READ_POOL_SIZE", "4")),
+        sqlite_busy_timeout_ms=int(os.getenv("SQLITE_BUSY_TIMEOUT_MS", "5000")),
+        sqlite_cache_size_kb=int(os.getenv("SQLITE_CACHE_SIZE_KB", "65536")),
+        sqlite_mmap_size=int(os.getenv("SQLITE_MMAP_SIZE", "268435456")),
+        db_pool_size=int(os.getenv("DB_POOL_SIZE", "10")),
+        db_max_overflow=int(os.getenv("DB_MAX_OVERFLOW", "10")),
+        db_pool_timeout=float(os.getenv("DB_POOL_TIMEOUT", "30")),
+        db_pool_recycle=int(os.getenv("DB_POOL_RECYCLE", "1800")),
+        db_pool_pre_ping=_env_flag("DB_POOL_PRE_PING", True),
+        db_statement_timeout_ms=int(os.getenv("DB_STATEMENT_TIMEOUT_MS", "10000")),
+        db_statement_cache_size=int(os.getenv("DB_STATEMENT_CACHE_SIZE", "100")),
+        throttle_rate=float(os.getenv("THROTTLE_RATE", "2")),
+        throttle_burst=float(os.getenv("THROTTLE_BURST", "5")),
+        throttle_max_keys=int(os.getenv("THROTTLE_MAX_KEYS", "100000")),
+        broadcast_rate=float(os.getenv("BROADCAST_RATE", "25")),
+        broadcast_batch_size=int(os.getenv("BROADCAST_BATCH_SIZE", "100")),
+        metrics_host=os.getenv("METRICS_HOST", "127.0.0.1"),
+        metrics_port=int(os.getenv("METRICS_PORT", "0")),
+        profiling=_env_flag("PROFILING", False),
+        profile_sample_rate=float(os.getenv("PROFILE_SAMPLE_RATE", "0.01")),
+        slow_update_ms=float(os.getenv("SLOW_UPDATE_MS", "1000")),
+        profile_dir=os.getenv("PROFILE_DIR", "profiles"),
+        workers=int(os.getenv("WORKERS", "1")),
+        drain_timeout=float(os.getenv("DRAIN_TIMEOUT", "25")),
     )
 
 
@@ -72,3 +189,10 @@ def log_missing_settings(settings: Settings) -> None:
         logging.warning("RUB_PAY_URL is not configured")
     if not settings.admin_chat_ids:
         logging.warning("ADMIN_CHAT_ID(S) is not configured")
+    if settings.workers > 1 and settings.database_url.startswith("sqlite") and not settings.sqlite_tuning:
+        logging.warning("WORKERS > 1 on SQLite without SQLITE_TUNING=1 will hit 'database is locked'")
+    if settings.bot_mode == "webhook":
+        if not settings.webhook_secret:
+            logging.warning("WEBHOOK_SECRET is not configured")
+        if not settings.webhook_base_url:
+            logging.warning("WEBHOOK_BASE_URL is not configured, webhook will not be registered")
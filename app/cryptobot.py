@@ -1,17 +1,160 @@
 ﻿from __future__ import annotations
 
+import asyncio
+from dataclasses import dataclass
+import hashlib
+import hmac
+import logging
+import random
+import time
+
 import aiohttp
 
 from app.config import get_settings
+from app.metrics import (
+    CRYPTOBOT_BREAKER_OPENED,
+    CRYPTOBOT_BREAKER_STATE,
+    CRYPTOBOT_RETRIES,
+    CRYPTOBOT_SECONDS,
+    CRYPTOBOT_SHORT_CIRCUITED,
+)
+from app.profiling import record_span
 
 API_URL = "https://pay.crypt.bot/api"
+MAX_INVOICE_BATCH = 100
+
+
+class CryptoBotHTTPError(RuntimeError):
+    def __init__(self, status: int, text: str):
+        super().__init__(f"CryptoBot HTTP {status}: {text}")
+        self.status = status
+
+    @property
+    def transient(self) -> bool:
+        return self.status == 429 or self.status >= 500
+
+
+class CryptoBotAPIError(CryptoBotHTTPError):
+    """A 2xx answer without a usable result: a non-JSON body or ``ok: false``."""
+
+    def __init__(self, status: int, text: str, transient: bool = False):
+        super().__init__(status, text)
+        self._transient = transient
+
+    @property
+    def transient(self) -> bool:
+        return self._transient
+
+
+class CryptoBotUnavailable(RuntimeError):
+    """CryptoBot is down: retries are exhausted or the circuit breaker is open."""
+
+
+@dataclass(slots=True)
+class CryptoBotStats:
+    requests: int = 0
+    retries: int = 0
+    failures: int = 0
+    short_circuited: int = 0
+    breaker_opened: int = 0
+
+
+class CircuitBreaker:
+    CLOSED = "closed"
+    OPEN = "open"
+    HALF_OPEN = "half_open"
+    # Values of the cryptobot_breaker_state gauge.
+    STATES = (CLOSED, HALF_OPEN, OPEN)
+
+    def __init__(self, failure_threshold: int, reset_timeout: float):
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+        self._state = self.CLOSED
+        self._failures = 0
+        self._opened_at = 0.0
+        self._probe_in_flight = False
+
+    @property
+    def state(self) -> str:
+        if self._state == self.OPEN and time.monotonic() - self._opened_at >= self.reset_timeout:
+            return self.HALF_OPEN
+        return self._state
+
+    def allow(self) -> bool:
+        state = self.state
+        if state == self.CLOSED:
+            return True
+        if state == self.HALF_OPEN and not self._probe_in_flight:
+            self._state = self.HALF_OPEN
+            self._probe_in_flight = True
+            return True
+        return False
+
+    def release_probe(self) -> None:
+        """Frees the half-open slot of a probe that ended without an outcome, e.g. when cancelled."""
+        self._probe_in_flight = False
+
+    def record_success(self) -> None:
+        self._state = self.CLOSED
+        self._failures = 0
+        self._probe_in_flight = False
+
+    def record_failure(self) -> bool:
+        """Returns True if this failure opened the breaker."""
+        self._failures += 1
+        self._probe_in_flight = False
+        if self._state == self.HALF_OPEN or self._failures >= self.failure_threshold:
+            opened = self._state != self.OPEN
+            self._state = self.OPEN
+            self._opened_at = time.monotonic()
+            return opened
+        return False
+
+
+def _consume_result(future: asyncio.Future) -> None:
+    if not future.cancelled():
+        future.exception()
 
 
 class CryptoBotClient:
-    def __init__(self, token: str, timeout: int = 10):
+    def __init__(
+        self,
+        token: str,
+        timeout: float = 10,
+        connect_timeout: float | None = None,
+        read_timeout: float | None = None,
+        pool_size: int = 100,
+        pool_per_host: int = 0,
+        dns_ttl: int | None = 300,
+        keepalive: float = 30,
+        coalesce_window: float = 0.005,
+        max_retries: int = 3,
+        backoff_base: float = 0.2,
+        backoff_max: float = 2.0,
+        breaker_threshold: int = 5,
+        breaker_reset: float = 30.0,
+    ):
         self.token = token
-        self._timeout = aiohttp.ClientTimeout(total=timeout)
+        self._timeout = aiohttp.ClientTimeout(
+            total=timeout,
+            connect=connect_timeout,
+            sock_read=read_timeout,
+        )
+        self._pool_size = pool_size
+        self._pool_per_host = pool_per_host
+        self._dns_ttl = dns_ttl
+        self._keepalive = keepalive
         self._session: aiohttp.ClientSession | None = None
+        self._max_retries = max_retries
+        self._backoff_base = backoff_base
+        self._backoff_max = backoff_max
+        self.breaker = CircuitBreaker(breaker_threshold, breaker_reset)
+        self.stats = CryptoBotStats()
+        self._coalesce_window = coalesce_window
+        self._queued: dict[str, asyncio.Future[dict | None]] = {}
+        self._in_flight: dict[str, asyncio.Future[dict | None]] = {}
+        self._flush_handle: asyncio.TimerHandle | None = None
+        self._batch_tasks: set[asyncio.Task[None]] = set()
 
     async def close(self) -> None:
         if self._session is not None and not self._session.closed:
@@ -21,25 +164,96 @@ class CryptoBotClient:
     async def _get_session(self) -> aiohttp.ClientSession:
         if self._session is None or self._session.closed:
             headers = {"Crypto-Pay-API-Token": self.token}
+            connector = aiohttp.TCPConnector(
+                limit=self._pool_size,
+                limit_per_host=self._pool_per_host,
+                ttl_dns_cache=self._dns_ttl,
+                keepalive_timeout=self._keepalive,
+            )
             self._session = aiohttp.ClientSession(
                 headers=headers,
                 timeout=self._timeout,
+                connector=connector,
             )
         return self._session
 
-    async def _request(self, method: str, payload: dict) -> dict:
+    async def warm_up(self, connections: int = 1) -> None:
+        """Opens pooled keep-alive connections so the first real calls skip the TLS handshake."""
+        await asyncio.gather(
+            *(self._request("getMe", {}, idempotent=True) for _ in range(max(connections, 1)))
+        )
+
+    def _backoff(self, attempt: int) -> float:
+        return random.uniform(0, min(self._backoff_max, self._backoff_base * 2**attempt))
+
+    async def _request(self, method: str, payload: dict, idempotent: bool = False) -> dict:
+        """Only idempotent calls are retried; transient failures end in CryptoBotUnavailable."""
+        attempts = self._max_retries + 1 if idempotent else 1
+        for attempt in range(attempts):
+            probe = self.breaker.state != CircuitBreaker.CLOSED
+            if not self.breaker.allow():
+                self.stats.short_circuited += 1
+                CRYPTOBOT_SHORT_CIRCUITED.labels(method).inc()
+                raise CryptoBotUnavailable(f"CryptoBot circuit is open ({method})")
+            self.stats.requests += 1
+            try:
+                result = await self._timed_send(method, payload)
+            except (aiohttp.ClientError, asyncio.TimeoutError, CryptoBotHTTPError) as exc:
+                if isinstance(exc, CryptoBotHTTPError) and not exc.transient:
+                    self.breaker.record_success()
+                    raise
+                self.stats.failures += 1
+                if self.breaker.record_failure():
+                    self.stats.breaker_opened += 1
+                    CRYPTOBOT_BREAKER_OPENED.inc()
+                    logging.warning("CryptoBot circuit opened after %s: %s", method, exc)
+                if attempt + 1 >= attempts:
+                    raise CryptoBotUnavailable(f"CryptoBot {method} failed: {exc}") from exc
+            else:
+                self.breaker.record_success()
+                return result
+            finally:
+                if probe:
+                    self.breaker.release_probe()
+            self.stats.retries += 1
+            CRYPTOBOT_RETRIES.labels(method).inc()
+            await asyncio.sleep(self._backoff(attempt))
+        raise CryptoBotUnavailable(f"CryptoBot {method} failed")
+
+    async def _timed_send(self, method: str, payload: dict) -> dict:
+        started = time.perf_counter()
+        status = "error"
+        try:
+            result = await self._send(method, payload)
+            status = "ok"
+            return result
+        except CryptoBotAPIError:
+            status = "api_error"
+            raise
+        except CryptoBotHTTPError as exc:
+            status = str(exc.status)
+            raise
+        except asyncio.TimeoutError:
+            status = "timeout"
+            raise
+        finally:
+            elapsed = time.perf_counter() - started
+            CRYPTOBOT_SECONDS.labels(method, status).observe(elapsed)
+            record_span("cryptobot", f"{method} {status}", elapsed)
+
+    async def _send(self, method: str, payload: dict) -> dict:
         session = await self._get_session()
         async with session.post(f"{API_URL}/{method}", json=payload) as response:
             if response.status >= 400:
                 text = await response.text()
-                raise RuntimeError(f"CryptoBot HTTP {response.status}: {text}")
+                raise CryptoBotHTTPError(response.status, text)
             content_type = response.headers.get("Content-Type", "")
             if "application/json" not in content_type:
                 text = await response.text()
-                raise RuntimeError(f"CryptoBot non-JSON response: {text}")
+                raise CryptoBotAPIError(response.status, f"non-JSON response: {text}", transient=True)
             data = await response.json()
         if not data.get("ok"):
-            raise RuntimeError(data.get("error", "CryptoBot API error"))
+            raise CryptoBotAPIError(response.status, str(data.get("error", "API error")))
         return data["result"]
 
     async def create_invoice(self, amount: float, asset: str, description: str, payload: str) -> dict:
@@ -52,16 +266,92 @@ class CryptoBotClient:
         return await self._request("createInvoice", body)
 
     async def get_invoice(self, invoice_id: str) -> dict | None:
-        result = await self._request("getInvoices", {"invoice_ids": str(invoice_id)})
-        items = result.get("items", [])
-        return items[0] if items else None
+        """Lookups made within the coalesce window share one getInvoices request."""
+        key = str(invoice_id)
+        future = self._in_flight.get(key) or self._queued.get(key)
+        if future is None:
+            future = asyncio.get_running_loop().create_future()
+            future.add_done_callback(_consume_result)
+            self._queued[key] = future
+            if len(self._queued) >= MAX_INVOICE_BATCH:
+                self._flush_invoice_batch()
+            elif self._flush_handle is None:
+                self._flush_handle = asyncio.get_running_loop().call_later(
+                    self._coalesce_window,
+                    self._flush_invoice_batch,
+                )
+        return await asyncio.shield(future)
+
+    def _flush_invoice_batch(self) -> None:
+        if self._flush_handle is not None:
+            self._flush_handle.cancel()
+            self._flush_handle = None
+        batch, self._queued = self._queued, {}
+        if not batch:
+            return
+        self._in_flight.update(batch)
+        task = asyncio.create_task(self._resolve_invoice_batch(batch))
+        self._batch_tasks.add(task)
+        task.add_done_callback(self._batch_tasks.discard)
+
+    async def _resolve_invoice_batch(self, batch: dict[str, asyncio.Future[dict | None]]) -> None:
+        try:
+            items = await self.get_invoices(list(batch))
+        except asyncio.CancelledError:
+            for future in batch.values():
+                future.cancel()
+            raise
+        except Exception as exc:
+            for future in batch.values():
+                if not future.done():
+                    future.set_exception(exc)
+        else:
+            by_id = {str(item.get("invoice_id")): item for item in items}
+            for key, future in batch.items():
+                if not future.done():
+                    future.set_result(by_id.get(key))
+        finally:
+            for key, future in batch.items():
+                if self._in_flight.get(key) is future:
+                    del self._in_flight[key]
+
+    async def get_invoices(self, invoice_ids: list[str]) -> list[dict]:
+        if not invoice_ids:
+            return []
+        body = {
+            "invoice_ids": ",".join(str(invoice_id) for invoice_id in invoice_ids),
+            "count": len(invoice_ids),
+        }
+        result = await self._request("getInvoices", body, idempotent=True)
+        return result.get("items", [])
+
+
+def verify_webhook_signature(token: str, body: bytes, signature: str) -> bool:
+    secret = hashlib.sha256(token.encode()).digest()
+    expected = hmac.new(secret, body, hashlib.sha256).hexdigest()
+    return hmac.compare_digest(expected, signature)
 
 
 def get_crypto_bot_client() -> CryptoBotClient:
     settings = get_settings()
     if not settings.cryptobot_token:
         raise RuntimeError("CRYPTOBOT_TOKEN environment variable not set")
-    return CryptoBotClient(settings.cryptobot_token)
+    return CryptoBotClient(
+        settings.cryptobot_token,
+        timeout=settings.cryptobot_timeout,
+        connect_timeout=settings.cryptobot_connect_timeout,
+        read_timeout=settings.cryptobot_read_timeout,
+        pool_size=settings.cryptobot_pool_size,
+        pool_per_host=settings.cryptobot_pool_per_host,
+        dns_ttl=settings.cryptobot_dns_ttl,
+        keepalive=settings.cryptobot_keepalive,
+        coalesce_window=settings.cryptobot_coalesce_ms / 1000,
+        max_retries=settings.cryptobot_max_retries,
+        backoff_base=settings.cryptobot_backoff_base,
+        backoff_max=settings.cryptobot_backoff_max,
+        breaker_threshold=settings.cryptobot_breaker_threshold,
+        breaker_reset=settings.cryptobot_breaker_reset,
+    )
 
 
 _client_instance: CryptoBotClient | None = None
@@ -74,6 +364,21 @@ def get_shared_crypto_bot_client() -> CryptoBotClient:
     return _client_instance
 
 
+def _shared_breaker_state() -> int:
+    client = _client_instance
+    return CircuitBreaker.STATES.index(client.breaker.state) if client is not None else 0
+
+
+CRYPTOBOT_BREAKER_STATE.set_function(_shared_breaker_state)
+
+
+async def warm_up_crypto_bot_client() -> None:
+    try:
+        await get_shared_crypto_bot_client().warm_up(get_settings().cryptobot_warm_connections)
+    except (aiohttp.ClientError, asyncio.TimeoutError, RuntimeError) as exc:
+        logging.warning("CryptoBot warm-up failed: %s", exc)
+
+
 async def close_crypto_bot_client() -> None:
     global _client_instance
     if _client_instance is not None:
@@ -0,0 +1,184 @@
+from __future__ import annotations
+
+from collections import OrderedDict
+from dataclasses import dataclass
+import time
+from typing import Callable
+
+from prometheus_client.core import CounterMetricFamily, GaugeMetricFamily
+
+from app.config import get_settings
+from app.database.repository import UserSnapshot
+from app.metrics import export_stats
+
+# Called with (kind, user_id) when a change must reach other worker processes.
+CacheListener = Callable[[str, int], None]
+
+
+@dataclass(frozen=True, slots=True)
+class CacheStats:
+    size: int
+    max_size: int
+    hits: int
+    misses: int
+    evictions: int
+
+
+class UserCache:
+    """Bounded LRU cache of user snapshots with a per-entry TTL.
+
+    A read-through populate can race a write: the DB read starts, the row is
+    changed (here or in another worker) and invalidated, then the stale read
+    is put back. Every write and invalidation therefore stamps the key from a
+    counter, and a populate that passes the `read_token()` taken before its
+    read is dropped if the key was stamped after it. Stamps are kept for the
+    last `max_size` keys; older ones are folded into one conservative floor.
+    """
+
+    def __init__(self, max_size: int, ttl: float):
+        self.max_size = max_size
+        self.ttl = ttl
+        self._items: OrderedDict[int, tuple[float, UserSnapshot]] = OrderedDict()
+        self._clock = 0
+        self._stamps: OrderedDict[int, int] = OrderedDict()
+        self._forgotten_stamp = 0
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.on_change: CacheListener | None = None
+
+    @property
+    def enabled(self) -> bool:
+        return self.max_size > 0 and self.ttl > 0
+
+    def get(self, user_id: int) -> UserSnapshot | None:
+        item = self._items.get(user_id)
+        if item is None:
+            self.misses += 1
+            return None
+        expires_at, snapshot = item
+        if expires_at <= time.monotonic():
+            del self._items[user_id]
+            self.misses += 1
+            return None
+        self._items.move_to_end(user_id)
+        self.hits += 1
+        return snapshot
+
+    def read_token(self) -> int:
+        """Taken before a DB read whose result will be put()."""
+        return self._clock
+
+    def _stamp(self, user_id: int) -> None:
+        self._clock += 1
+        self._stamps[user_id] = self._clock
+        self._stamps.move_to_end(user_id)
+        while len(self._stamps) > max(self.max_size, 1):
+            _, stamp = self._stamps.popitem(last=False)
+            self._forgotten_stamp = max(self._forgotten_stamp, stamp)
+
+    def _stale(self, user_id: int, token: int) -> bool:
+        return self._stamps.get(user_id, self._forgotten_stamp) > token
+
+    def put(self, snapshot: UserSnapshot, publish: bool = False, token: int | None = None) -> None:
+        """`publish` marks a write, so other workers drop their copy.
+
+        `token` marks a read-through populate, skipped if the user changed since.
+        """
+        if publish and self.on_change:
+            self.on_change("user", snapshot.user_id)
+        if not self.enabled:
+            return
+        if token is not None:
+            if self._stale(snapshot.user_id, token):
+                return
+        elif publish:
+            self._stamp(snapshot.user_id)
+        self._items[snapshot.user_id] = (time.monotonic() + self.ttl, snapshot)
+        self._items.move_to_end(snapshot.user_id)
+        while len(self._items) > self.max_size:
+            self._items.popitem(last=False)
+            self.evictions += 1
+
+    def invalidate(self, user_id: int, publish: bool = False) -> None:
+        if publish and self.on_change:
+            self.on_change("user", user_id)
+        if self.enabled:
+            self._stamp(user_id)
+        self._items.pop(user_id, None)
+
+    def clear(self) -> None:
+        self._items.clear()
+
+    def stats(self) -> CacheStats:
+        return CacheStats(
+            size=len(self._items),
+            max_size=self.max_size,
+            hits=self.hits,
+            misses=self.misses,
+            evictions=self.evictions,
+        )
+
+
+class StaffCache:
+    """In-memory set of DB admins; the version bumps on every change."""
+
+    def __init__(self) -> None:
+        self._ids: frozenset[int] = frozenset()
+        self.version = 0
+        self.on_change: CacheListener | None = None
+
+    @property
+    def ids(self) -> frozenset[int]:
+        return self._ids
+
+    def load(self, user_ids: list[int]) -> None:
+        self._ids = frozenset(user_ids)
+        self.version += 1
+
+    def add(self, user_id: int, publish: bool = False) -> None:
+        if publish and self.on_change:
+            self.on_change("staff_add", user_id)
+        if user_id not in self._ids:
+            self._ids = self._ids | {user_id}
+            self.version += 1
+
+    def discard(self, user_id: int, publish: bool = False) -> None:
+        if publish and self.on_change:
+            self.on_change("staff_discard", user_id)
+        if user_id in self._ids:
+            self._ids = self._ids - {user_id}
+            self.version += 1
+
+    def __contains__(self, user_id: object) -> bool:
+        return user_id in self._ids
+
+
+_settings = get_settings()
+user_cache = UserCache(_settings.user_cache_size, _settings.user_cache_ttl)
+staff_cache = StaffCache()
+export_stats(
+    user_cache.stats,
+    [
+        (GaugeMetricFamily, "user_cache_entries", "User snapshots cached.", "size"),
+        (GaugeMetricFamily, "user_cache_max_entries", "USER_CACHE_SIZE.", "max_size"),
+        (CounterMetricFamily, "user_cache_hits", "User lookups served from the cache.", "hits"),
+        (CounterMetricFamily, "user_cache_misses", "User lookups that went to the DB.", "misses"),
+        (
+            CounterMetricFamily,
+            "user_cache_evictions",
+            "Snapshots evicted to stay under USER_CACHE_SIZE.",
+            "evictions",
+        ),
+    ],
+)
+
+
+def apply_change(kind: str, user_id: int) -> None:
+    """Applies a change published by another worker without publishing it again."""
+    if kind == "user":
+        user_cache.invalidate(user_id)
+    elif kind == "staff_add":
+        staff_cache.add(user_id)
+    elif kind == "staff_discard":
+        staff_cache.discard(user_id)
@@ -0,0 +1,168 @@
+"""Versioned schema migrations, applied at startup by ``async_main``.
+
+``create_all`` only creates missing tables, so anything added to an existing
+table (columns, indexes) goes here as a new numbered step. Every step must be
+safe to run on a database that ``create_all`` has just built from the current
+models. Steps that touch columns the models no longer map describe them with
+the ``legacy_users`` table below instead of the ORM classes.
+"""
+from __future__ import annotations
+
+from dataclasses import dataclass
+from datetime import datetime
+import logging
+from typing import Callable
+
+from sqlalchemy import (
+    BigInteger,
+    Column,
+    DateTime,
+    Index,
+    Integer,
+    MetaData,
+    String,
+    Table,
+    func,
+    insert,
+    inspect,
+    or_,
+    select,
+    text,
+)
+from sqlalchemy.engine import Connection
+
+from app.database.models import (
+    Payment,
+    PaymentEvent,
+    admin_index,
+    banned_index,
+    payment_queue_index,
+    payment_user_index,
+)
+
+_metadata = MetaData()
+schema_version = Table(
+    "schema_version",
+    _metadata,
+    Column("version", Integer, primary_key=True),
+    Column("description", String(200), nullable=False),
+    Column("applied_at", DateTime, nullable=False),
+)
+
+# Payment columns that lived on users before the payments table (version 3).
+_legacy_metadata = MetaData()
+legacy_users = Table(
+    "users",
+    _legacy_metadata,
+    Column("id", Integer, primary_key=True),
+    Column("user_id", BigInteger),
+    Column("payment_status", String(20)),
+    Column("paid_method", String(20)),
+    Column("paid_at", DateTime),
+    Column("invoice_id", String(50)),
+    Column("decision_by", BigInteger),
+    Column("decision_at", DateTime),
+)
+legacy_payment_queue_index = Index(
+    "ix_users_payment_queue",
+    legacy_users.c.payment_status,
+    legacy_users.c.paid_method,
+    legacy_users.c.id,
+    sqlite_where=legacy_users.c.decision_at.is_(None),
+    postgresql_where=legacy_users.c.decision_at.is_(None),
+)
+
+
+@dataclass(frozen=True, slots=True)
+class Migration:
+    version: int
+    description: str
+    apply: Callable[[Connection], None]
+
+
+def _has_legacy_payment_columns(conn: Connection) -> bool:
+    columns = {column["name"] for column in inspect(conn).get_columns("users")}
+    return "payment_status" in columns
+
+
+def _create_admin_index(conn: Connection) -> None:
+    admin_index.create(conn, checkfirst=True)
+
+
+def _create_payment_indexes(conn: Connection) -> None:
+    banned_index.create(conn, checkfirst=True)
+    if _has_legacy_payment_columns(conn):
+        legacy_payment_queue_index.create(conn, checkfirst=True)
+
+
+def _move_payments_to_table(conn: Connection) -> None:
+    payment_user_index.create(conn, checkfirst=True)
+    payment_queue_index.create(conn, checkfirst=True)
+    if not _has_legacy_payment_columns(conn):
+        return
+    legacy_payment_queue_index.drop(conn, checkfirst=True)
+
+    users = legacy_users.c
+    conn.execute(
+        insert(Payment).from_select(
+            ["user_id", "method", "status", "invoice_id", "created_at", "paid_at", "decision_by", "decision_at"],
+            select(
+                users.user_id,
+                func.coalesce(users.paid_method, "rub"),
+                func.coalesce(users.payment_status, "pending"),
+                users.invoice_id,
+                func.coalesce(users.decision_at, users.paid_at, func.current_timestamp()),
+                users.paid_at,
+                users.decision_by,
+                users.decision_at,
+            )
+            .where(or_(users.payment_status.is_not(None), users.invoice_id.is_not(None)))
+            .order_by(users.id),
+        )
+    )
+    payments = Payment.__table__.c
+    conn.execute(
+        insert(PaymentEvent).from_select(
+            ["payment_id", "status", "actor_id", "created_at"],
+            select(payments.id, payments.status, payments.decision_by, payments.created_at),
+        )
+    )
+
+
+def _add_user_blocked_flag(conn: Connection) -> None:
+    columns = {column["name"] for column in inspect(conn).get_columns("users")}
+    if "is_blocked" not in columns:
+        conn.execute(text("ALTER TABLE users ADD COLUMN is_blocked BOOLEAN NOT NULL DEFAULT FALSE"))
+
+
+MIGRATIONS: tuple[Migration, ...] = (
+    Migration(1, "partial index on admins", _create_admin_index),
+    Migration(2, "banned users and undecided payments indexes", _create_payment_indexes),
+    Migration(3, "payments table with status history", _move_payments_to_table),
+    Migration(4, "users.is_blocked for broadcasts", _add_user_blocked_flag),
+)
+
+
+def get_schema_version(conn: Connection) -> int:
+    schema_version.create(conn, checkfirst=True)
+    return conn.scalar(select(schema_version.c.version).order_by(schema_version.c.version.desc())) or 0
+
+
+def run_migrations(conn: Connection) -> list[int]:
+    """Applies pending migrations in order; returns the versions applied."""
+    current = get_schema_version(conn)
+    applied: list[int] = []
+    for migration in MIGRATIONS:
+        if migration.version <= current:
+            continue
+        migration.apply(conn)
+        conn.execute(
+            insert(schema_version).values(
+                version=migration.version,
+                description=migration.description,
+                applied_at=datetime.utcnow(),
+            )
+        )
+        logging.info("Applied migration %s: %s", migration.version, migration.description)
+        applied.append(migration.version)
+    return applied
@@ -1,14 +1,93 @@
 ﻿from datetime import datetime
 
-from sqlalchemy import BigInteger, String, Boolean
-from sqlalchemy.ext.asyncio import AsyncAttrs, async_sessionmaker, create_async_engine
+from sqlalchemy import BigInteger, Boolean, ForeignKey, Index, String, Text, event
+from sqlalchemy.engine import URL, make_url
+from sqlalchemy.ext.asyncio import AsyncAttrs, AsyncEngine, async_sessionmaker, create_async_engine
 from sqlalchemy.orm import DeclarativeBase, Mapped, mapped_column
 
-from app.config import get_settings
+from app.config import Settings, get_settings
+from app.metrics import instrument_engine
+
+
+def _is_tunable_sqlite(settings: Settings) -> bool:
+    url = make_url(settings.database_url)
+    return (
+        settings.sqlite_tuning
+        and url.get_backend_name() == "sqlite"
+        and url.database not in (None, "", ":memory:")
+    )
+
+
+def _set_sqlite_pragmas(engine: AsyncEngine, settings: Settings) -> None:
+    pragmas = (
+        "PRAGMA journal_mode=WAL",
+        "PRAGMA synchronous=NORMAL",
+        f"PRAGMA busy_timeout={int(settings.sqlite_busy_timeout_ms)}",
+        f"PRAGMA cache_size={-int(settings.sqlite_cache_size_kb)}",
+        f"PRAGMA mmap_size={int(settings.sqlite_mmap_size)}",
+    )
+
+    @event.listens_for(engine.sync_engine, "connect")
+    def on_connect(dbapi_connection, connection_record) -> None:
+        cursor = dbapi_connection.cursor()
+        for pragma in pragmas:
+            cursor.execute(pragma)
+        cursor.close()
+
+
+def _server_engine_options(settings: Settings, url: URL) -> tuple[URL, dict]:
+    """Pool limits for client/server databases, plus the asyncpg statement cache and timeout."""
+    options: dict = {
+        "pool_size": settings.db_pool_size,
+        "max_overflow": settings.db_max_overflow,
+        "pool_timeout": settings.db_pool_timeout,
+        "pool_recycle": settings.db_pool_recycle,
+        "pool_pre_ping": settings.db_pool_pre_ping,
+    }
+    if url.get_driver_name() == "asyncpg":
+        # SQLAlchemy keeps its own prepared statement cache on top of asyncpg's;
+        # both are sized together (0 disables them, e.g. behind pgbouncer).
+        if "prepared_statement_cache_size" not in url.query:
+            url = url.update_query_dict(
+                {"prepared_statement_cache_size": str(settings.db_statement_cache_size)}
+            )
+        connect_args: dict = {"statement_cache_size": settings.db_statement_cache_size}
+        if settings.db_statement_timeout_ms > 0:
+            connect_args["server_settings"] = {
+                "statement_timeout": str(settings.db_statement_timeout_ms),
+            }
+        options["connect_args"] = connect_args
+    return url, options
+
+
+def _build_engine(settings: Settings) -> AsyncEngine:
+    url = make_url(settings.database_url)
+    if url.get_backend_name() == "sqlite":
+        return create_async_engine(url)
+    url, options = _server_engine_options(settings, url)
+    return create_async_engine(url, **options)
+
 
 settings = get_settings()
-engine = create_async_engine(settings.database_url)
+if _is_tunable_sqlite(settings):
+    # WAL lets readers run alongside the single writer; writes queue on the
+    # one-connection pool instead of failing with "database is locked".
+    engine = create_async_engine(
+        settings.database_url,
+        pool_size=settings.sqlite_read_pool_size,
+        max_overflow=0,
+    )
+    write_engine = create_async_engine(settings.database_url, pool_size=1, max_overflow=0)
+    _set_sqlite_pragmas(engine, settings)
+    _set_sqlite_pragmas(write_engine, settings)
+    instrument_engine(engine, "read")
+    instrument_engine(write_engine, "write")
+else:
+    engine = _build_engine(settings)
+    write_engine = engine
+    instrument_engine(engine, "main")
 async_session = async_sessionmaker(engine)
+async_write_session = async_sessionmaker(write_engine)
 
 
 class Base(AsyncAttrs, DeclarativeBase):
@@ -21,17 +100,90 @@ class User(Base):
     id: Mapped[int] = mapped_column(primary_key=True)
     user_id: Mapped[int] = mapped_column(BigInteger, unique=True, index=True)
 
+    # Denormalized from payments: set once any payment reaches "paid".
     is_paid: Mapped[bool] = mapped_column(Boolean, default=False, server_default="0")
     is_admin: Mapped[bool] = mapped_column(Boolean, default=False, server_default="0")
     is_banned: Mapped[bool] = mapped_column(Boolean, default=False, server_default="0")
-    payment_status: Mapped[str | None] = mapped_column(String(20), nullable=True)
-    paid_method: Mapped[str | None] = mapped_column(String(20), nullable=True)
-    paid_at: Mapped[datetime | None] = mapped_column(nullable=True)
+    # Set when a message bounces with "bot was blocked"; cleared on the user's next update.
+    is_blocked: Mapped[bool] = mapped_column(Boolean, default=False, server_default="0")
+
+
+class Payment(Base):
+    """One payment attempt; the user's current payment is the one with the highest id."""
+
+    __tablename__ = "payments"
+
+    id: Mapped[int] = mapped_column(primary_key=True)
+    user_id: Mapped[int] = mapped_column(BigInteger)
+    method: Mapped[str] = mapped_column(String(20))
+    status: Mapped[str] = mapped_column(String(20))
     invoice_id: Mapped[str | None] = mapped_column(String(50), unique=True, nullable=True)
+    created_at: Mapped[datetime] = mapped_column(default=datetime.utcnow)
+    paid_at: Mapped[datetime | None] = mapped_column(nullable=True)
     decision_by: Mapped[int | None] = mapped_column(BigInteger, nullable=True)
     decision_at: Mapped[datetime | None] = mapped_column(nullable=True)
 
 
+class PaymentEvent(Base):
+    """Append-only log of payment status changes."""
+
+    __tablename__ = "payment_events"
+
+    id: Mapped[int] = mapped_column(primary_key=True)
+    payment_id: Mapped[int] = mapped_column(ForeignKey("payments.id"), index=True)
+    status: Mapped[str] = mapped_column(String(20))
+    actor_id: Mapped[int | None] = mapped_column(BigInteger, nullable=True)
+    created_at: Mapped[datetime] = mapped_column(default=datetime.utcnow)
+
+
+class Broadcast(Base):
+    """Owner broadcast; `last_user_pk` is the users.id it has been delivered up to."""
+
+    __tablename__ = "broadcasts"
+
+    id: Mapped[int] = mapped_column(primary_key=True)
+    text: Mapped[str] = mapped_column(Text)
+    segment: Mapped[str] = mapped_column(String(20))
+    status: Mapped[str] = mapped_column(String(20), default="running")
+    last_user_pk: Mapped[int] = mapped_column(default=0)
+    sent: Mapped[int] = mapped_column(default=0)
+    failed: Mapped[int] = mapped_column(default=0)
+    blocked: Mapped[int] = mapped_column(default=0)
+    created_by: Mapped[int] = mapped_column(BigInteger)
+    created_at: Mapped[datetime] = mapped_column(default=datetime.utcnow)
+    finished_at: Mapped[datetime | None] = mapped_column(nullable=True)
+
+
+# Partial indexes cover the flagged minority of rows only. New databases get them
+# from create_all; existing ones from the migrations in app/database/migrations.py.
+admin_index = Index(
+    "ix_users_admin_user_id",
+    User.user_id,
+    sqlite_where=User.is_admin.is_(True),
+    postgresql_where=User.is_admin.is_(True),
+)
+banned_index = Index(
+    "ix_users_banned_user_id",
+    User.user_id,
+    sqlite_where=User.is_banned.is_(True),
+    postgresql_where=User.is_banned.is_(True),
+)
+# Latest payment per user: MAX(id) WHERE user_id = ? is a single index probe.
+payment_user_index = Index("ix_payments_user_id_id", Payment.user_id, Payment.id)
+# Undecided payments by status and method, in id order for keyset paging.
+payment_queue_index = Index(
+    "ix_payments_queue",
+    Payment.status,
+    Payment.method,
+    Payment.id,
+    sqlite_where=Payment.decision_at.is_(None),
+    postgresql_where=Payment.decision_at.is_(None),
+)
+
+
 async def async_main() -> None:
-    async with engine.begin() as conn:
+    from app.database.migrations import run_migrations
+
+    async with write_engine.begin() as conn:
         await conn.run_sync(Base.metadata.create_all)
+        await conn.run_sync(run_migrations)
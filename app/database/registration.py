@@ -0,0 +1,131 @@
+from __future__ import annotations
+
+import asyncio
+from dataclasses import dataclass
+import logging
+import time
+
+from prometheus_client.core import CounterMetricFamily, GaugeMetricFamily
+
+from app.config import get_settings
+import app.database.requests as rq
+from app.metrics import export_stats
+
+STOP_RETRY_DELAY = 1.0
+
+
+@dataclass(frozen=True, slots=True)
+class RegistrationStats:
+    depth: int
+    flushed: int
+    flushes: int
+    last_flush_seconds: float
+
+
+class RegistrationQueue:
+    """Write-behind buffer for new users: one multi-row INSERT per flush."""
+
+    def __init__(self, flush_interval: float, max_batch: int):
+        self.flush_interval = flush_interval
+        self.max_batch = max_batch
+        self._pending: dict[int, None] = {}
+        self._full = asyncio.Event()
+        self._task: asyncio.Task[None] | None = None
+        self._stopping = False
+        self._flushed = 0
+        self._flushes = 0
+        self._last_flush_seconds = 0.0
+
+    async def register(self, user_id: int) -> None:
+        if self._task is None:
+            await rq.set_user(user_id)
+            return
+        self._pending[user_id] = None
+        if len(self._pending) >= self.max_batch:
+            self._full.set()
+
+    async def start(self) -> None:
+        if self.flush_interval > 0 and self._task is None:
+            self._stopping = False
+            self._task = asyncio.create_task(self._run())
+
+    async def stop(self) -> None:
+        """Lets a flush in progress finish: a cancelled INSERT can leave SQLite locked."""
+        if self._task is None:
+            return
+        self._stopping = True
+        self._full.set()
+        await self._task
+        self._task = None
+        await self.flush()
+        if self._pending:
+            await asyncio.sleep(STOP_RETRY_DELAY)
+            await self.flush()
+        if self._pending:
+            logging.error(
+                "Registration queue stopped with %s unsaved users: %s",
+                len(self._pending),
+                ",".join(map(str, self._pending)),
+            )
+
+    async def flush(self) -> int:
+        inserted = 0
+        while self._pending:
+            batch = list(self._pending)[: self.max_batch]
+            for user_id in batch:
+                del self._pending[user_id]
+            started = time.perf_counter()
+            saved = False
+            try:
+                inserted += await rq.set_users(batch)
+                saved = True
+            except Exception as exc:
+                logging.exception("Failed to register %s users: %s", len(batch), exc)
+                break
+            finally:
+                # Also on cancellation, so the batch is not lost with the task.
+                if not saved:
+                    for user_id in batch:
+                        self._pending.setdefault(user_id, None)
+            self._last_flush_seconds = time.perf_counter() - started
+            self._flushed += len(batch)
+            self._flushes += 1
+        return inserted
+
+    def stats(self) -> RegistrationStats:
+        return RegistrationStats(
+            depth=len(self._pending),
+            flushed=self._flushed,
+            flushes=self._flushes,
+            last_flush_seconds=self._last_flush_seconds,
+        )
+
+    async def _run(self) -> None:
+        while not self._stopping:
+            try:
+                await asyncio.wait_for(self._full.wait(), self.flush_interval)
+            except asyncio.TimeoutError:
+                pass
+            self._full.clear()
+            await self.flush()
+
+
+_settings = get_settings()
+registration_queue = RegistrationQueue(
+    flush_interval=_settings.registration_flush_ms / 1000,
+    max_batch=_settings.registration_batch_size,
+)
+export_stats(
+    registration_queue.stats,
+    [
+        (GaugeMetricFamily, "registration_queue_depth", "New users waiting for the next flush.", "depth"),
+        (CounterMetricFamily, "registration_flushed_users", "New users written by flushes.", "flushed"),
+        (CounterMetricFamily, "registration_flushes", "Multi-row registration INSERTs.", "flushes"),
+        (
+            GaugeMetricFamily,
+            "registration_last_flush_seconds",
+            "Run time of the latest registration flush.",
+            "last_flush_seconds",
+        ),
+    ],
+)
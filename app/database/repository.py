@@ -1,26 +1,334 @@
-from sqlalchemy import select
+from dataclasses import dataclass
+from datetime import datetime
+
+from typing import Any
+
+from sqlalchemy import func, insert, select, update
+from sqlalchemy.dialects import postgresql, sqlite
+from sqlalchemy.exc import IntegrityError
 from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy.orm import aliased
+from sqlalchemy.sql import ColumnElement
+
+from app.database.models import Broadcast, Payment, PaymentEvent, User
+
+
+@dataclass(frozen=True, slots=True)
+class UserSnapshot:
+    user_id: int
+    is_paid: bool = False
+    is_admin: bool = False
+    is_banned: bool = False
+    is_blocked: bool = False
+    payment_status: str | None = None
+    paid_method: str | None = None
+    invoice_id: str | None = None
+    decision_at: datetime | None = None
+    registered: bool = False
+
+    @property
+    def has_access(self) -> bool:
+        return self.payment_status == "paid" or self.is_paid
+
 
-from app.database.models import User
+def snapshot_user(user: User, payment: Payment | None = None) -> UserSnapshot:
+    """`payment` must be the user's current (latest) payment."""
+    return UserSnapshot(
+        user_id=user.user_id,
+        is_paid=bool(user.is_paid),
+        is_admin=bool(user.is_admin),
+        is_banned=bool(user.is_banned),
+        is_blocked=bool(user.is_blocked),
+        payment_status=payment.status if payment else None,
+        paid_method=payment.method if payment else None,
+        invoice_id=payment.invoice_id if payment else None,
+        decision_at=payment.decision_at if payment else None,
+        registered=True,
+    )
+
+
+def latest_payment_id(user_id: int | ColumnElement) -> ColumnElement:
+    # Aliased so the subquery never correlates with an outer `payments`.
+    latest = aliased(Payment)
+    return (
+        select(func.max(latest.id))
+        .where(latest.user_id == user_id)
+        .scalar_subquery()
+    )
 
 
 async def get_user(session: AsyncSession, user_id: int) -> User | None:
     return await session.scalar(select(User).where(User.user_id == user_id))
 
 
-async def get_or_create_user(session: AsyncSession, user_id: int) -> tuple[User, bool]:
-    user = await get_user(session, user_id)
-    if user:
-        return user, False
-    user = User(user_id=user_id)
-    session.add(user)
-    return user, True
+async def get_user_snapshots(session: AsyncSession, user_ids: set[int] | list[int]) -> list[UserSnapshot]:
+    """Users joined with their current payment, in one statement."""
+    result = await session.execute(
+        select(User, Payment)
+        .outerjoin(Payment, Payment.id == latest_payment_id(User.user_id))
+        .where(User.user_id.in_(user_ids))
+        .execution_options(populate_existing=True)
+    )
+    return [snapshot_user(user, payment) for user, payment in result]
+
+
+async def get_user_snapshot(session: AsyncSession, user_id: int) -> UserSnapshot | None:
+    snapshots = await get_user_snapshots(session, [user_id])
+    return snapshots[0] if snapshots else None
+
+
+def _insert_users(session: AsyncSession):
+    """Dialect insert with ON CONFLICT support, or None where it has to be emulated."""
+    dialect = session.bind.dialect.name
+    if dialect == "postgresql":
+        return postgresql.insert(User)
+    if dialect == "sqlite":
+        return sqlite.insert(User)
+    return None
+
 
+async def _find_user(session: AsyncSession, user_id: int) -> User | None:
+    return await session.scalar(
+        select(User).where(User.user_id == user_id).execution_options(populate_existing=True)
+    )
 
-async def get_user_by_invoice(session: AsyncSession, invoice_id: str) -> User | None:
-    return await session.scalar(select(User).where(User.invoice_id == str(invoice_id)))
+
+async def _add_user(session: AsyncSession, user_id: int, values: dict[str, Any]) -> User | None:
+    """Inserts in a savepoint; None if a concurrent writer got there first."""
+    user = User(user_id=user_id, **values)
+    try:
+        async with session.begin_nested():
+            session.add(user)
+    except IntegrityError:
+        return None
+    return user
+
+
+async def insert_user_if_missing(session: AsyncSession, user_id: int) -> User | None:
+    """Returns the new row, or None if the user already existed."""
+    users = await insert_users_if_missing(session, [user_id])
+    return users[0] if users else None
+
+
+async def insert_users_if_missing(session: AsyncSession, user_ids: list[int]) -> list[User]:
+    """Multi-row INSERT ... ON CONFLICT DO NOTHING; returns only the inserted rows.
+
+    Dialects without ON CONFLICT select the existing ids first and insert the rest.
+    """
+    stmt = _insert_users(session)
+    if stmt is None:
+        existing = set(await session.scalars(select(User.user_id).where(User.user_id.in_(user_ids))))
+        added = [
+            await _add_user(session, user_id, {})
+            for user_id in dict.fromkeys(user_ids)
+            if user_id not in existing
+        ]
+        return [user for user in added if user is not None]
+    stmt = (
+        stmt.values([{"user_id": user_id} for user_id in user_ids])
+        .on_conflict_do_nothing(index_elements=[User.user_id])
+        .returning(User)
+    )
+    return list(await session.scalars(stmt))
+
+
+async def upsert_user(session: AsyncSession, user_id: int, values: dict[str, Any]) -> User:
+    """INSERT ... ON CONFLICT (user_id) DO UPDATE ... RETURNING in one statement where supported."""
+    stmt = _insert_users(session)
+    if stmt is None:
+        user = await _find_user(session, user_id)
+        if user is None:
+            user = await _add_user(session, user_id, values) or await _find_user(session, user_id)
+        for key, value in values.items():
+            setattr(user, key, value)
+        await session.flush()
+        return user
+    stmt = (
+        stmt.values(user_id=user_id, **values)
+        .on_conflict_do_update(index_elements=[User.user_id], set_=values)
+        .returning(User)
+        .execution_options(populate_existing=True)
+    )
+    return await session.scalar(stmt)
+
+
+async def get_current_payment(session: AsyncSession, user_id: int) -> Payment | None:
+    return await session.scalar(select(Payment).where(Payment.id == latest_payment_id(user_id)))
+
+
+async def add_payment(
+    session: AsyncSession,
+    user_id: int,
+    method: str,
+    status: str,
+    invoice_id: str | None = None,
+) -> Payment:
+    payment = Payment(user_id=user_id, method=method, status=status, invoice_id=invoice_id)
+    session.add(payment)
+    await session.flush()
+    return payment
+
+
+async def update_payments(
+    session: AsyncSession,
+    where: list[ColumnElement],
+    values: dict[str, Any],
+) -> list[Payment]:
+    """Conditional UPDATE ... RETURNING; rows that fail the condition are left alone."""
+    result = await session.scalars(
+        update(Payment)
+        .where(*where)
+        .values(**values)
+        .returning(Payment)
+        .execution_options(populate_existing=True)
+    )
+    return list(result)
+
+
+async def add_payment_events(
+    session: AsyncSession,
+    payments: list[Payment],
+    actor_id: int | None = None,
+) -> None:
+    await session.execute(
+        insert(PaymentEvent),
+        [
+            {"payment_id": payment.id, "status": payment.status, "actor_id": actor_id}
+            for payment in payments
+        ],
+    )
+
+
+async def set_users_paid(session: AsyncSession, user_ids: set[int] | list[int]) -> None:
+    await session.execute(
+        update(User)
+        .where(User.user_id.in_(user_ids), User.is_paid.is_(False))
+        .values(is_paid=True)
+    )
 
 
 async def get_admin_ids(session: AsyncSession) -> list[int]:
     result = await session.scalars(select(User.user_id).where(User.is_admin.is_(True)))
     return list(result)
+
+
+async def get_open_payments(
+    session: AsyncSession,
+    statuses: tuple[str, ...],
+    method: str,
+    limit: int,
+    after_id: int = 0,
+    before_id: int | None = None,
+) -> list[Payment]:
+    """Undecided current payments in id order, keyset-paged by payment id.
+
+    With `before_id` the page is the one ending right before that id.
+    """
+    query = select(Payment).where(
+        Payment.status.in_(statuses),
+        Payment.method == method,
+        Payment.decision_at.is_(None),
+        Payment.id == latest_payment_id(Payment.user_id),
+    )
+    if before_id is not None:
+        query = query.where(Payment.id < before_id).order_by(Payment.id.desc())
+    else:
+        query = query.where(Payment.id > after_id).order_by(Payment.id)
+    payments = list(await session.scalars(query.limit(limit)))
+    return payments[::-1] if before_id is not None else payments
+
+
+async def get_pending_crypto_invoices(
+    session: AsyncSession,
+    after_id: int,
+    limit: int,
+) -> list[tuple[int, int, str]]:
+    result = await session.execute(
+        select(Payment.id, Payment.user_id, Payment.invoice_id)
+        .where(
+            Payment.id > after_id,
+            Payment.status == "pending",
+            Payment.method == "crypto",
+            Payment.decision_at.is_(None),
+            Payment.invoice_id.is_not(None),
+        )
+        .order_by(Payment.id)
+        .limit(limit)
+    )
+    return [tuple(row) for row in result]
+
+
+def _segment_where(segment: str) -> list[ColumnElement]:
+    where = [User.is_banned.is_(False), User.is_blocked.is_(False)]
+    if segment == "paid":
+        where.append(User.is_paid.is_(True))
+    elif segment == "unpaid":
+        where.append(User.is_paid.is_(False))
+    return where
+
+
+async def get_broadcast_targets(
+    session: AsyncSession,
+    segment: str,
+    after_pk: int,
+    limit: int,
+) -> list[tuple[int, int]]:
+    """(users.id, user_id) pairs of the segment, keyset-paged by users.id."""
+    result = await session.execute(
+        select(User.id, User.user_id)
+        .where(User.id > after_pk, *_segment_where(segment))
+        .order_by(User.id)
+        .limit(limit)
+    )
+    return [tuple(row) for row in result]
+
+
+async def set_users_blocked(
+    session: AsyncSession,
+    user_ids: list[int],
+    blocked: bool,
+) -> list[int]:
+    """Returns the user_ids whose flag actually changed."""
+    result = await session.scalars(
+        update(User)
+        .where(User.user_id.in_(user_ids), User.is_blocked.is_not(blocked))
+        .values(is_blocked=blocked)
+        .returning(User.user_id)
+    )
+    return list(result)
+
+
+async def add_broadcast(session: AsyncSession, text: str, segment: str, created_by: int) -> Broadcast:
+    broadcast = Broadcast(text=text, segment=segment, created_by=created_by)
+    session.add(broadcast)
+    await session.flush()
+    return broadcast
+
+
+async def get_broadcast(session: AsyncSession, broadcast_id: int | None = None) -> Broadcast | None:
+    """The given broadcast, or the latest one."""
+    query = select(Broadcast)
+    if broadcast_id is not None:
+        query = query.where(Broadcast.id == broadcast_id)
+    return await session.scalar(query.order_by(Broadcast.id.desc()).limit(1))
+
+
+async def get_running_broadcast(session: AsyncSession) -> Broadcast | None:
+    return await session.scalar(
+        select(Broadcast).where(Broadcast.status == "running").order_by(Broadcast.id).limit(1)
+    )
+
+
+async def update_broadcast(
+    session: AsyncSession,
+    broadcast_id: int,
+    where: list[ColumnElement],
+    values: dict[str, Any],
+) -> Broadcast | None:
+    return await session.scalar(
+        update(Broadcast)
+        .where(Broadcast.id == broadcast_id, *where)
+        .values(**values)
+        .returning(Broadcast)
+        .execution_options(populate_existing=True)
+    )
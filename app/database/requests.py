@@ -1,90 +1,210 @@
 from datetime import datetime
+from enum import Enum
 from typing import Literal
 
-from sqlalchemy import update
+from sqlalchemy import exists
+from sqlalchemy.ext.asyncio import AsyncSession
 
-from app.database.models import User, async_session
+from app.config import get_settings
+from app.database.cache import staff_cache, user_cache
+from app.database.models import Broadcast, Payment, User, async_session, async_write_session
 from app.database.repository import (
+    UserSnapshot,
+    add_broadcast as repo_add_broadcast,
+    add_payment as repo_add_payment,
+    add_payment_events as repo_add_payment_events,
     get_admin_ids as repo_get_admin_ids,
-    get_or_create_user as repo_get_or_create_user,
+    get_broadcast as repo_get_broadcast,
+    get_broadcast_targets as repo_get_broadcast_targets,
+    get_running_broadcast as repo_get_running_broadcast,
+    get_current_payment as repo_get_current_payment,
+    get_open_payments as repo_get_open_payments,
+    get_pending_crypto_invoices as repo_get_pending_crypto_invoices,
     get_user as repo_get_user,
-    get_user_by_invoice as repo_get_user_by_invoice,
+    get_user_snapshot as repo_get_user_snapshot,
+    get_user_snapshots as repo_get_user_snapshots,
+    insert_user_if_missing as repo_insert_user_if_missing,
+    insert_users_if_missing as repo_insert_users_if_missing,
+    latest_payment_id,
+    set_users_blocked as repo_set_users_blocked,
+    set_users_paid as repo_set_users_paid,
+    snapshot_user,
+    update_broadcast as repo_update_broadcast,
+    update_payments as repo_update_payments,
+    upsert_user as repo_upsert_user,
 )
 
 
 PaymentStatus = Literal["pending", "receipt_sent", "paid", "expired", "failed"]
 PaidMethod = Literal["rub", "crypto"]
+BroadcastSegment = Literal["all", "paid", "unpaid"]
+BROADCAST_SEGMENTS = ("all", "paid", "unpaid")
+OPEN_STATUSES = ("pending", "receipt_sent")
+
+
+class DecisionOutcome(str, Enum):
+    APPROVED = "approved"
+    DENIED = "denied"
+    NOT_STAFF = "not_staff"
+    NOT_FOUND = "not_found"
+    ALREADY_HANDLED = "already_handled"
+    BANNED = "banned"
+
+
+async def _commit_user(session: AsyncSession, user: User) -> UserSnapshot:
+    snapshot = snapshot_user(user, await repo_get_current_payment(session, user.user_id))
+    await session.commit()
+    user_cache.put(snapshot, publish=True)
+    return snapshot
+
+
+async def _commit_payments(
+    session: AsyncSession,
+    payments: list[Payment],
+    actor_id: int | None = None,
+) -> list[UserSnapshot]:
+    """Logs the new statuses, denormalizes `is_paid` and refreshes the users' snapshots."""
+    if not payments:
+        return []
+    await repo_add_payment_events(session, payments, actor_id)
+    paid_user_ids = {payment.user_id for payment in payments if payment.status == "paid"}
+    if paid_user_ids:
+        await repo_set_users_paid(session, paid_user_ids)
+    snapshots = await repo_get_user_snapshots(session, {payment.user_id for payment in payments})
+    await session.commit()
+    for snapshot in snapshots:
+        user_cache.put(snapshot, publish=True)
+    return snapshots
+
+
+async def _commit_payment(
+    session: AsyncSession,
+    payments: list[Payment],
+    actor_id: int | None = None,
+) -> UserSnapshot | None:
+    snapshots = await _commit_payments(session, payments, actor_id)
+    return snapshots[0] if snapshots else None
+
+
+def _decision_values(staff_id: int, approve: bool, paid_method: PaidMethod) -> dict:
+    decided_at = datetime.utcnow()
+    return {
+        "status": "paid" if approve else "failed",
+        "method": paid_method,
+        "paid_at": decided_at if approve else None,
+        "decision_by": staff_id,
+        "decision_at": decided_at,
+    }
+
+
+def _decidable_where(staff_id: int, is_owner: bool) -> list:
+    """Open current payment of a non-banned user, decided by an owner or a DB admin."""
+    where = [
+        Payment.id == latest_payment_id(Payment.user_id),
+        Payment.status.in_(OPEN_STATUSES),
+        Payment.decision_at.is_(None),
+        ~exists().where(User.user_id == Payment.user_id, User.is_banned.is_(True)),
+    ]
+    if not is_owner:
+        where.append(exists().where(User.user_id == staff_id, User.is_admin.is_(True)))
+    return where
+
+
+def _open_payment_where(user_id: int) -> list:
+    return [
+        Payment.id == latest_payment_id(user_id),
+        Payment.status.in_(OPEN_STATUSES),
+        Payment.decision_at.is_(None),
+    ]
 
 
-def _set_payment_pending(user: User, paid_method: PaidMethod, invoice_id: str | None) -> None:
-    user.invoice_id = invoice_id
-    user.paid_method = paid_method
-    user.is_paid = False
-    user.payment_status = "pending"
-    user.paid_at = None
-    user.decision_by = None
-    user.decision_at = None
-
-
-def _set_payment_status(user: User, status: PaymentStatus) -> None:
-    user.is_paid = status == "paid"
-    user.payment_status = status
+async def set_user(user_id: int) -> None:
+    async with async_write_session() as session:
+        user = await repo_insert_user_if_missing(session, user_id)
+        if user:
+            await _commit_user(session, user)
 
 
-async def set_user(user_id: int) -> None:
-    async with async_session() as session:
-        _, created = await repo_get_or_create_user(session, user_id)
-        if created:
-            await session.commit()
+async def set_users(user_ids: list[int]) -> int:
+    async with async_write_session() as session:
+        users = await repo_insert_users_if_missing(session, user_ids)
+        snapshots = [snapshot_user(user) for user in users]
+        await session.commit()
+    for snapshot in snapshots:
+        user_cache.put(snapshot)
+    return len(snapshots)
 
 
-async def get_user(user_id: int) -> User | None:
+async def get_user(user_id: int) -> UserSnapshot | None:
+    snapshot = user_cache.get(user_id)
+    if snapshot is not None:
+        return snapshot
+    token = user_cache.read_token()
     async with async_session() as session:
-        return await repo_get_user(session, user_id)
+        snapshot = await repo_get_user_snapshot(session, user_id)
+    if snapshot is not None:
+        user_cache.put(snapshot, token=token)
+    return snapshot
 
 
 async def is_user_banned(user_id: int) -> bool:
-    async with async_session() as session:
-        user = await repo_get_user(session, user_id)
-        return bool(user and user.is_banned)
+    user = await get_user(user_id)
+    return bool(user and user.is_banned)
 
 
 async def is_user_admin(user_id: int) -> bool:
-    async with async_session() as session:
-        user = await repo_get_user(session, user_id)
-        return bool(user and user.is_admin)
+    user = await get_user(user_id)
+    return bool(user and user.is_admin)
 
 
 async def set_invoice(user_id: int, invoice_id: str, paid_method: PaidMethod) -> None:
-    async with async_session() as session:
-        user, _ = await repo_get_or_create_user(session, user_id)
-        _set_payment_pending(user, paid_method, str(invoice_id))
-        await session.commit()
+    async with async_write_session() as session:
+        await repo_insert_user_if_missing(session, user_id)
+        payment = await repo_add_payment(session, user_id, paid_method, "pending", str(invoice_id))
+        await _commit_payments(session, [payment])
 
 
 async def set_rub_pending(user_id: int) -> None:
-    async with async_session() as session:
-        user, _ = await repo_get_or_create_user(session, user_id)
-        _set_payment_pending(user, "rub", None)
-        await session.commit()
+    """An open rub payment is reused, and a receipt already sent goes back to pending."""
+    async with async_write_session() as session:
+        await repo_insert_user_if_missing(session, user_id)
+        payment = await repo_get_current_payment(session, user_id)
+        if (
+            payment
+            and payment.method == "rub"
+            and payment.status in OPEN_STATUSES
+            and payment.decision_at is None
+        ):
+            if payment.status == "pending":
+                return
+            payments = await repo_update_payments(
+                session,
+                [Payment.id == payment.id, *_open_payment_where(user_id)],
+                {"status": "pending"},
+            )
+            await _commit_payments(session, payments)
+            return
+        payment = await repo_add_payment(session, user_id, "rub", "pending")
+        await _commit_payments(session, [payment])
 
 
-async def add_admin(user_id: int) -> User:
-    async with async_session() as session:
-        user, _ = await repo_get_or_create_user(session, user_id)
-        user.is_admin = True
-        await session.commit()
-        return user
+async def add_admin(user_id: int) -> UserSnapshot:
+    async with async_write_session() as session:
+        user = await repo_upsert_user(session, user_id, {"is_admin": True})
+        snapshot = await _commit_user(session, user)
+    staff_cache.add(user_id, publish=True)
+    return snapshot
 
 
-async def remove_admin(user_id: int) -> User | None:
-    async with async_session() as session:
+async def remove_admin(user_id: int) -> UserSnapshot | None:
+    async with async_write_session() as session:
         user = await repo_get_user(session, user_id)
         if not user:
             return None
         user.is_admin = False
-        await session.commit()
-        return user
+        snapshot = await _commit_user(session, user)
+    staff_cache.discard(user_id, publish=True)
+    return snapshot
 
 
 async def get_admin_ids() -> list[int]:
@@ -92,132 +212,276 @@ async def get_admin_ids() -> list[int]:
         return await repo_get_admin_ids(session)
 
 
-async def ban_user(user_id: int) -> User:
-    async with async_session() as session:
-        user, _ = await repo_get_or_create_user(session, user_id)
-        user.is_banned = True
-        await session.commit()
-        return user
+async def load_staff_cache() -> None:
+    staff_cache.load(await get_admin_ids())
 
 
-async def unban_user(user_id: int) -> User | None:
-    async with async_session() as session:
+async def ban_user(user_id: int) -> UserSnapshot:
+    async with async_write_session() as session:
+        user = await repo_upsert_user(session, user_id, {"is_banned": True})
+        return await _commit_user(session, user)
+
+
+async def unban_user(user_id: int) -> UserSnapshot | None:
+    async with async_write_session() as session:
         user = await repo_get_user(session, user_id)
         if not user:
             return None
         user.is_banned = False
-        await session.commit()
-        return user
+        return await _commit_user(session, user)
 
 
-async def mark_rub_receipt_sent(user_id: int) -> User | None:
-    async with async_session() as session:
+async def mark_rub_receipt_sent(user_id: int) -> UserSnapshot | None:
+    async with async_write_session() as session:
         user = await repo_get_user(session, user_id)
         if not user:
             return None
-        if user.paid_method is None:
-            user.paid_method = "rub"
-        _set_payment_status(user, "receipt_sent")
-        await session.commit()
-        return user
+        payments = await repo_update_payments(
+            session,
+            [*_open_payment_where(user_id), Payment.status != "receipt_sent"],
+            {"status": "receipt_sent"},
+        )
+        if not payments:
+            payment = await repo_get_current_payment(session, user_id)
+            if payment and payment.status == "receipt_sent" and payment.decision_at is None:
+                return snapshot_user(user, payment)
+            payments = [await repo_add_payment(session, user_id, "rub", "receipt_sent")]
+        return await _commit_payment(session, payments)
+
+
+async def mark_paid_by_invoice(invoice_id: str, paid_method: PaidMethod) -> UserSnapshot | None:
+    """Returns None if the invoice is unknown, already paid or denied by staff."""
+    async with async_write_session() as session:
+        payments = await repo_update_payments(
+            session,
+            [
+                Payment.invoice_id == str(invoice_id),
+                Payment.status != "paid",
+                Payment.decision_at.is_(None),
+            ],
+            {"status": "paid", "method": paid_method, "paid_at": datetime.utcnow()},
+        )
+        return await _commit_payment(session, payments)
+
+
+async def decide_payment(
+    user_id: int,
+    staff_id: int,
+    approve: bool,
+    paid_method: PaidMethod = "rub",
+) -> DecisionOutcome:
+    """Staff rights, ban and pending state are checked by the UPDATE itself.
+
+    The happy path is one conditional UPDATE plus the log insert; the extra
+    reads only run to explain why nothing was updated.
+    """
+    is_owner = staff_id in get_settings().admin_chat_ids
+    async with async_write_session() as session:
+        payments = await repo_update_payments(
+            session,
+            [Payment.user_id == user_id, *_decidable_where(staff_id, is_owner)],
+            _decision_values(staff_id, approve, paid_method),
+        )
+        if payments:
+            await _commit_payments(session, payments, actor_id=staff_id)
+            return DecisionOutcome.APPROVED if approve else DecisionOutcome.DENIED
+
+        if not is_owner:
+            staff = await repo_get_user(session, staff_id)
+            if not staff or not staff.is_admin:
+                return DecisionOutcome.NOT_STAFF
+        user = await repo_get_user_snapshot(session, user_id)
+    if user is None:
+        return DecisionOutcome.NOT_FOUND
+    if user.payment_status not in OPEN_STATUSES or user.decision_at is not None:
+        return DecisionOutcome.ALREADY_HANDLED
+    if user.is_banned:
+        return DecisionOutcome.BANNED
+    return DecisionOutcome.ALREADY_HANDLED
+
+
+async def _set_invoice_status(invoice_id: str, status: PaymentStatus) -> UserSnapshot | None:
+    """CryptoBot expiry/failure; a payment staff have already decided is left alone."""
+    async with async_write_session() as session:
+        payments = await repo_update_payments(
+            session,
+            [
+                Payment.invoice_id == str(invoice_id),
+                Payment.status.not_in(["paid", status]),
+                Payment.decision_at.is_(None),
+            ],
+            {"status": status},
+        )
+        return await _commit_payment(session, payments)
+
+
+async def mark_expired_by_invoice(invoice_id: str) -> UserSnapshot | None:
+    return await _set_invoice_status(invoice_id, "expired")
+
 
+async def mark_failed_by_invoice(invoice_id: str) -> UserSnapshot | None:
+    return await _set_invoice_status(invoice_id, "failed")
 
-async def mark_paid_by_invoice(invoice_id: str, paid_method: PaidMethod) -> User | None:
+
+async def mark_failed_by_user(user_id: int, paid_method: PaidMethod = "crypto") -> UserSnapshot | None:
+    async with async_write_session() as session:
+        await repo_insert_user_if_missing(session, user_id)
+        payment = await repo_add_payment(session, user_id, paid_method, "failed")
+        return await _commit_payment(session, [payment])
+
+
+async def decide_payments(
+    user_ids: list[int],
+    staff_id: int,
+    approve: bool,
+    paid_method: PaidMethod = "rub",
+) -> list[int]:
+    """Bulk decide_payment as one UPDATE; returns the user ids actually decided."""
+    if not user_ids:
+        return []
+    is_owner = staff_id in get_settings().admin_chat_ids
+    async with async_write_session() as session:
+        payments = await repo_update_payments(
+            session,
+            [Payment.user_id.in_(user_ids), *_decidable_where(staff_id, is_owner)],
+            _decision_values(staff_id, approve, paid_method),
+        )
+        decided = [payment.user_id for payment in payments]
+        await _commit_payments(session, payments, actor_id=staff_id)
+    return decided
+
+
+async def get_open_payments(
+    statuses: tuple[PaymentStatus, ...],
+    limit: int,
+    after_id: int = 0,
+    before_id: int | None = None,
+    paid_method: PaidMethod = "rub",
+) -> list[Payment]:
     async with async_session() as session:
-        user = await repo_get_user_by_invoice(session, invoice_id)
-        if not user:
-            return None
-        _set_payment_status(user, "paid")
-        user.paid_method = paid_method
-        user.paid_at = datetime.utcnow()
-        await session.commit()
-        return user
+        return await repo_get_open_payments(
+            session,
+            statuses,
+            paid_method,
+            limit,
+            after_id=after_id,
+            before_id=before_id,
+        )
 
 
-async def approve_by_staff(user_id: int, staff_id: int, paid_method: PaidMethod) -> User | None:
+async def get_pending_crypto_invoices(after_id: int, limit: int) -> list[tuple[int, int, str]]:
     async with async_session() as session:
-        paid_at = datetime.utcnow()
-        result = await session.execute(
-            update(User)
-            .where(
-                User.user_id == user_id,
-                User.decision_at.is_(None),
-                User.payment_status.in_(["pending", "receipt_sent"]),
-            )
-            .values(
-                is_paid=True,
-                payment_status="paid",
-                paid_method=paid_method,
-                paid_at=paid_at,
-                decision_by=staff_id,
-                decision_at=paid_at,
-            )
-            .returning(User)
+        return await repo_get_pending_crypto_invoices(session, after_id, limit)
+
+
+async def _update_pending_invoices(invoice_ids: list[str], values: dict) -> list[UserSnapshot]:
+    if not invoice_ids:
+        return []
+    async with async_write_session() as session:
+        payments = await repo_update_payments(
+            session,
+            [
+                Payment.invoice_id.in_(invoice_ids),
+                Payment.status == "pending",
+                Payment.decision_at.is_(None),
+            ],
+            values,
         )
-        user = result.scalar_one_or_none()
-        if not user:
-            return None
+        return await _commit_payments(session, payments)
+
+
+async def mark_paid_by_invoices(invoice_ids: list[str], paid_method: PaidMethod) -> list[UserSnapshot]:
+    return await _update_pending_invoices(
+        invoice_ids,
+        {"status": "paid", "method": paid_method, "paid_at": datetime.utcnow()},
+    )
+
+
+async def mark_expired_by_invoices(invoice_ids: list[str]) -> list[UserSnapshot]:
+    return await _update_pending_invoices(invoice_ids, {"status": "expired"})
+
+
+async def mark_failed_by_invoices(invoice_ids: list[str]) -> list[UserSnapshot]:
+    return await _update_pending_invoices(invoice_ids, {"status": "failed"})
+
+
+async def set_users_blocked(user_ids: list[int], blocked: bool = True) -> int:
+    async with async_write_session() as session:
+        changed = await repo_set_users_blocked(session, user_ids, blocked)
         await session.commit()
-        return user
+    for user_id in changed:
+        user_cache.invalidate(user_id, publish=True)
+    return len(changed)
 
 
-async def mark_expired_by_invoice(invoice_id: str) -> User | None:
-    async with async_session() as session:
-        user = await repo_get_user_by_invoice(session, invoice_id)
-        if not user:
+async def _commit_broadcast(session: AsyncSession, broadcast: Broadcast | None) -> Broadcast | None:
+    # Detached first so the commit does not expire what the caller reads next.
+    if broadcast is not None:
+        session.expunge(broadcast)
+    await session.commit()
+    return broadcast
+
+
+async def start_broadcast(text: str, segment: BroadcastSegment, created_by: int) -> Broadcast | None:
+    """Creates a running broadcast unless one is already running."""
+    async with async_write_session() as session:
+        if await repo_get_running_broadcast(session) is not None:
             return None
-        _set_payment_status(user, "expired")
-        user.paid_at = None
-        await session.commit()
-        return user
+        broadcast = await repo_add_broadcast(session, text, segment, created_by)
+        return await _commit_broadcast(session, broadcast)
 
 
-async def mark_failed_by_invoice(invoice_id: str) -> User | None:
+async def get_broadcast(broadcast_id: int | None = None) -> Broadcast | None:
     async with async_session() as session:
-        user = await repo_get_user_by_invoice(session, invoice_id)
-        if not user:
-            return None
-        _set_payment_status(user, "failed")
-        user.paid_at = None
-        await session.commit()
-        return user
+        return await repo_get_broadcast(session, broadcast_id)
 
 
-async def mark_failed_by_user(user_id: int, paid_method: PaidMethod | None = None) -> User | None:
+async def get_running_broadcast() -> Broadcast | None:
     async with async_session() as session:
-        user, _ = await repo_get_or_create_user(session, user_id)
-        _set_payment_status(user, "failed")
-        user.paid_at = None
-        if paid_method is not None:
-            user.paid_method = paid_method
-        await session.commit()
-        return user
+        return await repo_get_running_broadcast(session)
 
 
-async def deny_by_staff(user_id: int, staff_id: int, paid_method: PaidMethod | None = None) -> User | None:
+async def get_broadcast_targets(
+    segment: BroadcastSegment,
+    after_pk: int,
+    limit: int,
+) -> list[tuple[int, int]]:
     async with async_session() as session:
-        values = {
-            "is_paid": False,
-            "payment_status": "failed",
-            "paid_at": None,
-            "invoice_id": None,
-            "decision_by": staff_id,
-            "decision_at": datetime.utcnow(),
-        }
-        if paid_method is not None:
-            values["paid_method"] = paid_method
-        result = await session.execute(
-            update(User)
-            .where(
-                User.user_id == user_id,
-                User.decision_at.is_(None),
-                User.payment_status.in_(["pending", "receipt_sent"]),
-            )
-            .values(**values)
-            .returning(User)
+        return await repo_get_broadcast_targets(session, segment, after_pk, limit)
+
+
+async def checkpoint_broadcast(
+    broadcast_id: int,
+    last_user_pk: int,
+    sent: int,
+    failed: int,
+    blocked: int,
+) -> Broadcast | None:
+    """Records a delivered batch; returns None once the broadcast is no longer running."""
+    async with async_write_session() as session:
+        broadcast = await repo_update_broadcast(
+            session,
+            broadcast_id,
+            [Broadcast.status == "running"],
+            {
+                "last_user_pk": last_user_pk,
+                "sent": Broadcast.sent + sent,
+                "failed": Broadcast.failed + failed,
+                "blocked": Broadcast.blocked + blocked,
+            },
         )
-        user = result.scalar_one_or_none()
-        if not user:
-            return None
-        await session.commit()
-        return user
+        return await _commit_broadcast(session, broadcast)
+
+
+async def finish_broadcast(
+    broadcast_id: int,
+    status: Literal["done", "cancelled", "failed"],
+) -> Broadcast | None:
+    async with async_write_session() as session:
+        broadcast = await repo_update_broadcast(
+            session,
+            broadcast_id,
+            [Broadcast.status == "running"],
+            {"status": status, "finished_at": datetime.utcnow()},
+        )
+        return await _commit_broadcast(session, broadcast)
@@ -135,3 +135,37 @@ def admin_action_kb(user_id: int) -> InlineKeyboardMarkup:
     )
 
 
+def pending_page_kb(
+    rows: list[tuple[int, str]],
+    refresh_after_id: int,
+    prev_before_id: int | None,
+    next_after_id: int | None,
+) -> InlineKeyboardMarkup:
+    buttons = []
+    for user_id, label in rows:
+        buttons.append([InlineKeyboardButton(text=label, callback_data="pending:noop")])
+        buttons.extend(admin_action_kb(user_id).inline_keyboard)
+
+    nav = []
+    if prev_before_id is not None:
+        nav.append(
+            InlineKeyboardButton(
+                text=texts.BUTTON_PENDING_PREV,
+                callback_data=f"pending:before:{prev_before_id}",
+            )
+        )
+    nav.append(
+        InlineKeyboardButton(
+            text=texts.BUTTON_PENDING_REFRESH,
+            callback_data=f"pending:refresh:{refresh_after_id}",
+        )
+    )
+    if next_after_id is not None:
+        nav.append(
+            InlineKeyboardButton(
+                text=texts.BUTTON_PENDING_NEXT,
+                callback_data=f"pending:after:{next_after_id}",
+            )
+        )
+    buttons.append(nav)
+    return InlineKeyboardMarkup(inline_keyboard=buttons)
@@ -0,0 +1,107 @@
+"""Prometheus metrics, served by the local server from `create_metrics_app`."""
+from __future__ import annotations
+
+import time
+from typing import Callable, Iterable
+
+from prometheus_client import REGISTRY, Counter, Gauge, Histogram
+from prometheus_client.core import CounterMetricFamily, GaugeMetricFamily
+from prometheus_client.registry import Collector
+from sqlalchemy import event
+from sqlalchemy.ext.asyncio import AsyncEngine
+
+# Bot replies are interactive: most of the resolution sits below one second.
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10)
+
+UPDATES = Counter(
+    "bot_updates_total",
+    "Updates matched to a handler, by router and outcome: ok, error or throttled.",
+    ["router", "status"],
+)
+HANDLER_SECONDS = Histogram(
+    "bot_handler_seconds",
+    "Handler run time, including the middlewares inside it.",
+    ["router", "handler"],
+    buckets=LATENCY_BUCKETS,
+)
+THROTTLED = Counter(
+    "bot_throttled_total",
+    "Updates dropped by the throttling middleware.",
+    ["handler"],
+)
+DB_QUERY_SECONDS = Histogram(
+    "db_query_seconds",
+    "SQL statement run time, by engine and statement type.",
+    ["engine", "operation"],
+    buckets=LATENCY_BUCKETS,
+)
+CRYPTOBOT_SECONDS = Histogram(
+    "cryptobot_request_seconds",
+    "CryptoBot API call time per attempt, by method and result.",
+    ["method", "status"],
+    buckets=LATENCY_BUCKETS,
+)
+CRYPTOBOT_RETRIES = Counter(
+    "cryptobot_retries_total",
+    "CryptoBot attempts repeated after a transient failure.",
+    ["method"],
+)
+CRYPTOBOT_SHORT_CIRCUITED = Counter(
+    "cryptobot_short_circuited_total",
+    "CryptoBot calls refused without a request because the breaker was open.",
+    ["method"],
+)
+CRYPTOBOT_BREAKER_OPENED = Counter(
+    "cryptobot_breaker_opened_total",
+    "Times the CryptoBot circuit breaker opened.",
+)
+CRYPTOBOT_BREAKER_STATE = Gauge(
+    "cryptobot_breaker_state",
+    "CryptoBot circuit breaker at scrape time: 0 closed, 1 half-open, 2 open.",
+)
+
+_QUERY_STARTED = "metrics_query_started"
+
+StatsMetric = tuple[type[GaugeMetricFamily] | type[CounterMetricFamily], str, str, str]
+
+
+class StatsCollector(Collector):
+    """Reads a component's `stats()` at scrape time, so its hot path needs no metric calls."""
+
+    def __init__(self, stats: Callable[[], object], metrics: Iterable[StatsMetric]):
+        self._stats = stats
+        self._metrics = tuple(metrics)
+
+    def collect(self):
+        stats = self._stats()
+        for family, name, documentation, field in self._metrics:
+            yield family(name, documentation, value=getattr(stats, field))
+
+
+def export_stats(stats: Callable[[], object], metrics: Iterable[StatsMetric]) -> None:
+    """`metrics` are (metric family, name, help, stats field) tuples."""
+    REGISTRY.register(StatsCollector(stats, metrics))
+
+
+def _operation(statement: str) -> str:
+    verb = statement.lstrip().split(None, 1)[0].lower() if statement.strip() else ""
+    return verb if verb in ("select", "insert", "update", "delete") else "other"
+
+
+def instrument_engine(engine: AsyncEngine, name: str) -> None:
+    """Times every statement the engine runs."""
+
+    @event.listens_for(engine.sync_engine, "before_cursor_execute")
+    def before_cursor_execute(conn, cursor, statement, parameters, context, executemany) -> None:
+        conn.info.setdefault(_QUERY_STARTED, []).append(time.perf_counter())
+
+    @event.listens_for(engine.sync_engine, "after_cursor_execute")
+    def after_cursor_execute(conn, cursor, statement, parameters, context, executemany) -> None:
+        started = conn.info[_QUERY_STARTED].pop()
+        DB_QUERY_SECONDS.labels(name, _operation(statement)).observe(time.perf_counter() - started)
+
+    @event.listens_for(engine.sync_engine, "handle_error")
+    def handle_error(context) -> None:
+        # A failed statement never reaches after_cursor_execute.
+        if context.connection is not None and context.connection.info.get(_QUERY_STARTED):
+            context.connection.info[_QUERY_STARTED].pop()
@@ -0,0 +1,16 @@
+from .metrics import MetricsMiddleware
+from .profiling import HandlerProfileMiddleware, TelegramCallTimer, UpdateTraceMiddleware
+from .throttling import RATE_LIMIT_FLAG, THROTTLED_KEY, ThrottlingMiddleware
+from .user_snapshot import USER_SNAPSHOT_KEY, UserSnapshotMiddleware
+
+__all__ = [
+    "HandlerProfileMiddleware",
+    "MetricsMiddleware",
+    "RATE_LIMIT_FLAG",
+    "THROTTLED_KEY",
+    "TelegramCallTimer",
+    "ThrottlingMiddleware",
+    "USER_SNAPSHOT_KEY",
+    "UpdateTraceMiddleware",
+    "UserSnapshotMiddleware",
+]
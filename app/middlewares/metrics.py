@@ -0,0 +1,37 @@
+from __future__ import annotations
+
+import time
+from typing import Any, Awaitable, Callable
+
+from aiogram import BaseMiddleware
+from aiogram.types import TelegramObject
+
+from app.metrics import HANDLER_SECONDS, UPDATES
+from app.middlewares.throttling import THROTTLED_KEY
+
+
+class MetricsMiddleware(BaseMiddleware):
+    """Counts handled updates per router and times each handler.
+
+    Registered as the first inner middleware so throttled updates are counted
+    too, with status "throttled" and no handler timing.
+    """
+
+    async def __call__(
+        self,
+        handler: Callable[[TelegramObject, dict[str, Any]], Awaitable[Any]],
+        event: TelegramObject,
+        data: dict[str, Any],
+    ) -> Any:
+        router = data["event_router"].name
+        name = data["handler"].callback.__name__
+        started = time.perf_counter()
+        status = "error"
+        try:
+            result = await handler(event, data)
+            status = "throttled" if data.get(THROTTLED_KEY) else "ok"
+            return result
+        finally:
+            if status != "throttled":
+                HANDLER_SECONDS.labels(router, name).observe(time.perf_counter() - started)
+            UPDATES.labels(router, status).inc()
@@ -0,0 +1,75 @@
+from __future__ import annotations
+
+import time
+from typing import Any, Awaitable, Callable
+
+from aiogram import BaseMiddleware, Bot
+from aiogram.client.session.middlewares.base import BaseRequestMiddleware, NextRequestMiddlewareType
+from aiogram.methods import TelegramMethod
+from aiogram.methods.base import TelegramType
+from aiogram.types import TelegramObject, Update, User as TelegramUser
+
+from app.profiling import Profiler, current_trace, record_span
+
+
+class UpdateTraceMiddleware(BaseMiddleware):
+    """Outer update middleware: traces the whole update, user snapshot load included."""
+
+    def __init__(self, profiler: Profiler):
+        self.profiler = profiler
+
+    async def __call__(
+        self,
+        handler: Callable[[TelegramObject, dict[str, Any]], Awaitable[Any]],
+        event: Update,
+        data: dict[str, Any],
+    ) -> Any:
+        from_user: TelegramUser | None = data.get("event_from_user")
+        trace, token = self.profiler.start_trace(event.update_id, from_user.id if from_user else None)
+        started = time.perf_counter()
+        try:
+            return await handler(event, data)
+        finally:
+            self.profiler.finish_trace(trace, token, time.perf_counter() - started)
+
+
+class HandlerProfileMiddleware(BaseMiddleware):
+    """Inner middleware: names the handler in the trace and runs sampled ones under cProfile."""
+
+    def __init__(self, profiler: Profiler):
+        self.profiler = profiler
+
+    async def __call__(
+        self,
+        handler: Callable[[TelegramObject, dict[str, Any]], Awaitable[Any]],
+        event: TelegramObject,
+        data: dict[str, Any],
+    ) -> Any:
+        trace = current_trace()
+        if trace is None:
+            return await handler(event, data)
+        name = f"{data['event_router'].name}.{data['handler'].callback.__name__}"
+        trace.handler = name
+        profile = self.profiler.begin_profile(name) if trace.sampled else None
+        if profile is None:
+            return await handler(event, data)
+        try:
+            return await handler(event, data)
+        finally:
+            self.profiler.end_profile(name, profile)
+
+
+class TelegramCallTimer(BaseRequestMiddleware):
+    """Bot session middleware: adds each Bot API call to the current trace."""
+
+    async def __call__(
+        self,
+        make_request: NextRequestMiddlewareType[TelegramType],
+        bot: Bot,
+        method: TelegramMethod[TelegramType],
+    ) -> Any:
+        started = time.perf_counter()
+        try:
+            return await make_request(bot, method)
+        finally:
+            record_span("telegram", type(method).__name__, time.perf_counter() - started)
@@ -0,0 +1,65 @@
+from __future__ import annotations
+
+from typing import Any, Awaitable, Callable
+
+from aiogram import BaseMiddleware
+from aiogram.dispatcher.flags import get_flag
+from aiogram.types import CallbackQuery, TelegramObject, User as TelegramUser
+
+from app import texts
+from app.config import Settings
+from app.metrics import THROTTLED
+from app.services.rate_limit import MemoryThrottleStorage, RateLimit, ThrottleStorage
+
+RATE_LIMIT_FLAG = "rate_limit"
+# Set in the middleware data when an update is dropped, for MetricsMiddleware.
+THROTTLED_KEY = "throttled"
+
+
+class ThrottlingMiddleware(BaseMiddleware):
+    """Drops updates from users who exceed a handler's rate limit.
+
+    Registered as an inner middleware, so it runs after filters and sees the
+    matched handler's `rate_limit` flag; handlers without one get `default`,
+    `flags={"rate_limit": False}` opts out. Throttled callbacks are answered
+    with a fixed text so the client stops spinning; messages are dropped.
+    """
+
+    def __init__(self, storage: ThrottleStorage, default: RateLimit | None = None):
+        self.storage = storage
+        self.default = default
+        self.throttled = 0
+
+    @classmethod
+    def from_settings(
+        cls,
+        settings: Settings,
+        storage: ThrottleStorage | None = None,
+    ) -> ThrottlingMiddleware:
+        default = None
+        if settings.throttle_rate > 0:
+            default = RateLimit(rate=settings.throttle_rate, burst=settings.throttle_burst)
+        return cls(storage or MemoryThrottleStorage(settings.throttle_max_keys), default)
+
+    async def __call__(
+        self,
+        handler: Callable[[TelegramObject, dict[str, Any]], Awaitable[Any]],
+        event: TelegramObject,
+        data: dict[str, Any],
+    ) -> Any:
+        limit: RateLimit | None = get_flag(data, RATE_LIMIT_FLAG, default=self.default)
+        from_user: TelegramUser | None = data.get("event_from_user")
+        if not limit or from_user is None:
+            return await handler(event, data)
+
+        route = limit.key or data["handler"].callback.__name__
+        retry_after = await self.storage.consume(f"{from_user.id}:{route}", limit.rate, limit.burst)
+        if retry_after <= 0:
+            return await handler(event, data)
+
+        self.throttled += 1
+        data[THROTTLED_KEY] = True
+        THROTTLED.labels(route).inc()
+        if isinstance(event, CallbackQuery):
+            await event.answer(texts.THROTTLED_TEXT)
+        return None
@@ -0,0 +1,32 @@
+from typing import Any, Awaitable, Callable
+
+from aiogram import BaseMiddleware
+from aiogram.types import TelegramObject, User as TelegramUser
+
+import app.database.requests as rq
+from app.database.repository import UserSnapshot
+
+USER_SNAPSHOT_KEY = "user_snapshot"
+
+
+class UserSnapshotMiddleware(BaseMiddleware):
+    """Loads the sender's DB row once per update and shares it with handlers."""
+
+    async def __call__(
+        self,
+        handler: Callable[[TelegramObject, dict[str, Any]], Awaitable[Any]],
+        event: TelegramObject,
+        data: dict[str, Any],
+    ) -> Any:
+        from_user: TelegramUser | None = data.get("event_from_user")
+        snapshot: UserSnapshot | None = None
+        if from_user is not None:
+            snapshot = await rq.get_user(from_user.id)
+            if snapshot is None:
+                snapshot = UserSnapshot(user_id=from_user.id)
+            elif snapshot.is_blocked:
+                # Any update from the user means the bot is reachable again.
+                await rq.set_users_blocked([from_user.id], blocked=False)
+                snapshot = await rq.get_user(from_user.id) or snapshot
+        data[USER_SNAPSHOT_KEY] = snapshot
+        return await handler(event, data)
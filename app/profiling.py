@@ -0,0 +1,190 @@
+"""Opt-in profiling (PROFILING=1).
+
+Every update carries an `UpdateTrace` in a context variable; SQL statements,
+CryptoBot calls and Bot API calls made while handling the update add spans to
+it. A sampled fraction of traces goes to PROFILE_DIR/traces.jsonl, and every
+update slower than SLOW_UPDATE_MS to PROFILE_DIR/slow.jsonl, one JSON object
+per line. Sampled handlers also run under cProfile, with stats accumulated per
+handler and written to PROFILE_DIR/<handler>.prof (<handler>.w<index>.prof in
+worker processes) every PROFILE_DUMP_INTERVAL seconds and on shutdown (open with
+`python -m pstats`).
+"""
+from __future__ import annotations
+
+import cProfile
+from contextvars import ContextVar
+from dataclasses import asdict, dataclass, field
+import asyncio
+import json
+import logging
+import os
+import random
+import time
+
+from sqlalchemy import event
+from sqlalchemy.ext.asyncio import AsyncEngine
+
+from app.config import Settings
+
+MAX_STATEMENT_LENGTH = 200
+PROFILE_DUMP_INTERVAL = 60
+_QUERY_STARTED = "profiling_query_started"
+
+
+@dataclass(slots=True)
+class Span:
+    kind: str
+    name: str
+    ms: float
+
+
+@dataclass(slots=True)
+class UpdateTrace:
+    update_id: int
+    sampled: bool
+    user_id: int | None = None
+    handler: str | None = None
+    spans: list[Span] = field(default_factory=list)
+
+
+_current_trace: ContextVar[UpdateTrace | None] = ContextVar("update_trace", default=None)
+
+
+def current_trace() -> UpdateTrace | None:
+    return _current_trace.get()
+
+
+def record_span(kind: str, name: str, seconds: float) -> None:
+    """Adds a span to the current update's trace; a no-op outside a traced update."""
+    trace = _current_trace.get()
+    if trace is not None:
+        trace.spans.append(Span(kind, name, round(seconds * 1000, 3)))
+
+
+def _jsonl_logger(name: str, path: str) -> logging.Logger:
+    logger = logging.getLogger(f"app.profiling.{name}")
+    logger.setLevel(logging.INFO)
+    logger.propagate = False
+    if not logger.handlers:
+        handler = logging.FileHandler(path, encoding="utf-8")
+        handler.setFormatter(logging.Formatter("%(message)s"))
+        logger.addHandler(handler)
+    return logger
+
+
+class Profiler:
+    def __init__(
+        self,
+        sample_rate: float,
+        slow_update_ms: float,
+        directory: str,
+        worker_index: int | None = None,
+    ):
+        self.sample_rate = sample_rate
+        self.slow_seconds = slow_update_ms / 1000
+        self.directory = directory
+        # Workers keep separate stats, so each needs its own file.
+        self._profile_suffix = ".prof" if worker_index is None else f".w{worker_index}.prof"
+        os.makedirs(directory, exist_ok=True)
+        self._traces = _jsonl_logger("traces", os.path.join(directory, "traces.jsonl"))
+        self._slow = _jsonl_logger("slow", os.path.join(directory, "slow.jsonl"))
+        self._profiles: dict[str, cProfile.Profile] = {}
+        self._active: str | None = None
+        self._dirty: set[str] = set()
+        self._dump_task: asyncio.Task[None] | None = None
+
+    @classmethod
+    def from_settings(cls, settings: Settings, worker_index: int | None = None) -> Profiler:
+        return cls(
+            settings.profile_sample_rate,
+            settings.slow_update_ms,
+            settings.profile_dir,
+            worker_index,
+        )
+
+    def start_trace(self, update_id: int, user_id: int | None) -> tuple[UpdateTrace, object]:
+        trace = UpdateTrace(
+            update_id=update_id,
+            sampled=random.random() < self.sample_rate,
+            user_id=user_id,
+        )
+        return trace, _current_trace.set(trace)
+
+    def finish_trace(self, trace: UpdateTrace, token: object, seconds: float) -> None:
+        _current_trace.reset(token)
+        slow = self.slow_seconds > 0 and seconds >= self.slow_seconds
+        if not trace.sampled and not slow:
+            return
+        line = json.dumps(
+            {"ts": round(time.time(), 3), "ms": round(seconds * 1000, 3), **asdict(trace)},
+            ensure_ascii=False,
+        )
+        if trace.sampled:
+            self._traces.info(line)
+        if slow:
+            self._slow.info(line)
+
+    def begin_profile(self, handler: str) -> cProfile.Profile | None:
+        """cProfile allows one active profiler per thread, so overlapping samples are skipped.
+
+        The profile also sees other tasks that run while the handler awaits;
+        read the stats as "what was hot around this handler".
+        """
+        if self._active is not None:
+            return None
+        self._active = handler
+        profile = self._profiles.setdefault(handler, cProfile.Profile())
+        profile.enable()
+        return profile
+
+    def end_profile(self, handler: str, profile: cProfile.Profile) -> None:
+        profile.disable()
+        self._active = None
+        self._dirty.add(handler)
+
+    def dump_profiles(self) -> None:
+        """Writes profiles changed since the last dump, except one being recorded.
+
+        dump_stats disables the profiler, so an active profile waits for the next dump.
+        """
+        for handler in list(self._dirty):
+            if handler == self._active:
+                continue
+            self._dirty.discard(handler)
+            try:
+                self._profiles[handler].dump_stats(os.path.join(self.directory, handler + self._profile_suffix))
+            except OSError as exc:
+                logging.warning("Failed to write profile for %s: %s", handler, exc)
+
+    async def _dump_periodically(self) -> None:
+        while True:
+            await asyncio.sleep(PROFILE_DUMP_INTERVAL)
+            self.dump_profiles()
+
+    async def start(self) -> None:
+        if self._dump_task is None:
+            self._dump_task = asyncio.create_task(self._dump_periodically())
+
+    async def stop(self) -> None:
+        if self._dump_task is not None:
+            self._dump_task.cancel()
+            self._dump_task = None
+        self.dump_profiles()
+
+    def trace_engine(self, engine: AsyncEngine) -> None:
+        """Adds every SQL statement to the current trace."""
+
+        @event.listens_for(engine.sync_engine, "before_cursor_execute")
+        def before_cursor_execute(conn, cursor, statement, parameters, context, executemany) -> None:
+            conn.info.setdefault(_QUERY_STARTED, []).append(time.perf_counter())
+
+        @event.listens_for(engine.sync_engine, "after_cursor_execute")
+        def after_cursor_execute(conn, cursor, statement, parameters, context, executemany) -> None:
+            started = conn.info[_QUERY_STARTED].pop()
+            name = " ".join(statement.split())[:MAX_STATEMENT_LENGTH]
+            record_span("db", name, time.perf_counter() - started)
+
+        @event.listens_for(engine.sync_engine, "handle_error")
+        def handle_error(context) -> None:
+            if context.connection is not None and context.connection.info.get(_QUERY_STARTED):
+                context.connection.info[_QUERY_STARTED].pop()
@@ -5,7 +5,7 @@ from .rub import router as rub_router
 from .admin import router as admin_router
 from .common import router as main_router
 
-router = Router()
+router = Router(name="root")
 router.include_router(crypto_router)
 router.include_router(rub_router)
 router.include_router(admin_router)
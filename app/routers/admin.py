@@ -1,13 +1,17 @@
+import asyncio
 import logging
 
 from aiogram import F, Router
 from aiogram.filters import Command
-from aiogram.types import CallbackQuery, Message
+from aiogram.types import CallbackQuery, InlineKeyboardMarkup, Message
 
 from app import keyboards as kb
 from app import texts
 import app.database.requests as rq
-from app.database.models import User
+from app.database.repository import UserSnapshot
+from app.database.requests import DecisionOutcome
+from app.services.broadcast import broadcaster, format_broadcast
+from app.services.notifications import FanOutReport, notifier
 from app.services.user_access import (
     get_callback_user_id,
     get_message_user_id,
@@ -15,16 +19,25 @@ from app.services.user_access import (
     is_staff_user,
 )
 
-router = Router()
+router = Router(name="admin")
 
+RECEIPTS_PAGE_SIZE = 20
+PENDING_PAGE_SIZE = 5
+# 300 ten-digit ids plus the command still fit in one 4096-character message.
+MAX_BULK_USER_IDS = 300
+BULK_PROGRESS_INTERVAL = 5
 
-async def _get_pending_user(user_id: int) -> tuple[User | None, bool]:
-    user = await rq.get_user(user_id)
-    if not user:
-        return None, False
-    if user.payment_status not in ("pending", "receipt_sent") or user.decision_at is not None:
-        return user, False
-    return user, True
+DECISION_FAILURE_TEXTS = {
+    DecisionOutcome.NOT_STAFF: texts.ADMIN_ONLY_TEXT,
+    DecisionOutcome.NOT_FOUND: texts.USER_NOT_FOUND_TEXT,
+    DecisionOutcome.ALREADY_HANDLED: texts.ADMIN_ALREADY_HANDLED_TEXT,
+    DecisionOutcome.BANNED: texts.ADMIN_BANNED_USER_TEXT,
+}
+
+PENDING_STATUS_TEXTS = {
+    "pending": texts.PENDING_STATUS_PENDING,
+    "receipt_sent": texts.PENDING_STATUS_RECEIPT_SENT,
+}
 
 
 def _parse_target_user_id(message: Message) -> int | None:
@@ -39,6 +52,27 @@ def _parse_target_user_id(message: Message) -> int | None:
         return None
 
 
+def _parse_page_cursor(message: Message) -> int:
+    """Payment id after `/receipts`; a missing or malformed cursor means the first page."""
+    parts = (message.text or "").split(maxsplit=1)
+    if len(parts) != 2 or not parts[1].strip().isdigit():
+        return 0
+    return int(parts[1])
+
+
+def _parse_user_ids(message: Message) -> list[int] | None:
+    if not message.text:
+        return None
+    parts = message.text.replace(",", " ").split()[1:]
+    try:
+        user_ids = list(dict.fromkeys(int(part) for part in parts))
+    except ValueError:
+        return None
+    if not user_ids or len(user_ids) > MAX_BULK_USER_IDS:
+        return None
+    return user_ids
+
+
 def _parse_callback_user_id(callback: CallbackQuery, prefix: str) -> int | None:
     if not callback.data or not callback.data.startswith(prefix):
         return None
@@ -63,19 +97,91 @@ async def _notify_user(
         logging.exception("Failed to notify user %s: %s", user_id, exc)
 
 
+def _pending_page_anchor(callback: CallbackQuery) -> int | None:
+    """Cursor of the /pending page the callback came from, if it did."""
+    markup = getattr(callback.message, "reply_markup", None)
+    for row in markup.inline_keyboard if markup else ():
+        for button in row:
+            data = button.callback_data or ""
+            if data.startswith("pending:refresh:"):
+                try:
+                    return int(data.rsplit(":", 1)[1])
+                except ValueError:
+                    return None
+    return None
+
+
+async def _pending_page(
+    after_id: int = 0,
+    before_id: int | None = None,
+) -> tuple[str, InlineKeyboardMarkup | None]:
+    # One extra row tells whether there is a page beyond this one.
+    payments = await rq.get_open_payments(
+        rq.OPEN_STATUSES,
+        PENDING_PAGE_SIZE + 1,
+        after_id=after_id,
+        before_id=before_id,
+    )
+    if before_id is not None:
+        if len(payments) <= PENDING_PAGE_SIZE:
+            return await _pending_page()
+        payments = payments[1:]
+        after_id = payments[0].id - 1
+        has_next = True
+    else:
+        has_next = len(payments) > PENDING_PAGE_SIZE
+        payments = payments[:PENDING_PAGE_SIZE]
+
+    if not payments:
+        if after_id:
+            # Everything from the cursor on was decided: step back instead.
+            return await _pending_page(before_id=after_id + 1)
+        return texts.PENDING_EMPTY_TEXT, None
+
+    rows = [
+        (
+            payment.user_id,
+            f"{payment.user_id} · {PENDING_STATUS_TEXTS.get(payment.status, payment.status)}"
+            f" · {payment.created_at:%d.%m %H:%M}",
+        )
+        for payment in payments
+    ]
+    reply_markup = kb.pending_page_kb(
+        rows,
+        refresh_after_id=after_id,
+        prev_before_id=payments[0].id if after_id else None,
+        next_after_id=payments[-1].id if has_next else None,
+    )
+    return texts.PENDING_HEADER_TEXT, reply_markup
+
+
 async def _mark_admin_message(callback: CallbackQuery, status_text: str) -> None:
     if not callback.message:
         return
     try:
+        anchor = _pending_page_anchor(callback)
+        if anchor is not None:
+            # Keep the /pending page in place; the decided row drops out of it.
+            text, reply_markup = await _pending_page(after_id=anchor)
+            await callback.message.edit_text(f"{status_text}\n\n{text}", reply_markup=reply_markup)
+            return
         await callback.message.edit_text(status_text, reply_markup=None)
     except Exception as exc:
         logging.exception("Failed to update admin message: %s", exc)
 
 
+async def _report_decision_failure(callback: CallbackQuery, outcome: DecisionOutcome) -> None:
+    text = DECISION_FAILURE_TEXTS[outcome]
+    if callback.message:
+        await callback.message.answer(text)
+    if outcome in (DecisionOutcome.ALREADY_HANDLED, DecisionOutcome.BANNED):
+        await _mark_admin_message(callback, text)
+
+
 @router.message(Command(commands="approve"))
-async def approve_payment(message: Message) -> None:
+async def approve_payment(message: Message, user_snapshot: UserSnapshot | None) -> None:
     actor_id = get_message_user_id(message)
-    if not await is_staff_user(actor_id):
+    if not is_staff_user(user_snapshot):
         await message.answer(texts.ADMIN_ONLY_TEXT)
         return
 
@@ -84,20 +190,9 @@ async def approve_payment(message: Message) -> None:
         await message.answer(texts.APPROVE_USAGE_TEXT)
         return
 
-    user, is_pending = await _get_pending_user(user_id)
-    if not user:
-        await message.answer(texts.USER_NOT_FOUND_TEXT)
-        return
-    if not is_pending:
-        await message.answer(texts.ADMIN_ALREADY_HANDLED_TEXT)
-        return
-    if user.is_banned:
-        await message.answer(texts.ADMIN_BANNED_USER_TEXT)
-        return
-
-    user = await rq.approve_by_staff(user_id, actor_id, "rub")
-    if not user:
-        await message.answer(texts.ADMIN_ALREADY_HANDLED_TEXT)
+    outcome = await rq.decide_payment(user_id, actor_id, approve=True)
+    if outcome is not DecisionOutcome.APPROVED:
+        await message.answer(DECISION_FAILURE_TEXTS[outcome])
         return
 
     await _notify_user(message, user_id, texts.USER_APPROVED_TEXT, reply_markup=kb.user_kb(True))
@@ -105,9 +200,9 @@ async def approve_payment(message: Message) -> None:
 
 
 @router.message(Command(commands="deny"))
-async def deny_payment(message: Message) -> None:
+async def deny_payment(message: Message, user_snapshot: UserSnapshot | None) -> None:
     actor_id = get_message_user_id(message)
-    if not await is_staff_user(actor_id):
+    if not is_staff_user(user_snapshot):
         await message.answer(texts.ADMIN_ONLY_TEXT)
         return
 
@@ -116,29 +211,125 @@ async def deny_payment(message: Message) -> None:
         await message.answer(texts.DENY_USAGE_TEXT)
         return
 
-    user, is_pending = await _get_pending_user(user_id)
-    if not user:
-        await message.answer(texts.USER_NOT_FOUND_TEXT)
+    outcome = await rq.decide_payment(user_id, actor_id, approve=False)
+    if outcome is not DecisionOutcome.DENIED:
+        await message.answer(DECISION_FAILURE_TEXTS[outcome])
         return
-    if not is_pending:
-        await message.answer(texts.ADMIN_ALREADY_HANDLED_TEXT)
+
+    await _notify_user(message, user_id, texts.USER_DENIED_TEXT, reply_markup=kb.user_kb(False))
+    await message.answer(texts.DENY_SUCCESS_TEXT)
+
+
+@router.message(Command(commands="receipts"))
+async def list_receipts(message: Message, user_snapshot: UserSnapshot | None) -> None:
+    if not is_staff_user(user_snapshot):
+        await message.answer(texts.ADMIN_ONLY_TEXT)
         return
-    if user.is_banned:
-        await message.answer(texts.ADMIN_BANNED_USER_TEXT)
+
+    after_id = _parse_page_cursor(message)
+    payments = await rq.get_open_payments(("receipt_sent",), RECEIPTS_PAGE_SIZE, after_id=after_id)
+    if not payments:
+        await message.answer(texts.RECEIPTS_EMPTY_TEXT)
         return
 
-    user = await rq.deny_by_staff(user_id, actor_id, paid_method="rub")
-    if not user:
-        await message.answer(texts.ADMIN_ALREADY_HANDLED_TEXT)
+    user_ids = " ".join(str(payment.user_id) for payment in payments)
+    lines = [
+        texts.RECEIPTS_HEADER_TEXT,
+        *(f"{payment.user_id} · {payment.created_at:%d.%m %H:%M}" for payment in payments),
+        "",
+        f"/approve_many {user_ids}",
+        f"/deny_many {user_ids}",
+    ]
+    if len(payments) == RECEIPTS_PAGE_SIZE:
+        lines.append(f"{texts.RECEIPTS_NEXT_TEXT} /receipts {payments[-1].id}")
+    await message.answer("\n".join(lines))
+
+
+@router.message(Command(commands="pending"))
+async def list_pending(message: Message, user_snapshot: UserSnapshot | None) -> None:
+    if not is_staff_user(user_snapshot):
+        await message.answer(texts.ADMIN_ONLY_TEXT)
         return
 
-    await _notify_user(message, user_id, texts.USER_DENIED_TEXT, reply_markup=kb.user_kb(False))
-    await message.answer(texts.DENY_SUCCESS_TEXT)
+    text, reply_markup = await _pending_page()
+    await message.answer(text, reply_markup=reply_markup)
+
+
+async def _decide_many(message: Message, user_snapshot: UserSnapshot | None, approve: bool) -> None:
+    actor_id = get_message_user_id(message)
+    if not is_staff_user(user_snapshot):
+        await message.answer(texts.ADMIN_ONLY_TEXT)
+        return
+
+    user_ids = _parse_user_ids(message)
+    if user_ids is None:
+        await message.answer(texts.BULK_USAGE_TEXT)
+        return
+
+    decided = await rq.decide_payments(user_ids, actor_id, approve=approve)
+    summary = (
+        f"{texts.BULK_DECIDED_TEXT}: {len(decided)}\n"
+        f"{texts.BULK_SKIPPED_TEXT}: {len(user_ids) - len(decided)}"
+    )
+    if not decided:
+        await message.answer(summary)
+        return
+
+    status = await message.answer(f"{summary}\n{texts.BULK_NOTIFY_PROGRESS_TEXT} 0/{len(decided)}")
+    text = texts.USER_APPROVED_TEXT if approve else texts.USER_DENIED_TEXT
+    reply_markup = kb.user_kb(approve)
+    report = FanOutReport()
+    fan_out = notifier.fan_out(
+        decided,
+        lambda user_id: (
+            lambda: message.bot.send_message(user_id, text, reply_markup=reply_markup),
+        ),
+        report,
+    )
+    notifier.spawn(_report_bulk_progress(status, summary, fan_out, report, len(decided)))
+
+
+async def _report_bulk_progress(
+    status: Message,
+    summary: str,
+    fan_out: asyncio.Task[FanOutReport],
+    report: FanOutReport,
+    total: int,
+) -> None:
+    """Edits the summary every BULK_PROGRESS_INTERVAL seconds until the fan-out ends."""
+    shown = 0
+    while not fan_out.done():
+        await asyncio.wait({fan_out}, timeout=BULK_PROGRESS_INTERVAL)
+        if fan_out.done() or report.done == shown:
+            continue
+        shown = report.done
+        try:
+            await status.edit_text(f"{summary}\n{texts.BULK_NOTIFY_PROGRESS_TEXT} {shown}/{total}")
+        except Exception as exc:
+            logging.warning("Failed to update bulk decision progress: %s", exc)
+    try:
+        await status.edit_text(
+            f"{summary}\n"
+            f"{texts.BULK_NOTIFIED_TEXT}: {report.sent}\n"
+            f"{texts.BULK_NOT_DELIVERED_TEXT}: {report.failed}"
+        )
+    except Exception as exc:
+        logging.exception("Failed to update bulk decision summary: %s", exc)
+
+
+@router.message(Command(commands="approve_many"))
+async def approve_many(message: Message, user_snapshot: UserSnapshot | None) -> None:
+    await _decide_many(message, user_snapshot, approve=True)
+
+
+@router.message(Command(commands="deny_many"))
+async def deny_many(message: Message, user_snapshot: UserSnapshot | None) -> None:
+    await _decide_many(message, user_snapshot, approve=False)
 
 
 @router.message(Command(commands="ban"))
-async def ban_user(message: Message) -> None:
-    if not await is_staff_user(get_message_user_id(message)):
+async def ban_user(message: Message, user_snapshot: UserSnapshot | None) -> None:
+    if not is_staff_user(user_snapshot):
         await message.answer(texts.ADMIN_ONLY_TEXT)
         return
 
@@ -153,8 +344,8 @@ async def ban_user(message: Message) -> None:
 
 
 @router.message(Command(commands="unban"))
-async def unban_user(message: Message) -> None:
-    if not await is_staff_user(get_message_user_id(message)):
+async def unban_user(message: Message, user_snapshot: UserSnapshot | None) -> None:
+    if not is_staff_user(user_snapshot):
         await message.answer(texts.ADMIN_ONLY_TEXT)
         return
 
@@ -205,9 +396,57 @@ async def remove_admin(message: Message) -> None:
     await message.answer(texts.ADMIN_REMOVED_TEXT)
 
 
+@router.message(Command(commands="broadcast"))
+async def start_broadcast(message: Message) -> None:
+    owner_id = get_message_user_id(message)
+    if not is_owner_user(owner_id):
+        await message.answer(texts.ADMIN_ONLY_TEXT)
+        return
+
+    parts = (message.text or "").split(maxsplit=2)
+    if len(parts) != 3 or parts[1] not in rq.BROADCAST_SEGMENTS:
+        await message.answer(texts.BROADCAST_USAGE_TEXT)
+        return
+
+    broadcast = await broadcaster.launch(message.bot, parts[2], parts[1], owner_id)
+    if broadcast is None:
+        await message.answer(texts.BROADCAST_RUNNING_TEXT)
+        return
+
+    await message.answer(f"{texts.BROADCAST_STARTED_TEXT} #{broadcast.id}")
+
+
+@router.message(Command(commands="broadcast_status"))
+async def broadcast_status(message: Message) -> None:
+    if not is_owner_user(get_message_user_id(message)):
+        await message.answer(texts.ADMIN_ONLY_TEXT)
+        return
+
+    broadcast = await rq.get_broadcast()
+    if broadcast is None:
+        await message.answer(texts.BROADCAST_NONE_TEXT)
+        return
+
+    await message.answer(format_broadcast(broadcast))
+
+
+@router.message(Command(commands="broadcast_cancel"))
+async def cancel_broadcast(message: Message) -> None:
+    if not is_owner_user(get_message_user_id(message)):
+        await message.answer(texts.ADMIN_ONLY_TEXT)
+        return
+
+    broadcast = await broadcaster.cancel()
+    if broadcast is None:
+        await message.answer(texts.BROADCAST_NONE_TEXT)
+        return
+
+    await message.answer(format_broadcast(broadcast))
+
+
 @router.message(F.text == texts.BUTTON_ADMIN_APPROVE_HELP)
-async def approve_help(message: Message) -> None:
-    if not await is_staff_user(get_message_user_id(message)):
+async def approve_help(message: Message, user_snapshot: UserSnapshot | None) -> None:
+    if not is_staff_user(user_snapshot):
         await message.answer(texts.ADMIN_ONLY_TEXT)
         return
 
@@ -215,8 +454,8 @@ async def approve_help(message: Message) -> None:
 
 
 @router.message(F.text == texts.BUTTON_ADMIN_DENY_HELP)
-async def deny_help(message: Message) -> None:
-    if not await is_staff_user(get_message_user_id(message)):
+async def deny_help(message: Message, user_snapshot: UserSnapshot | None) -> None:
+    if not is_staff_user(user_snapshot):
         await message.answer(texts.ADMIN_ONLY_TEXT)
         return
 
@@ -224,8 +463,8 @@ async def deny_help(message: Message) -> None:
 
 
 @router.message(F.text == texts.BUTTON_ADMIN_BAN_HELP)
-async def ban_help(message: Message) -> None:
-    if not await is_staff_user(get_message_user_id(message)):
+async def ban_help(message: Message, user_snapshot: UserSnapshot | None) -> None:
+    if not is_staff_user(user_snapshot):
         await message.answer(texts.ADMIN_ONLY_TEXT)
         return
 
@@ -233,8 +472,8 @@ async def ban_help(message: Message) -> None:
 
 
 @router.message(F.text == texts.BUTTON_ADMIN_UNBAN_HELP)
-async def unban_help(message: Message) -> None:
-    if not await is_staff_user(get_message_user_id(message)):
+async def unban_help(message: Message, user_snapshot: UserSnapshot | None) -> None:
+    if not is_staff_user(user_snapshot):
         await message.answer(texts.ADMIN_ONLY_TEXT)
         return
 
@@ -260,10 +499,10 @@ async def admin_remove_help(message: Message) -> None:
 
 
 @router.callback_query(F.data.startswith("admin_approve:"))
-async def approve_callback(callback: CallbackQuery) -> None:
+async def approve_callback(callback: CallbackQuery, user_snapshot: UserSnapshot | None) -> None:
     await callback.answer()
     actor_id = get_callback_user_id(callback)
-    if not await is_staff_user(actor_id):
+    if not is_staff_user(user_snapshot):
         if callback.message:
             await callback.message.answer(texts.ADMIN_ONLY_TEXT)
         return
@@ -274,27 +513,9 @@ async def approve_callback(callback: CallbackQuery) -> None:
             await callback.message.answer(texts.APPROVE_USAGE_TEXT)
         return
 
-    user, is_pending = await _get_pending_user(user_id)
-    if not user:
-        if callback.message:
-            await callback.message.answer(texts.USER_NOT_FOUND_TEXT)
-        return
-    if not is_pending:
-        if callback.message:
-            await callback.message.answer(texts.ADMIN_ALREADY_HANDLED_TEXT)
-        await _mark_admin_message(callback, texts.ADMIN_ALREADY_HANDLED_TEXT)
-        return
-    if user.is_banned:
-        if callback.message:
-            await callback.message.answer(texts.ADMIN_BANNED_USER_TEXT)
-        await _mark_admin_message(callback, texts.ADMIN_BANNED_USER_TEXT)
-        return
-
-    user = await rq.approve_by_staff(user_id, actor_id, "rub")
-    if not user:
-        if callback.message:
-            await callback.message.answer(texts.ADMIN_ALREADY_HANDLED_TEXT)
-        await _mark_admin_message(callback, texts.ADMIN_ALREADY_HANDLED_TEXT)
+    outcome = await rq.decide_payment(user_id, actor_id, approve=True)
+    if outcome is not DecisionOutcome.APPROVED:
+        await _report_decision_failure(callback, outcome)
         return
 
     await _notify_user(
@@ -307,10 +528,10 @@ async def approve_callback(callback: CallbackQuery) -> None:
 
 
 @router.callback_query(F.data.startswith("admin_deny:"))
-async def deny_callback(callback: CallbackQuery) -> None:
+async def deny_callback(callback: CallbackQuery, user_snapshot: UserSnapshot | None) -> None:
     await callback.answer()
     actor_id = get_callback_user_id(callback)
-    if not await is_staff_user(actor_id):
+    if not is_staff_user(user_snapshot):
         if callback.message:
             await callback.message.answer(texts.ADMIN_ONLY_TEXT)
         return
@@ -321,27 +542,9 @@ async def deny_callback(callback: CallbackQuery) -> None:
             await callback.message.answer(texts.DENY_USAGE_TEXT)
         return
 
-    user, is_pending = await _get_pending_user(user_id)
-    if not user:
-        if callback.message:
-            await callback.message.answer(texts.USER_NOT_FOUND_TEXT)
-        return
-    if not is_pending:
-        if callback.message:
-            await callback.message.answer(texts.ADMIN_ALREADY_HANDLED_TEXT)
-        await _mark_admin_message(callback, texts.ADMIN_ALREADY_HANDLED_TEXT)
-        return
-    if user.is_banned:
-        if callback.message:
-            await callback.message.answer(texts.ADMIN_BANNED_USER_TEXT)
-        await _mark_admin_message(callback, texts.ADMIN_BANNED_USER_TEXT)
-        return
-
-    user = await rq.deny_by_staff(user_id, actor_id, paid_method="rub")
-    if not user:
-        if callback.message:
-            await callback.message.answer(texts.ADMIN_ALREADY_HANDLED_TEXT)
-        await _mark_admin_message(callback, texts.ADMIN_ALREADY_HANDLED_TEXT)
+    outcome = await rq.decide_payment(user_id, actor_id, approve=False)
+    if outcome is not DecisionOutcome.DENIED:
+        await _report_decision_failure(callback, outcome)
         return
 
     await _notify_user(
@@ -354,9 +557,9 @@ async def deny_callback(callback: CallbackQuery) -> None:
 
 
 @router.callback_query(F.data.startswith("admin_ban:"))
-async def ban_callback(callback: CallbackQuery) -> None:
+async def ban_callback(callback: CallbackQuery, user_snapshot: UserSnapshot | None) -> None:
     await callback.answer()
-    if not await is_staff_user(get_callback_user_id(callback)):
+    if not is_staff_user(user_snapshot):
         if callback.message:
             await callback.message.answer(texts.ADMIN_ONLY_TEXT)
         return
@@ -369,4 +572,30 @@ async def ban_callback(callback: CallbackQuery) -> None:
 
     await rq.ban_user(user_id)
     await _notify_user(callback.message, user_id, texts.BANNED_TEXT)
-    await _mark_admin_message(callback, "🚫 " + texts.BAN_SUCCESS_TEXT)
\ No newline at end of file
+    await _mark_admin_message(callback, "🚫 " + texts.BAN_SUCCESS_TEXT)
+
+
+@router.callback_query(F.data.startswith("pending:"))
+async def pending_callback(callback: CallbackQuery, user_snapshot: UserSnapshot | None) -> None:
+    await callback.answer()
+    if not is_staff_user(user_snapshot):
+        if callback.message:
+            await callback.message.answer(texts.ADMIN_ONLY_TEXT)
+        return
+
+    _, action, *cursor = (callback.data or "").split(":")
+    if action not in ("after", "before", "refresh") or not callback.message:
+        return
+    try:
+        cursor_id = int(cursor[0])
+    except (IndexError, ValueError):
+        return
+
+    if action == "before":
+        text, reply_markup = await _pending_page(before_id=cursor_id)
+    else:
+        text, reply_markup = await _pending_page(after_id=cursor_id)
+    try:
+        await callback.message.edit_text(text, reply_markup=reply_markup)
+    except Exception as exc:
+        logging.exception("Failed to update pending page: %s", exc)
@@ -1,5 +1,7 @@
 from app.config import get_settings
-import app.database.requests as rq
+from app.database.cache import staff_cache
+
+_staff_ids: tuple[int, list[int]] = (-1, [])
 
 
 def is_admin(user_id: int | None) -> bool:
@@ -9,16 +11,17 @@ def is_admin(user_id: int | None) -> bool:
     return user_id in settings.admin_chat_ids
 
 
-async def is_staff(user_id: int | None) -> bool:
+def is_staff(user_id: int | None) -> bool:
     if user_id is None:
         return False
-    if is_admin(user_id):
-        return True
-    return await rq.is_user_admin(user_id)
+    return is_admin(user_id) or user_id in staff_cache
 
 
-async def get_staff_ids() -> list[int]:
-    settings = get_settings()
-    admin_ids = set(settings.admin_chat_ids)
-    admin_ids.update(await rq.get_admin_ids())
-    return sorted(admin_ids)
+def get_staff_ids() -> list[int]:
+    global _staff_ids
+    version, staff_ids = _staff_ids
+    if version != staff_cache.version:
+        settings = get_settings()
+        staff_ids = sorted(set(settings.admin_chat_ids) | staff_cache.ids)
+        _staff_ids = (staff_cache.version, staff_ids)
+    return staff_ids
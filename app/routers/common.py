@@ -3,6 +3,7 @@ from aiogram.filters import CommandStart, Command
 from aiogram.types import Message
 
 from app import texts
+from app.database.repository import UserSnapshot
 from app.services.user_handlers import (
     handle_any_message,
     handle_help,
@@ -12,34 +13,34 @@ from app.services.user_handlers import (
     handle_support,
 )
 
-router = Router()
+router = Router(name="common")
 
 
 @router.message(CommandStart())
-async def command_start(message: Message) -> None:
-    await handle_start(message)
+async def command_start(message: Message, user_snapshot: UserSnapshot | None) -> None:
+    await handle_start(message, user_snapshot)
 
 
 @router.message(Command(commands="help"))
-async def command_help(message: Message) -> None:
-    await handle_help(message)
+async def command_help(message: Message, user_snapshot: UserSnapshot | None) -> None:
+    await handle_help(message, user_snapshot)
 
 
 @router.message(F.text == texts.BUTTON_PAY)
-async def paid(message: Message) -> None:
-    await handle_pay_button(message)
+async def paid(message: Message, user_snapshot: UserSnapshot | None) -> None:
+    await handle_pay_button(message, user_snapshot)
 
 
 @router.message(F.text == texts.BUTTON_SUPPORT)
-async def help_contact(message: Message) -> None:
-    await handle_support(message)
+async def help_contact(message: Message, user_snapshot: UserSnapshot | None) -> None:
+    await handle_support(message, user_snapshot)
 
 
 @router.message(F.text == texts.BUTTON_INFO)
-async def info_repeat(message: Message) -> None:
-    await handle_info(message)
+async def info_repeat(message: Message, user_snapshot: UserSnapshot | None) -> None:
+    await handle_info(message, user_snapshot)
 
 
 @router.message(F.text)
-async def any_message(message: Message) -> None:
-    await handle_any_message(message)
+async def any_message(message: Message, user_snapshot: UserSnapshot | None) -> None:
+    await handle_any_message(message, user_snapshot)
@@ -1,16 +1,22 @@
 from aiogram import F, Router
 from aiogram.types import CallbackQuery
 
+from app.database.repository import UserSnapshot
+from app.services.rate_limit import RateLimit
 from app.services.user_handlers import handle_check_invoice, handle_pay_usdt
 
-router = Router()
+router = Router(name="crypto")
 
 
-@router.callback_query(F.data == "pay_usdt")
-async def callback_usdt(callback: CallbackQuery) -> None:
-    await handle_pay_usdt(callback)
+# Both taps end in a CryptoBot API call, so they get far tighter limits than the default.
+@router.callback_query(F.data == "pay_usdt", flags={"rate_limit": RateLimit(rate=0.1, burst=2)})
+async def callback_usdt(callback: CallbackQuery, user_snapshot: UserSnapshot | None) -> None:
+    await handle_pay_usdt(callback, user_snapshot)
 
 
-@router.callback_query(F.data.startswith("check_invoice:"))
-async def callback_check_invoice(callback: CallbackQuery) -> None:
-    await handle_check_invoice(callback)
+@router.callback_query(
+    F.data.startswith("check_invoice:"),
+    flags={"rate_limit": RateLimit(rate=0.2, burst=3)},
+)
+async def callback_check_invoice(callback: CallbackQuery, user_snapshot: UserSnapshot | None) -> None:
+    await handle_check_invoice(callback, user_snapshot)
@@ -1,25 +1,28 @@
 from aiogram import F, Router
 from aiogram.types import CallbackQuery, Message
 
+from app.database.repository import UserSnapshot
+from app.services.rate_limit import RateLimit
 from app.services.user_handlers import (
     handle_pay_rub,
     handle_receipt_message,
     handle_rub_receipt_sent,
 )
 
-router = Router()
+router = Router(name="rub")
 
 
 @router.callback_query(F.data == "pay_rub")
-async def callback_rub(callback: CallbackQuery) -> None:
-    await handle_pay_rub(callback)
+async def callback_rub(callback: CallbackQuery, user_snapshot: UserSnapshot | None) -> None:
+    await handle_pay_rub(callback, user_snapshot)
 
 
 @router.callback_query(F.data == "rub_receipt_sent")
-async def callback_rub_receipt_sent(callback: CallbackQuery) -> None:
-    await handle_rub_receipt_sent(callback)
+async def callback_rub_receipt_sent(callback: CallbackQuery, user_snapshot: UserSnapshot | None) -> None:
+    await handle_rub_receipt_sent(callback, user_snapshot)
 
 
-@router.message(F.photo | F.document)
-async def receipt_message(message: Message) -> None:
-    await handle_receipt_message(message)
+# Every receipt is copied to all staff chats.
+@router.message(F.photo | F.document, flags={"rate_limit": RateLimit(rate=0.2, burst=3)})
+async def receipt_message(message: Message, user_snapshot: UserSnapshot | None) -> None:
+    await handle_receipt_message(message, user_snapshot)
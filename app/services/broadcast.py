@@ -0,0 +1,191 @@
+from __future__ import annotations
+
+import asyncio
+import logging
+from typing import Callable
+
+from aiogram import Bot
+
+from app import texts
+from app.config import get_settings
+import app.database.requests as rq
+from app.database.models import Broadcast
+from app.services.notifications import DeliveryStatus, NotificationDispatcher, notifier
+
+MAX_RUN_RETRIES = 5
+RETRY_BACKOFF_BASE = 2.0
+RETRY_BACKOFF_MAX = 60.0
+
+
+def format_broadcast(broadcast: Broadcast) -> str:
+    return (
+        f"{texts.BROADCAST_TITLE_TEXT} #{broadcast.id} · {broadcast.segment} · {broadcast.status}\n"
+        f"{texts.BROADCAST_SENT_TEXT}: {broadcast.sent}\n"
+        f"{texts.BROADCAST_FAILED_TEXT}: {broadcast.failed}\n"
+        f"{texts.BROADCAST_BLOCKED_TEXT}: {broadcast.blocked}"
+    )
+
+
+class BroadcastRunner:
+    """Delivers one owner broadcast at a time, checkpointing after every batch.
+
+    Targets are read in keyset batches by users.id and the checkpoint is the
+    last users.id of a fully sent batch, so a restart resumes from there and
+    repeats at most one batch.
+
+    With `handoff` set, `launch` only creates the running row and calls it;
+    the process that owns the broadcast budget picks the row up via `start`.
+    """
+
+    def __init__(self, dispatcher: NotificationDispatcher, batch_size: int):
+        self.dispatcher = dispatcher
+        self.batch_size = batch_size
+        self.handoff: Callable[[], None] | None = None
+        self._task: asyncio.Task[None] | None = None
+
+    @property
+    def running(self) -> bool:
+        return self._task is not None and not self._task.done()
+
+    async def start(self, bot: Bot) -> None:
+        """Resumes a broadcast interrupted by a restart or launched by another worker."""
+        broadcast = await rq.get_running_broadcast()
+        if broadcast is not None and not self.running:
+            logging.info("Resuming broadcast %s after user pk %s", broadcast.id, broadcast.last_user_pk)
+            self._spawn(bot, broadcast)
+
+    async def stop(self) -> None:
+        """Stops sending but leaves the broadcast running in the DB to resume later."""
+        if self._task is None:
+            return
+        self._task.cancel()
+        try:
+            await self._task
+        except asyncio.CancelledError:
+            pass
+        self._task = None
+
+    async def launch(
+        self,
+        bot: Bot,
+        text: str,
+        segment: rq.BroadcastSegment,
+        owner_id: int,
+    ) -> Broadcast | None:
+        """Returns None if another broadcast is still running."""
+        if self.running:
+            return None
+        broadcast = await rq.start_broadcast(text, segment, owner_id)
+        if broadcast is None:
+            return None
+        if self.handoff is not None:
+            self.handoff()
+        else:
+            self._spawn(bot, broadcast)
+        return broadcast
+
+    async def cancel(self) -> Broadcast | None:
+        """A run in another process stops at its next checkpoint."""
+        broadcast = await rq.get_running_broadcast()
+        if broadcast is None:
+            return None
+        await self.stop()
+        return await rq.finish_broadcast(broadcast.id, "cancelled")
+
+    def _spawn(self, bot: Bot, broadcast: Broadcast) -> None:
+        self._task = asyncio.create_task(self._run(bot, broadcast))
+
+    async def _send_batch(
+        self,
+        bot: Bot,
+        text: str,
+        batch: list[tuple[int, int]],
+    ) -> list[DeliveryStatus]:
+        return await asyncio.gather(
+            *(
+                self.dispatcher.send(
+                    user_id,
+                    (lambda user_id=user_id: bot.send_message(user_id, text),),
+                )
+                for _, user_id in batch
+            )
+        )
+
+    async def _deliver(self, bot: Bot, broadcast: Broadcast) -> Broadcast | None:
+        """Sends from the broadcast's checkpoint to the end; None if it stopped running."""
+        after_pk = broadcast.last_user_pk
+        while batch := await rq.get_broadcast_targets(broadcast.segment, after_pk, self.batch_size):
+            statuses = await self._send_batch(bot, broadcast.text, batch)
+            blocked = [
+                user_id
+                for (_, user_id), status in zip(batch, statuses)
+                if status is DeliveryStatus.BLOCKED
+            ]
+            if blocked:
+                await rq.set_users_blocked(blocked)
+            after_pk = batch[-1][0]
+            checkpoint = await rq.checkpoint_broadcast(
+                broadcast.id,
+                after_pk,
+                sent=statuses.count(DeliveryStatus.SENT),
+                failed=statuses.count(DeliveryStatus.FAILED),
+                blocked=len(blocked),
+            )
+            if checkpoint is None:
+                return None
+        return await rq.finish_broadcast(broadcast.id, "done")
+
+    async def _run(self, bot: Bot, broadcast: Broadcast) -> None:
+        """Retries from the last checkpoint with backoff, then marks the broadcast failed."""
+        broadcast_id = broadcast.id
+        finished: Broadcast | None = None
+        for attempt in range(MAX_RUN_RETRIES + 1):
+            try:
+                if attempt:
+                    broadcast = await rq.get_broadcast(broadcast_id)
+                    if broadcast is None or broadcast.status != "running":
+                        return
+                finished = await self._deliver(bot, broadcast)
+                break
+            except asyncio.CancelledError:
+                raise
+            except Exception as exc:
+                logging.exception("Broadcast %s failed (attempt %s): %s", broadcast_id, attempt + 1, exc)
+            if attempt < MAX_RUN_RETRIES:
+                await asyncio.sleep(min(RETRY_BACKOFF_MAX, RETRY_BACKOFF_BASE * 2**attempt))
+        else:
+            try:
+                finished = await rq.finish_broadcast(broadcast_id, "failed")
+            except Exception as exc:
+                # Still running in the DB: the next start resumes from the last checkpoint.
+                logging.exception("Could not mark broadcast %s failed: %s", broadcast_id, exc)
+                return
+
+        if finished is None:
+            return
+        logging.info(
+            "Broadcast %s %s: sent=%s failed=%s blocked=%s",
+            broadcast_id,
+            finished.status,
+            finished.sent,
+            finished.failed,
+            finished.blocked,
+        )
+        await self.dispatcher.deliver(
+            finished.created_by,
+            (lambda: bot.send_message(finished.created_by, format_broadcast(finished)),),
+        )
+
+
+_settings = get_settings()
+# Capped at BROADCAST_RATE and drawing on the notifier's budget, so staff
+# notifications and a broadcast together stay under TELEGRAM_GLOBAL_RATE.
+broadcaster = BroadcastRunner(
+    NotificationDispatcher(
+        concurrency=_settings.notify_concurrency,
+        global_rate=_settings.broadcast_rate,
+        chat_rate=_settings.telegram_chat_rate,
+        shared_limit=notifier.global_limit,
+    ),
+    batch_size=_settings.broadcast_batch_size,
+)
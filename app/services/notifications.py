@@ -0,0 +1,185 @@
+from __future__ import annotations
+
+import asyncio
+from collections import OrderedDict
+from dataclasses import dataclass
+from enum import Enum
+import logging
+from typing import Any, Awaitable, Callable, Coroutine, Iterable, Sequence
+
+from aiogram import Bot
+from aiogram.exceptions import TelegramAPIError, TelegramForbiddenError, TelegramRetryAfter
+
+from app import keyboards as kb
+from app import texts
+from app.config import Settings, get_settings
+from app.services.rate_limit import TokenBucket
+
+SendCall = Callable[[], Awaitable[Any]]
+
+MAX_RETRIES = 3
+MAX_CHAT_BUCKETS = 10_000
+
+
+class DeliveryStatus(str, Enum):
+    SENT = "sent"
+    BLOCKED = "blocked"
+    FAILED = "failed"
+
+
+@dataclass(slots=True)
+class FanOutReport:
+    """Filled in as deliveries finish, so a running fan-out can be polled for progress."""
+
+    sent: int = 0
+    failed: int = 0
+
+    @property
+    def done(self) -> int:
+        return self.sent + self.failed
+
+
+class NotificationDispatcher:
+    """Sends Telegram messages concurrently within global and per-chat rate limits.
+
+    `shared_limit` is a bucket taken in addition to the dispatcher's own, for
+    dispatchers that must stay inside another one's budget.
+    """
+
+    def __init__(
+        self,
+        concurrency: int,
+        global_rate: float,
+        chat_rate: float,
+        shared_limit: TokenBucket | None = None,
+    ):
+        self._semaphore = asyncio.Semaphore(concurrency)
+        self._global = TokenBucket(global_rate)
+        self._limits = (self._global,) if shared_limit is None else (self._global, shared_limit)
+        self._chat_rate = chat_rate
+        self._chats: OrderedDict[int, TokenBucket] = OrderedDict()
+        self._tasks: set[asyncio.Task[Any]] = set()
+
+    @property
+    def global_limit(self) -> TokenBucket:
+        return self._global
+
+    def _chat_bucket(self, chat_id: int) -> TokenBucket:
+        bucket = self._chats.get(chat_id)
+        if bucket is None:
+            bucket = TokenBucket(self._chat_rate, capacity=3)
+            self._chats[chat_id] = bucket
+            if len(self._chats) > MAX_CHAT_BUCKETS:
+                self._chats.popitem(last=False)
+        else:
+            self._chats.move_to_end(chat_id)
+        return bucket
+
+    async def _call(self, chat_id: int, call: SendCall) -> None:
+        for attempt in range(MAX_RETRIES + 1):
+            await self._chat_bucket(chat_id).acquire()
+            for limit in self._limits:
+                await limit.acquire()
+            try:
+                await call()
+                return
+            except TelegramRetryAfter as exc:
+                if attempt == MAX_RETRIES:
+                    raise
+                logging.warning("Flood control for chat %s, retry in %ss", chat_id, exc.retry_after)
+                # A 429 applies to the whole bot, not just this chat.
+                self._chat_bucket(chat_id).pause(exc.retry_after)
+                for limit in self._limits:
+                    limit.pause(exc.retry_after)
+
+    async def send(self, chat_id: int, calls: Sequence[SendCall]) -> DeliveryStatus:
+        """Runs the calls for one chat in order, stopping at the first failure."""
+        async with self._semaphore:
+            for call in calls:
+                try:
+                    await self._call(chat_id, call)
+                except TelegramForbiddenError as exc:
+                    logging.info("Chat %s is unreachable: %s", chat_id, exc)
+                    return DeliveryStatus.BLOCKED
+                except (TelegramAPIError, asyncio.TimeoutError) as exc:
+                    logging.warning("Failed to notify chat %s: %s", chat_id, exc)
+                    return DeliveryStatus.FAILED
+                except Exception as exc:
+                    logging.exception("Failed to notify chat %s: %s", chat_id, exc)
+                    return DeliveryStatus.FAILED
+        return DeliveryStatus.SENT
+
+    async def deliver(self, chat_id: int, calls: Sequence[SendCall]) -> bool:
+        return await self.send(chat_id, calls) is DeliveryStatus.SENT
+
+    async def send_all(
+        self,
+        chat_ids: Iterable[int],
+        make_calls: Callable[[int], Sequence[SendCall]],
+        report: FanOutReport | None = None,
+    ) -> FanOutReport:
+        report = report if report is not None else FanOutReport()
+
+        async def deliver(chat_id: int) -> None:
+            if await self.deliver(chat_id, make_calls(chat_id)):
+                report.sent += 1
+            else:
+                report.failed += 1
+
+        await asyncio.gather(*(deliver(chat_id) for chat_id in chat_ids))
+        if report.failed:
+            logging.warning("Notification fan-out: sent=%s failed=%s", report.sent, report.failed)
+        return report
+
+    def spawn(self, coro: Coroutine[Any, Any, Any]) -> asyncio.Task[Any]:
+        """Runs `coro` in the background; drain() waits for it on shutdown."""
+        task = asyncio.create_task(coro)
+        self._tasks.add(task)
+        task.add_done_callback(self._tasks.discard)
+        return task
+
+    def fan_out(
+        self,
+        chat_ids: Iterable[int],
+        make_calls: Callable[[int], Sequence[SendCall]],
+        report: FanOutReport | None = None,
+    ) -> asyncio.Task[FanOutReport]:
+        """Schedules send_all in the background so the caller can reply right away."""
+        return self.spawn(self.send_all(list(chat_ids), make_calls, report))
+
+    async def drain(self) -> None:
+        if not self._tasks:
+            return
+        _, pending = await asyncio.wait(set(self._tasks), timeout=get_settings().drain_timeout)
+        for task in pending:
+            task.cancel()
+
+
+def global_rate_share(settings: Settings, worker_index: int | None) -> float:
+    """This process's part of TELEGRAM_GLOBAL_RATE, which Telegram counts per bot.
+
+    With WORKERS=N the front-end (`worker_index` None) and each worker get an equal
+    share of what BROADCAST_RATE leaves; worker 0 runs broadcasts and gets that too.
+    """
+    if settings.workers <= 1:
+        return settings.telegram_global_rate
+    share = (settings.telegram_global_rate - settings.broadcast_rate) / (settings.workers + 1)
+    return share + settings.broadcast_rate if worker_index == 0 else share
+
+
+_settings = get_settings()
+# Single-process budget; multi-worker processes narrow it with `global_rate_share`.
+notifier = NotificationDispatcher(
+    concurrency=_settings.notify_concurrency,
+    global_rate=_settings.telegram_global_rate,
+    chat_rate=_settings.telegram_chat_rate,
+)
+
+
+def notify_access_granted(bot: Bot, user_ids: Iterable[int]) -> asyncio.Task[FanOutReport]:
+    return notifier.fan_out(
+        user_ids,
+        lambda user_id: (
+            lambda: bot.send_message(user_id, texts.ACCESS_TEXT, reply_markup=kb.user_kb(True)),
+        ),
+    )
@@ -1,14 +1,14 @@
 import asyncio
 import logging
-from dataclasses import dataclass
+from dataclasses import dataclass, field
 from enum import Enum
 from typing import Any
 
 import aiohttp
 
 from app.config import get_settings
-from app.cryptobot import get_shared_crypto_bot_client
-from app.database.models import User
+from app.cryptobot import CryptoBotUnavailable, get_shared_crypto_bot_client
+from app.database.repository import UserSnapshot
 import app.database.requests as rq
 
 CRYPTOBOT_ERRORS = (aiohttp.ClientError, asyncio.TimeoutError, RuntimeError)
@@ -19,6 +19,7 @@ class CryptoInvoiceStatus(str, Enum):
     ACTIVE = "active"
     CREATED = "created"
     ERROR = "error"
+    UNAVAILABLE = "unavailable"
 
 
 class CryptoCheckStatus(str, Enum):
@@ -29,6 +30,7 @@ class CryptoCheckStatus(str, Enum):
     INVALID_USER = "invalid_user"
     NOT_FOUND = "not_found"
     ERROR = "error"
+    UNAVAILABLE = "unavailable"
 
 
 class RubPaymentStatus(str, Enum):
@@ -60,6 +62,14 @@ class CryptoCheckResult:
     status: CryptoCheckStatus
 
 
+@dataclass(slots=True)
+class CryptoReconcileResult:
+    checked: int = 0
+    paid_user_ids: list[int] = field(default_factory=list)
+    expired: int = 0
+    failed: int = 0
+
+
 @dataclass(slots=True)
 class RubPaymentResult:
     status: RubPaymentStatus
@@ -78,8 +88,15 @@ class RubReceiptUploadResult:
 
 
 async def create_crypto_invoice(user_id: int, price: float) -> CryptoInvoiceResult:
+    try:
+        return await _create_crypto_invoice_result(user_id, price)
+    except CryptoBotUnavailable:
+        return CryptoInvoiceResult(status=CryptoInvoiceStatus.UNAVAILABLE)
+
+
+async def _create_crypto_invoice_result(user_id: int, price: float) -> CryptoInvoiceResult:
     user = await rq.get_user(user_id)
-    if user and (user.payment_status == "paid" or user.is_paid):
+    if user and user.has_access:
         return CryptoInvoiceResult(status=CryptoInvoiceStatus.PAID)
 
     if user and user.invoice_id and user.payment_status in (None, "pending"):
@@ -123,6 +140,13 @@ async def create_crypto_invoice(user_id: int, price: float) -> CryptoInvoiceResu
 
 
 async def check_crypto_invoice(user_id: int, invoice_id: str) -> CryptoCheckResult:
+    try:
+        return await _check_crypto_invoice_result(user_id, invoice_id)
+    except CryptoBotUnavailable:
+        return CryptoCheckResult(status=CryptoCheckStatus.UNAVAILABLE)
+
+
+async def _check_crypto_invoice_result(user_id: int, invoice_id: str) -> CryptoCheckResult:
     user = await rq.get_user(user_id)
     if not user or user.invoice_id != str(invoice_id):
         return CryptoCheckResult(status=CryptoCheckStatus.INVALID_USER)
@@ -148,9 +172,41 @@ async def check_crypto_invoice(user_id: int, invoice_id: str) -> CryptoCheckResu
     return CryptoCheckResult(status=CryptoCheckStatus.PENDING)
 
 
+async def confirm_crypto_invoice_paid(invoice_id: str) -> int | None:
+    """Applies a pushed `invoice_paid` event; returns the user id on first delivery only."""
+    user = await rq.mark_paid_by_invoice(invoice_id, "crypto")
+    return user.user_id if user else None
+
+
+async def reconcile_crypto_invoices(batch_size: int) -> CryptoReconcileResult:
+    result = CryptoReconcileResult()
+    after_id = 0
+    while True:
+        rows = await rq.get_pending_crypto_invoices(after_id, batch_size)
+        if not rows:
+            break
+        after_id = rows[-1][0]
+        invoices = await _fetch_crypto_invoices([invoice_id for _, _, invoice_id in rows])
+        if invoices is None:
+            break
+        result.checked += len(rows)
+
+        by_status: dict[str, list[str]] = {}
+        for invoice in invoices:
+            by_status.setdefault(invoice.get("status"), []).append(str(invoice.get("invoice_id")))
+        paid = await rq.mark_paid_by_invoices(by_status.get("paid", []), "crypto")
+        result.paid_user_ids.extend(user.user_id for user in paid)
+        result.expired += len(await rq.mark_expired_by_invoices(by_status.get("expired", [])))
+        result.failed += len(await rq.mark_failed_by_invoices(by_status.get("failed", [])))
+
+        if len(rows) < batch_size:
+            break
+    return result
+
+
 async def start_rub_payment(user_id: int) -> RubPaymentResult:
     user = await rq.get_user(user_id)
-    if user and (user.payment_status == "paid" or user.is_paid):
+    if user and user.has_access:
         return RubPaymentResult(status=RubPaymentStatus.ALREADY_PAID)
 
     rub_pay_url = _get_rub_pay_url()
@@ -200,6 +256,9 @@ async def _create_crypto_invoice(user_id: int, price: float) -> dict[str, Any] |
             description="Доступ к сервису",
             payload=str(user_id),
         )
+    except CryptoBotUnavailable as exc:
+        logging.warning("CryptoBot create_invoice unavailable: %s", exc)
+        raise
     except CRYPTOBOT_ERRORS as exc:
         logging.exception("CryptoBot create_invoice failed: %s", exc)
         return None
@@ -209,6 +268,9 @@ async def _fetch_crypto_invoice(invoice_id: str) -> dict[str, Any] | None:
     client = get_shared_crypto_bot_client()
     try:
         invoice = await client.get_invoice(invoice_id)
+    except CryptoBotUnavailable as exc:
+        logging.warning("CryptoBot get_invoice unavailable: %s", exc)
+        raise
     except CRYPTOBOT_ERRORS as exc:
         logging.exception("CryptoBot get_invoice failed: %s", exc)
         return None
@@ -217,6 +279,18 @@ async def _fetch_crypto_invoice(invoice_id: str) -> dict[str, Any] | None:
     return invoice
 
 
+async def _fetch_crypto_invoices(invoice_ids: list[str]) -> list[dict[str, Any]] | None:
+    client = get_shared_crypto_bot_client()
+    try:
+        return await client.get_invoices(invoice_ids)
+    except CryptoBotUnavailable as exc:
+        logging.warning("CryptoBot get_invoices unavailable: %s", exc)
+        return None
+    except CRYPTOBOT_ERRORS as exc:
+        logging.exception("CryptoBot get_invoices failed: %s", exc)
+        return None
+
+
 def _get_rub_pay_url() -> str | None:
     settings = get_settings()
     if not settings.rub_pay_url:
@@ -224,7 +298,7 @@ def _get_rub_pay_url() -> str | None:
     return settings.rub_pay_url
 
 
-def _user_needs_rub_receipt(user: User | None) -> bool:
+def _user_needs_rub_receipt(user: UserSnapshot | None) -> bool:
     if not user or user.paid_method != "rub":
         return False
     status = user.payment_status
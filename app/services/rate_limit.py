@@ -0,0 +1,96 @@
+from __future__ import annotations
+
+import asyncio
+from collections import OrderedDict
+from dataclasses import dataclass
+import time
+from typing import Protocol
+
+
+class TokenBucket:
+    """Classic token bucket: `rate` tokens per second, up to `capacity` burst."""
+
+    def __init__(self, rate: float, capacity: float | None = None):
+        self.rate = rate
+        self.capacity = capacity if capacity is not None else max(rate, 1.0)
+        self._tokens = self.capacity
+        self._updated = time.monotonic()
+        self._paused_until = 0.0
+
+    def set_rate(self, rate: float, capacity: float | None = None) -> None:
+        now = time.monotonic()
+        self._refill(now)
+        self.rate = rate
+        self.capacity = capacity if capacity is not None else max(rate, 1.0)
+        self._tokens = min(self._tokens, self.capacity)
+
+    def _refill(self, now: float) -> None:
+        elapsed = now - self._updated
+        if elapsed > 0:
+            self._tokens = min(self.capacity, self._tokens + elapsed * self.rate)
+            self._updated = now
+
+    def try_acquire(self, tokens: float = 1.0) -> float:
+        """Takes tokens if available; otherwise returns seconds to wait."""
+        now = time.monotonic()
+        if now < self._paused_until:
+            return self._paused_until - now
+        self._refill(now)
+        if self._tokens >= tokens:
+            self._tokens -= tokens
+            return 0.0
+        return (tokens - self._tokens) / self.rate
+
+    async def acquire(self, tokens: float = 1.0) -> None:
+        while (delay := self.try_acquire(tokens)) > 0:
+            await asyncio.sleep(delay)
+
+    def pause(self, seconds: float) -> None:
+        self._paused_until = max(self._paused_until, time.monotonic() + seconds)
+
+
+@dataclass(frozen=True, slots=True)
+class RateLimit:
+    """Per-user handler limit, set with `flags={"rate_limit": RateLimit(...)}`.
+
+    Handlers sharing a `key` share one bucket; by default each handler has its own.
+    """
+
+    rate: float
+    burst: float = 1.0
+    key: str | None = None
+
+
+class ThrottleStorage(Protocol):
+    """Where per-user buckets live; share one backend to limit across processes."""
+
+    async def consume(self, key: str, rate: float, burst: float) -> float:
+        """Takes a token from `key`; returns 0 when allowed, otherwise seconds to wait."""
+
+
+class MemoryThrottleStorage:
+    """Token buckets kept as (tokens, updated_at) tuples in a bounded LRU dict."""
+
+    def __init__(self, max_keys: int):
+        self.max_keys = max_keys
+        self._buckets: OrderedDict[str, tuple[float, float]] = OrderedDict()
+
+    async def consume(self, key: str, rate: float, burst: float) -> float:
+        now = time.monotonic()
+        bucket = self._buckets.get(key)
+        if bucket is None:
+            tokens = burst
+        else:
+            tokens = min(burst, bucket[0] + (now - bucket[1]) * rate)
+            self._buckets.move_to_end(key)
+        if tokens < 1.0:
+            self._buckets[key] = (tokens, now)
+            return (1.0 - tokens) / rate
+        self._buckets[key] = (tokens - 1.0, now)
+        # Evicting the least recently used bucket only forgets a user who went quiet.
+        while len(self._buckets) > self.max_keys:
+            self._buckets.popitem(last=False)
+        return 0.0
+
+    def __len__(self) -> int:
+        return len(self._buckets)
@@ -0,0 +1,66 @@
+from __future__ import annotations
+
+import asyncio
+import logging
+
+from aiogram import Bot
+
+from app.config import get_settings
+from app.services.notifications import notify_access_granted
+from app.services.payments import reconcile_crypto_invoices
+
+
+class InvoiceReconciler:
+    """Periodically settles pending crypto invoices without waiting for the user."""
+
+    def __init__(self, interval: float, batch_size: int):
+        self.interval = interval
+        self.batch_size = batch_size
+        self._task: asyncio.Task[None] | None = None
+
+    async def start(self, bot: Bot) -> None:
+        settings = get_settings()
+        if self.interval <= 0 or not settings.cryptobot_token:
+            return
+        if self._task is None or self._task.done():
+            self._task = asyncio.create_task(self._run(bot))
+
+    async def stop(self) -> None:
+        if self._task is None:
+            return
+        self._task.cancel()
+        try:
+            await self._task
+        except asyncio.CancelledError:
+            pass
+        self._task = None
+
+    async def run_once(self, bot: Bot) -> None:
+        result = await reconcile_crypto_invoices(self.batch_size)
+        if result.paid_user_ids:
+            notify_access_granted(bot, result.paid_user_ids)
+        if result.checked:
+            logging.info(
+                "Reconciled %s crypto invoices: paid=%s expired=%s failed=%s",
+                result.checked,
+                len(result.paid_user_ids),
+                result.expired,
+                result.failed,
+            )
+
+    async def _run(self, bot: Bot) -> None:
+        while True:
+            await asyncio.sleep(self.interval)
+            try:
+                await self.run_once(bot)
+            except asyncio.CancelledError:
+                raise
+            except Exception as exc:
+                logging.exception("Invoice reconciliation failed: %s", exc)
+
+
+_settings = get_settings()
+reconciler = InvoiceReconciler(
+    interval=_settings.reconcile_interval,
+    batch_size=_settings.reconcile_batch_size,
+)
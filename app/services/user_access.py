@@ -1,6 +1,6 @@
 from aiogram.types import CallbackQuery, Message
 
-import app.database.requests as rq
+from app.database.repository import UserSnapshot
 from app.routers.admin_utils import is_admin, is_staff
 
 
@@ -18,20 +18,19 @@ def is_owner_user(user_id: int | None) -> bool:
     return is_admin(user_id)
 
 
-async def is_staff_user(user_id: int | None) -> bool:
-    if user_id is None:
+def is_staff_user(user: UserSnapshot | None) -> bool:
+    if user is None:
         return False
-    return await is_staff(user_id)
+    return is_staff(user.user_id)
 
 
-async def is_banned_user(user_id: int | None) -> bool:
-    if user_id is None:
+def is_banned_user(user: UserSnapshot | None) -> bool:
+    if user is None:
         return False
-    return await rq.is_user_banned(user_id)
+    return user.is_banned
 
 
-async def is_paid_user(user_id: int | None) -> bool:
-    if user_id is None:
+def is_paid_user(user: UserSnapshot | None) -> bool:
+    if user is None:
         return False
-    user = await rq.get_user(user_id)
-    return bool(user and (user.payment_status == "paid" or user.is_paid))
+    return user.has_access
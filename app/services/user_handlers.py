@@ -2,15 +2,17 @@ from aiogram.types import CallbackQuery, Message, ReplyKeyboardRemove
 
 from app import keyboards as kb
 from app import texts
+from app.database.registration import registration_queue
+from app.database.repository import UserSnapshot
 from app.routers.admin_utils import get_staff_ids
 from app.services.user_access import (
-    get_message_user_id,
     is_banned_user,
     is_owner_user,
     is_paid_user,
     is_staff_user,
 )
 import app.database.requests as rq
+from app.services.notifications import notifier
 from app.services.payments import (
     CryptoCheckStatus,
     CryptoInvoiceStatus,
@@ -25,101 +27,96 @@ from app.services.payments import (
 )
 
 
-async def _reply_admin(message: Message, user_id: int | None) -> bool:
-    if user_id is None:
+async def _reply_admin(message: Message, user: UserSnapshot | None) -> bool:
+    if user is None:
         return False
-    if await is_staff_user(user_id):
-        reply_kb = kb.admin_kb_owner if is_owner_user(user_id) else kb.admin_kb_staff
+    if is_staff_user(user):
+        reply_kb = kb.admin_kb_owner if is_owner_user(user.user_id) else kb.admin_kb_staff
         await message.answer(texts.ADMIN_WELCOME_TEXT, reply_markup=reply_kb)
         return True
     return False
 
 
-async def _reply_banned(message: Message, user_id: int | None) -> bool:
-    if user_id is None:
+async def _reply_banned(message: Message, user: UserSnapshot | None) -> bool:
+    if user is None:
         return False
-    if await is_banned_user(user_id):
+    if is_banned_user(user):
         await message.answer(texts.BANNED_TEXT, reply_markup=ReplyKeyboardRemove())
         return True
     return False
 
 
-async def handle_start(message: Message) -> None:
-    user_id = get_message_user_id(message)
-    if user_id is None:
+async def handle_start(message: Message, user: UserSnapshot | None) -> None:
+    if user is None:
         return
-    await rq.set_user(user_id)
-    if await _reply_admin(message, user_id):
+    if not user.registered:
+        await registration_queue.register(user.user_id)
+    if await _reply_admin(message, user):
         return
-    if await _reply_banned(message, user_id):
+    if await _reply_banned(message, user):
         return
-    if await is_paid_user(user_id):
+    if is_paid_user(user):
         await message.answer(texts.ACCESS_TEXT, reply_markup=kb.user_kb(True))
         return
     await message.answer(texts.WELCOME_TEXT, reply_markup=kb.user_kb(False))
 
 
-async def handle_help(message: Message) -> None:
-    user_id = get_message_user_id(message)
-    if user_id is None:
+async def handle_help(message: Message, user: UserSnapshot | None) -> None:
+    if user is None:
         return
-    if await _reply_admin(message, user_id):
+    if await _reply_admin(message, user):
         return
-    if await _reply_banned(message, user_id):
+    if await _reply_banned(message, user):
         return
-    is_paid = await is_paid_user(user_id)
+    is_paid = is_paid_user(user)
     await message.answer(texts.HELP_TEXT, reply_markup=kb.user_kb(is_paid))
 
 
-async def handle_pay_button(message: Message) -> None:
-    user_id = get_message_user_id(message)
-    if user_id is None:
+async def handle_pay_button(message: Message, user: UserSnapshot | None) -> None:
+    if user is None:
         return
-    if await _reply_admin(message, user_id):
+    if await _reply_admin(message, user):
         return
-    if await _reply_banned(message, user_id):
+    if await _reply_banned(message, user):
         return
-    if await is_paid_user(user_id):
+    if is_paid_user(user):
         await message.answer(texts.ACCESS_TEXT, reply_markup=kb.user_kb(True))
         return
     await message.answer(texts.PAID_TEXT, reply_markup=kb.payment_kb)
 
 
-async def handle_support(message: Message) -> None:
-    user_id = get_message_user_id(message)
-    if user_id is None:
+async def handle_support(message: Message, user: UserSnapshot | None) -> None:
+    if user is None:
         return
-    if await _reply_admin(message, user_id):
+    if await _reply_admin(message, user):
         return
-    if await _reply_banned(message, user_id):
+    if await _reply_banned(message, user):
         return
-    is_paid = await is_paid_user(user_id)
+    is_paid = is_paid_user(user)
     await message.answer(texts.SUPPORT_TEXT, reply_markup=kb.user_kb(is_paid))
 
 
-async def handle_info(message: Message) -> None:
-    user_id = get_message_user_id(message)
-    if user_id is None:
+async def handle_info(message: Message, user: UserSnapshot | None) -> None:
+    if user is None:
         return
-    if await _reply_admin(message, user_id):
+    if await _reply_admin(message, user):
         return
-    if await _reply_banned(message, user_id):
+    if await _reply_banned(message, user):
         return
-    if not await is_paid_user(user_id):
+    if not is_paid_user(user):
         await message.answer(texts.DEFAULT_TEXT, reply_markup=kb.user_kb(False))
         return
     await message.answer(texts.ACCESS_TEXT, reply_markup=kb.user_kb(True))
 
 
-async def handle_any_message(message: Message) -> None:
-    user_id = get_message_user_id(message)
-    if user_id is None:
+async def handle_any_message(message: Message, user: UserSnapshot | None) -> None:
+    if user is None:
         return
-    if await _reply_admin(message, user_id):
+    if await _reply_admin(message, user):
         return
-    if await _reply_banned(message, user_id):
+    if await _reply_banned(message, user):
         return
-    is_paid = await is_paid_user(user_id)
+    is_paid = is_paid_user(user)
     await message.answer(texts.DEFAULT_TEXT, reply_markup=kb.user_kb(is_paid))
 
 
@@ -129,9 +126,9 @@ async def _safe_answer(callback: CallbackQuery, text: str, reply_markup=None) ->
     await callback.message.answer(text, reply_markup=reply_markup)
 
 
-async def handle_pay_usdt(callback: CallbackQuery) -> None:
+async def handle_pay_usdt(callback: CallbackQuery, user: UserSnapshot | None) -> None:
     await callback.answer()
-    if await rq.is_user_banned(callback.from_user.id):
+    if is_banned_user(user):
         await _safe_answer(callback, texts.BANNED_TEXT, reply_markup=ReplyKeyboardRemove())
         return
     result = await create_crypto_invoice(callback.from_user.id, texts.PRICE_USDT)
@@ -141,6 +138,9 @@ async def handle_pay_usdt(callback: CallbackQuery) -> None:
     if result.status == CryptoInvoiceStatus.ERROR:
         await _safe_answer(callback, texts.PAYMENT_ERROR_TEXT)
         return
+    if result.status == CryptoInvoiceStatus.UNAVAILABLE:
+        await _safe_answer(callback, texts.PAYMENT_UNAVAILABLE_TEXT)
+        return
     if result.status == CryptoInvoiceStatus.ACTIVE and result.invoice_id and result.pay_url:
         await _safe_answer(
             callback,
@@ -162,9 +162,9 @@ async def handle_pay_usdt(callback: CallbackQuery) -> None:
     )
 
 
-async def handle_check_invoice(callback: CallbackQuery) -> None:
+async def handle_check_invoice(callback: CallbackQuery, user: UserSnapshot | None) -> None:
     await callback.answer()
-    if await rq.is_user_banned(callback.from_user.id):
+    if is_banned_user(user):
         await _safe_answer(callback, texts.BANNED_TEXT, reply_markup=ReplyKeyboardRemove())
         return
     invoice_id = callback.data.split(":", 1)[1]
@@ -172,6 +172,9 @@ async def handle_check_invoice(callback: CallbackQuery) -> None:
     if result.status == CryptoCheckStatus.INVALID_USER:
         await _safe_answer(callback, texts.PAYMENT_ERROR_TEXT)
         return
+    if result.status == CryptoCheckStatus.UNAVAILABLE:
+        await _safe_answer(callback, texts.PAYMENT_UNAVAILABLE_TEXT)
+        return
     if result.status in {CryptoCheckStatus.ERROR, CryptoCheckStatus.NOT_FOUND}:
         await _safe_answer(callback, texts.PAYMENT_ERROR_TEXT)
         return
@@ -200,9 +203,9 @@ def _format_sender_info(message: Message) -> str:
     )
 
 
-async def handle_pay_rub(callback: CallbackQuery) -> None:
+async def handle_pay_rub(callback: CallbackQuery, user: UserSnapshot | None) -> None:
     await callback.answer()
-    if await rq.is_user_banned(callback.from_user.id):
+    if is_banned_user(user):
         await _safe_answer(callback, texts.BANNED_TEXT, reply_markup=ReplyKeyboardRemove())
         return
     result = await start_rub_payment(callback.from_user.id)
@@ -221,9 +224,9 @@ async def handle_pay_rub(callback: CallbackQuery) -> None:
     )
 
 
-async def handle_rub_receipt_sent(callback: CallbackQuery) -> None:
+async def handle_rub_receipt_sent(callback: CallbackQuery, user: UserSnapshot | None) -> None:
     await callback.answer()
-    if await rq.is_user_banned(callback.from_user.id):
+    if is_banned_user(user):
         await _safe_answer(callback, texts.BANNED_TEXT, reply_markup=ReplyKeyboardRemove())
         return
     result = build_rub_receipt_sent(
@@ -232,36 +235,45 @@ async def handle_rub_receipt_sent(callback: CallbackQuery) -> None:
         callback.from_user.last_name,
         callback.from_user.username,
     )
-    staff_ids = await get_staff_ids()
+    staff_ids = get_staff_ids()
     if result.status == RubReceiptSentStatus.DISABLED or not staff_ids:
         await _safe_answer(callback, texts.PAYMENT_RUB_DISABLED_TEXT)
         return
 
     await rq.mark_rub_receipt_sent(callback.from_user.id)
-
-    for staff_id in staff_ids:
-        await callback.bot.send_message(
-            staff_id,
-            result.message or "",
-            reply_markup=kb.admin_action_kb(callback.from_user.id),
-        )
     await _safe_answer(callback, texts.RECEIPT_SENT_TEXT)
 
+    bot = callback.bot
+    staff_text = result.message or ""
+    action_kb = kb.admin_action_kb(callback.from_user.id)
+    notifier.fan_out(
+        staff_ids,
+        lambda staff_id: (
+            lambda: bot.send_message(staff_id, staff_text, reply_markup=action_kb),
+        ),
+    )
+
 
-async def handle_receipt_message(message: Message) -> None:
-    if await rq.is_user_banned(message.from_user.id):
+async def handle_receipt_message(message: Message, user: UserSnapshot | None) -> None:
+    if is_banned_user(user):
         await message.answer(texts.BANNED_TEXT, reply_markup=ReplyKeyboardRemove())
         return
     result = await check_rub_receipt_upload(message.from_user.id)
     if result.status == RubReceiptUploadStatus.IGNORED:
         return
 
-    staff_ids = await get_staff_ids()
+    staff_ids = get_staff_ids()
     if result.status == RubReceiptUploadStatus.DISABLED or not staff_ids:
         await message.answer(texts.PAYMENT_RUB_DISABLED_TEXT)
         return
 
-    for staff_id in staff_ids:
-        await message.bot.send_message(staff_id, _format_sender_info(message))
-        await message.copy_to(staff_id)
     await message.answer(texts.RECEIPT_RECEIVED_TEXT, reply_markup=kb.receipt_sent_kb())
+
+    sender_info = _format_sender_info(message)
+    notifier.fan_out(
+        staff_ids,
+        lambda staff_id: (
+            lambda: message.bot.send_message(staff_id, sender_info),
+            lambda: message.copy_to(staff_id),
+        ),
+    )
@@ -10,18 +10,36 @@ TEXT_OVERRIDE_KEYS = (
     "PAYMENT_EXPIRED_TEXT",
     "PAYMENT_FAILED_TEXT",
     "PAYMENT_ERROR_TEXT",
+    "PAYMENT_UNAVAILABLE_TEXT",
     "PAYMENT_RUB_DISABLED_TEXT",
     "RECEIPT_RECEIVED_TEXT",
     "RECEIPT_SENT_TEXT",
     "DEFAULT_TEXT",
     "ADMIN_WELCOME_TEXT",
     "ADMIN_ONLY_TEXT",
+    "THROTTLED_TEXT",
     "APPROVE_USAGE_TEXT",
     "DENY_USAGE_TEXT",
     "ADMIN_ALREADY_HANDLED_TEXT",
     "ADMIN_BANNED_USER_TEXT",
     "APPROVE_SUCCESS_TEXT",
     "DENY_SUCCESS_TEXT",
+    "RECEIPTS_EMPTY_TEXT",
+    "RECEIPTS_HEADER_TEXT",
+    "RECEIPTS_NEXT_TEXT",
+    "PENDING_EMPTY_TEXT",
+    "PENDING_HEADER_TEXT",
+    "PENDING_STATUS_PENDING",
+    "PENDING_STATUS_RECEIPT_SENT",
+    "BUTTON_PENDING_PREV",
+    "BUTTON_PENDING_NEXT",
+    "BUTTON_PENDING_REFRESH",
+    "BULK_USAGE_TEXT",
+    "BULK_DECIDED_TEXT",
+    "BULK_SKIPPED_TEXT",
+    "BULK_NOTIFY_PROGRESS_TEXT",
+    "BULK_NOTIFIED_TEXT",
+    "BULK_NOT_DELIVERED_TEXT",
     "USER_APPROVED_TEXT",
     "USER_DENIED_TEXT",
     "USER_NOT_FOUND_TEXT",
@@ -30,6 +48,14 @@ TEXT_OVERRIDE_KEYS = (
     "BAN_SUCCESS_TEXT",
     "UNBAN_SUCCESS_TEXT",
     "BANNED_TEXT",
+    "BROADCAST_USAGE_TEXT",
+    "BROADCAST_STARTED_TEXT",
+    "BROADCAST_RUNNING_TEXT",
+    "BROADCAST_NONE_TEXT",
+    "BROADCAST_TITLE_TEXT",
+    "BROADCAST_SENT_TEXT",
+    "BROADCAST_FAILED_TEXT",
+    "BROADCAST_BLOCKED_TEXT",
     "ADMIN_ADD_USAGE_TEXT",
     "ADMIN_REMOVE_USAGE_TEXT",
     "ADMIN_ADDED_TEXT",
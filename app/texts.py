@@ -63,6 +63,8 @@ PAYMENT_FAILED_TEXT = "Платеж не прошел. Попробуй созд
 
 PAYMENT_ERROR_TEXT = "Не удалось проверить оплату. Попробуй позже."
 
+PAYMENT_UNAVAILABLE_TEXT = "Оплата криптовалютой временно недоступна. Попробуй через пару минут."
+
 PAYMENT_RUB_DISABLED_TEXT = "Оплата в рублях временно недоступна. Попробуй позже."
 
 RECEIPT_RECEIVED_TEXT = "Чек получен. Нажми кнопку «Я отправил чек»."
@@ -74,6 +76,7 @@ DEFAULT_TEXT = "Для работы с ботом используй кнопк
 ADMIN_WELCOME_TEXT = "Добро пожаловать в админ панель"
 
 ADMIN_ONLY_TEXT = "Команда доступна только администратору."
+THROTTLED_TEXT = "Слишком часто. Подожди пару секунд."
 
 APPROVE_USAGE_TEXT = "Использование: /approve <user_id>"
 
@@ -92,6 +95,28 @@ APPROVE_SUCCESS_TEXT = "Доступ выдан."
 
 DENY_SUCCESS_TEXT = "Оплата отклонена."
 
+RECEIPTS_EMPTY_TEXT = "Нет чеков, ожидающих проверки."
+RECEIPTS_HEADER_TEXT = "Чеки на проверке (user_id · создан):"
+RECEIPTS_NEXT_TEXT = "Следующая страница:"
+
+PENDING_EMPTY_TEXT = "Нет оплат, ожидающих решения."
+PENDING_HEADER_TEXT = "Ожидают решения:"
+PENDING_STATUS_PENDING = "ждет оплаты"
+PENDING_STATUS_RECEIPT_SENT = "чек отправлен"
+BUTTON_PENDING_PREV = "◀️ Назад"
+BUTTON_PENDING_NEXT = "Вперед ▶️"
+BUTTON_PENDING_REFRESH = "🔄 Обновить"
+
+BULK_USAGE_TEXT = (
+    "Использование: /approve_many <user_id> <user_id> ...\n"
+    "или /deny_many <user_id> <user_id> ..."
+)
+BULK_DECIDED_TEXT = "Обработано"
+BULK_SKIPPED_TEXT = "Пропущено (уже обработаны или в бане)"
+BULK_NOTIFY_PROGRESS_TEXT = "Отправляю уведомления..."
+BULK_NOTIFIED_TEXT = "Уведомлено"
+BULK_NOT_DELIVERED_TEXT = "Не доставлено"
+
 USER_APPROVED_TEXT = (
     "✅ Оплата подтверждена!\n\n"
     "Теперь переходи и устанавливай сервис:\n"
@@ -108,6 +133,18 @@ BAN_SUCCESS_TEXT = "Пользователь заблокирован."
 UNBAN_SUCCESS_TEXT = "Пользователь разблокирован."
 BANNED_TEXT = "Доступ ограничен. Обратись в поддержку."
 
+BROADCAST_USAGE_TEXT = (
+    "Использование: /broadcast <all|paid|unpaid> <текст>\n"
+    "all — все, кроме забаненных; paid — оплатившие; unpaid — не оплатившие."
+)
+BROADCAST_STARTED_TEXT = "Рассылка запущена"
+BROADCAST_RUNNING_TEXT = "Уже идет другая рассылка: /broadcast_status, /broadcast_cancel"
+BROADCAST_NONE_TEXT = "Активных рассылок нет."
+BROADCAST_TITLE_TEXT = "Рассылка"
+BROADCAST_SENT_TEXT = "Доставлено"
+BROADCAST_FAILED_TEXT = "Ошибки"
+BROADCAST_BLOCKED_TEXT = "Заблокировали бота"
+
 
 BUTTON_PAY = f"💳 Оплатить {PRICE_TEXT}"
 
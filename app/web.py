@@ -0,0 +1,140 @@
+from __future__ import annotations
+
+import asyncio
+import hmac
+import json
+import logging
+import signal
+
+from aiogram import Bot, Dispatcher
+from aiogram.webhook.aiohttp_server import SimpleRequestHandler, setup_application
+from aiohttp import web
+from prometheus_client import CONTENT_TYPE_LATEST, generate_latest
+
+from app.config import Settings, get_settings
+from app.cryptobot import verify_webhook_signature
+from app.services.notifications import notify_access_granted
+from app.services.payments import confirm_crypto_invoice_paid
+from app.workers import WorkerPool
+
+
+class DrainingRequestHandler(SimpleRequestHandler):
+    """Waits for in-flight updates on shutdown; the bot session is closed by main()."""
+
+    async def close(self) -> None:
+        tasks = set(self._background_feed_update_tasks)
+        if not tasks:
+            return
+        logging.info("Waiting for %s in-flight updates", len(tasks))
+        _, pending = await asyncio.wait(tasks, timeout=get_settings().drain_timeout)
+        if pending:
+            logging.warning("%s updates did not finish before shutdown", len(pending))
+
+
+async def _health(request: web.Request) -> web.Response:
+    return web.json_response({"status": "ok"})
+
+
+async def _metrics(request: web.Request) -> web.Response:
+    return web.Response(body=generate_latest(), headers={"Content-Type": CONTENT_TYPE_LATEST})
+
+
+def create_web_app() -> web.Application:
+    app = web.Application()
+    app.router.add_get("/healthz", _health)
+    return app
+
+
+def create_metrics_app() -> web.Application:
+    """Separate app so /metrics can stay on a local interface."""
+    app = web.Application()
+    app.router.add_get("/metrics", _metrics)
+    return app
+
+
+def setup_telegram_webhook(
+    app: web.Application,
+    dp: Dispatcher,
+    bot: Bot,
+    settings: Settings,
+) -> None:
+    handler = DrainingRequestHandler(
+        dispatcher=dp,
+        bot=bot,
+        secret_token=settings.webhook_secret,
+    )
+    handler.register(app, path=settings.webhook_path)
+    setup_application(app, dp, bot=bot)
+
+
+def setup_sharded_webhook(app: web.Application, pool: WorkerPool, settings: Settings) -> None:
+    """Multi-worker front-end: acknowledges at once and hands the raw update to its shard."""
+    secret = settings.webhook_secret or ""
+
+    async def handle(request: web.Request) -> web.Response:
+        token = request.headers.get("X-Telegram-Bot-Api-Secret-Token", "")
+        if secret and not hmac.compare_digest(token, secret):
+            return web.Response(body="Unauthorized", status=401)
+        try:
+            update = await request.json()
+        except ValueError:
+            return web.Response(body="Bad Request", status=400)
+        pool.dispatch(update)
+        return web.json_response({})
+
+    app.router.add_post(settings.webhook_path, handle)
+
+
+def setup_cryptobot_webhook(app: web.Application, bot: Bot, settings: Settings) -> None:
+    token = settings.cryptobot_token or ""
+
+    async def handle(request: web.Request) -> web.Response:
+        body = await request.read()
+        signature = request.headers.get("crypto-pay-api-signature", "")
+        if not token or not verify_webhook_signature(token, body, signature):
+            return web.Response(body="Unauthorized", status=401)
+        try:
+            update = json.loads(body)
+        except ValueError:
+            return web.Response(body="Bad Request", status=400)
+
+        if update.get("update_type") != "invoice_paid":
+            return web.json_response({"ok": True})
+        invoice_id = (update.get("payload") or {}).get("invoice_id")
+        if invoice_id is None:
+            return web.json_response({"ok": True})
+        user_id = await confirm_crypto_invoice_paid(str(invoice_id))
+        if user_id is not None:
+            notify_access_granted(bot, [user_id])
+        return web.json_response({"ok": True})
+
+    app.router.add_post(settings.cryptobot_webhook_path, handle)
+
+
+async def start_web_app(app: web.Application, host: str, port: int) -> web.AppRunner:
+    runner = web.AppRunner(app)
+    await runner.setup()
+    site = web.TCPSite(runner, host, port)
+    await site.start()
+    logging.info("Web server listening on %s:%s", host, port)
+    return runner
+
+
+def stop_on_signals() -> asyncio.Event:
+    stop = asyncio.Event()
+    loop = asyncio.get_running_loop()
+    for sig in (signal.SIGINT, signal.SIGTERM):
+        try:
+            loop.add_signal_handler(sig, stop.set)
+        except NotImplementedError:
+            pass
+    return stop
+
+
+async def run_web_app(app: web.Application, host: str, port: int) -> None:
+    stop = stop_on_signals()
+    runner = await start_web_app(app, host, port)
+    try:
+        await stop.wait()
+    finally:
+        await runner.cleanup()
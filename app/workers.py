@@ -0,0 +1,251 @@
+from __future__ import annotations
+
+import asyncio
+import logging
+import multiprocessing
+from multiprocessing.context import SpawnProcess
+from multiprocessing.queues import Queue
+import queue
+import time
+from typing import Any, Callable
+
+import aiohttp
+from aiogram import Bot, Dispatcher
+
+from app.config import get_settings
+from app.database.cache import apply_change
+from app.services.broadcast import broadcaster
+
+POLL_TIMEOUT = 30
+POLL_RETRY_DELAY = 5
+WATCH_INTERVAL = 1
+
+# Worker inbox messages: ("update", raw update dict), ("cache", kind, user_id),
+# ("broadcast",) for worker 0, or STOP.
+STOP = None
+
+WorkerQueue = Queue
+WorkerTarget = Callable[[int, list[WorkerQueue]], None]
+
+
+def update_user_id(update: dict[str, Any]) -> int | None:
+    """The sender of a raw update, falling back to its chat."""
+    for key, event in update.items():
+        if key == "update_id" or not isinstance(event, dict):
+            continue
+        user = event.get("from") or event.get("user")
+        if isinstance(user, dict) and "id" in user:
+            return user["id"]
+        chat = event.get("chat") or (event.get("message") or {}).get("chat")
+        if isinstance(chat, dict) and "id" in chat:
+            return chat["id"]
+    return None
+
+
+def shard_for(update: dict[str, Any], workers: int) -> int:
+    user_id = update_user_id(update)
+    return user_id % workers if user_id is not None else 0
+
+
+def _publish(queues: list[WorkerQueue], kind: str, user_id: int, skip: int | None = None) -> None:
+    for index, inbox in enumerate(queues):
+        if index != skip:
+            inbox.put(("cache", kind, user_id))
+
+
+class WorkerPool:
+    """Front-end side: one spawned process and one inbox per shard.
+
+    A shard's inbox outlives its process, so a crashed worker is restarted
+    and picks up the updates queued for it meanwhile.
+    """
+
+    def __init__(self, count: int, target: WorkerTarget):
+        self._context = multiprocessing.get_context("spawn")
+        self._target = target
+        self.queues: list[WorkerQueue] = [self._context.Queue() for _ in range(count)]
+        self._processes: list[SpawnProcess | None] = [None] * count
+        self._watcher: asyncio.Task[None] | None = None
+        self._stopping = False
+
+    def _spawn(self, index: int) -> None:
+        process = self._context.Process(
+            target=self._target,
+            args=(index, self.queues),
+            name=f"bot-worker-{index}",
+        )
+        process.start()
+        self._processes[index] = process
+
+    def start(self) -> None:
+        for index in range(len(self.queues)):
+            self._spawn(index)
+        self._watcher = asyncio.create_task(self._watch())
+        logging.info("Started %s worker processes", len(self.queues))
+
+    async def _watch(self) -> None:
+        while not self._stopping:
+            await asyncio.sleep(WATCH_INTERVAL)
+            for index, process in enumerate(self._processes):
+                if process is not None and not process.is_alive() and not self._stopping:
+                    logging.error("Worker %s exited with %s, restarting", index, process.exitcode)
+                    self._spawn(index)
+
+    def dispatch(self, update: dict[str, Any]) -> None:
+        self.queues[shard_for(update, len(self.queues))].put(("update", update))
+
+    def publish(self, kind: str, user_id: int) -> None:
+        _publish(self.queues, kind, user_id)
+
+    async def stop(self, timeout: float | None = None) -> None:
+        """Queued updates are handled before STOP; workers still running after `timeout` are killed."""
+        if timeout is None:
+            # A worker drains its updates, then the notifier, then flushes registrations.
+            timeout = 2 * get_settings().drain_timeout + 10
+        self._stopping = True
+        if self._watcher is not None:
+            self._watcher.cancel()
+        for inbox in self.queues:
+            inbox.put(STOP)
+        loop = asyncio.get_running_loop()
+        deadline = time.monotonic() + timeout
+        for index, process in enumerate(self._processes):
+            if process is None:
+                continue
+            await loop.run_in_executor(None, process.join, max(deadline - time.monotonic(), 0))
+            if process.is_alive():
+                logging.warning("Worker %s did not drain in time, killing it", index)
+                process.kill()
+
+
+class Worker:
+    """Worker side: handles one shard, keeping each user's updates in arrival order."""
+
+    def __init__(self, index: int, queues: list[WorkerQueue]):
+        self.index = index
+        self.queues = queues
+        self._inbox = queues[index]
+        self._tails: dict[int, asyncio.Task[None]] = {}
+        self._tasks: set[asyncio.Task[None]] = set()
+
+    def publish(self, kind: str, user_id: int) -> None:
+        _publish(self.queues, kind, user_id, skip=self.index)
+
+    def hand_off_broadcast(self) -> None:
+        """Worker 0 holds the broadcast budget, so it runs broadcasts launched elsewhere."""
+        self.queues[0].put(("broadcast",))
+
+    def _receive(self) -> Any:
+        while True:
+            try:
+                return self._inbox.get(timeout=WATCH_INTERVAL)
+            except queue.Empty:
+                parent = multiprocessing.parent_process()
+                if parent is not None and not parent.is_alive():
+                    logging.error("Front-end process is gone, worker %s stops", self.index)
+                    return STOP
+
+    async def _feed(
+        self,
+        dp: Dispatcher,
+        bot: Bot,
+        update: dict[str, Any],
+        previous: asyncio.Task[None] | None,
+    ) -> None:
+        if previous is not None:
+            await asyncio.wait([previous])
+        try:
+            await dp.feed_raw_update(bot, update)
+        except Exception as exc:
+            logging.exception("Update %s failed: %s", update.get("update_id"), exc)
+
+    def _release(self, user_id: int, task: asyncio.Task[None]) -> None:
+        if self._tails.get(user_id) is task:
+            del self._tails[user_id]
+
+    def _track(self, coro) -> asyncio.Task[None]:
+        task = asyncio.create_task(coro)
+        self._tasks.add(task)
+        task.add_done_callback(self._tasks.discard)
+        return task
+
+    def _schedule(self, dp: Dispatcher, bot: Bot, update: dict[str, Any]) -> None:
+        user_id = update_user_id(update)
+        previous = self._tails.get(user_id) if user_id is not None else None
+        task = self._track(self._feed(dp, bot, update, previous))
+        if user_id is not None:
+            self._tails[user_id] = task
+            task.add_done_callback(lambda done: self._release(user_id, done))
+
+    async def drain(self) -> None:
+        if not self._tasks:
+            return
+        logging.info("Worker %s waiting for %s in-flight updates", self.index, len(self._tasks))
+        _, pending = await asyncio.wait(set(self._tasks), timeout=get_settings().drain_timeout)
+        if pending:
+            logging.warning("Worker %s: %s updates did not finish before shutdown", self.index, len(pending))
+
+    async def run(self, dp: Dispatcher, bot: Bot) -> None:
+        await dp.emit_startup(bot=bot, dispatcher=dp)
+        logging.info("Worker %s is ready", self.index)
+        loop = asyncio.get_running_loop()
+        try:
+            while True:
+                message = await loop.run_in_executor(None, self._receive)
+                if message is STOP:
+                    break
+                if message[0] == "update":
+                    self._schedule(dp, bot, message[1])
+                elif message[0] == "broadcast":
+                    self._track(broadcaster.start(bot))
+                else:
+                    apply_change(message[1], message[2])
+            await self.drain()
+        finally:
+            await dp.emit_shutdown(bot=bot, dispatcher=dp)
+
+
+async def poll_updates(bot: Bot, pool: WorkerPool, allowed_updates: list[str], stop: asyncio.Event) -> None:
+    """Long polling that forwards raw updates, leaving parsing to the workers."""
+    url = bot.session.api.api_url(token=bot.token, method="getUpdates")
+    timeout = aiohttp.ClientTimeout(total=POLL_TIMEOUT + 10)
+    offset = 0
+    async with aiohttp.ClientSession(timeout=timeout) as session:
+
+        async def get_updates(poll_timeout: int) -> list[dict[str, Any]]:
+            payload = {"offset": offset, "timeout": poll_timeout, "allowed_updates": allowed_updates}
+            async with session.post(url, json=payload) as response:
+                data = await response.json()
+            if not data.get("ok"):
+                raise RuntimeError(data.get("description", "getUpdates failed"))
+            return data["result"]
+
+        while not stop.is_set():
+            poll = asyncio.create_task(get_updates(POLL_TIMEOUT))
+            stopped = asyncio.create_task(stop.wait())
+            await asyncio.wait({poll, stopped}, return_when=asyncio.FIRST_COMPLETED)
+            stopped.cancel()
+            if not poll.done():
+                poll.cancel()
+                break
+            try:
+                updates = poll.result()
+            except (aiohttp.ClientError, asyncio.TimeoutError, RuntimeError) as exc:
+                logging.warning("getUpdates failed: %s", exc)
+                try:
+                    await asyncio.wait_for(stop.wait(), POLL_RETRY_DELAY)
+                except asyncio.TimeoutError:
+                    pass
+                continue
+            for update in updates:
+                pool.dispatch(update)
+                offset = update["update_id"] + 1
+
+        if offset:
+            # Confirms what was dispatched; the fetched update (if any) is redelivered later.
+            try:
+                payload = {"offset": offset, "limit": 1, "timeout": 0}
+                async with session.post(url, json=payload):
+                    pass
+            except (aiohttp.ClientError, asyncio.TimeoutError) as exc:
+                logging.warning("Could not confirm the last updates: %s", exc)
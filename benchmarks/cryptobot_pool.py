@@ -0,0 +1,108 @@
+"""Local benchmark: CryptoBot client latency with and without a pre-warmed pool.
+
+The stub server delays the first request on every new TCP connection by
+--handshake-ms to stand in for the TCP+TLS handshake to pay.crypt.bot.
+
+    python -m benchmarks.cryptobot_pool --trials 50 --requests 20
+"""
+from __future__ import annotations
+
+import argparse
+import asyncio
+import os
+import statistics
+import time
+
+os.environ.setdefault("CRYPTOBOT_TOKEN", "benchmark")
+
+from aiohttp import web
+
+import app.cryptobot as cryptobot
+
+
+class StubServer:
+    def __init__(self, handshake: float, service: float):
+        self.handshake = handshake
+        self.service = service
+        self.connections = 0
+        self._seen: set[tuple] = set()
+
+    async def handle(self, request: web.Request) -> web.Response:
+        peer = request.transport.get_extra_info("peername") if request.transport else None
+        if peer not in self._seen:
+            self._seen.add(peer)
+            self.connections += 1
+            await asyncio.sleep(self.handshake)
+        await asyncio.sleep(self.service)
+        return web.json_response({"ok": True, "result": {"items": []}})
+
+    async def start(self, port: int) -> web.AppRunner:
+        app = web.Application()
+        app.router.add_post("/api/{method}", self.handle)
+        runner = web.AppRunner(app)
+        await runner.setup()
+        await web.TCPSite(runner, "127.0.0.1", port).start()
+        return runner
+
+
+def _percentile(values: list[float], pct: float) -> float:
+    ordered = sorted(values)
+    index = min(len(ordered) - 1, round(pct / 100 * (len(ordered) - 1)))
+    return ordered[index]
+
+
+async def _trial(client: cryptobot.CryptoBotClient, warm: bool, requests: int, concurrency: int) -> list[float]:
+    if warm:
+        await client.warm_up(concurrency)
+    semaphore = asyncio.Semaphore(concurrency)
+    latencies: list[float] = []
+
+    async def one(index: int) -> None:
+        async with semaphore:
+            started = time.perf_counter()
+            await client.get_invoices([str(index)])
+            latencies.append(time.perf_counter() - started)
+
+    await asyncio.gather(*(one(index) for index in range(requests)))
+    await client.close()
+    return latencies
+
+
+async def main() -> None:
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--trials", type=int, default=30)
+    parser.add_argument("--requests", type=int, default=20)
+    parser.add_argument("--concurrency", type=int, default=4)
+    parser.add_argument("--handshake-ms", type=float, default=60)
+    parser.add_argument("--service-ms", type=float, default=5)
+    parser.add_argument("--port", type=int, default=18765)
+    args = parser.parse_args()
+
+    stub = StubServer(args.handshake_ms / 1000, args.service_ms / 1000)
+    runner = await stub.start(args.port)
+    cryptobot.API_URL = f"http://127.0.0.1:{args.port}/api"
+
+    scenarios = {
+        "cold (aiohttp defaults)": (
+            lambda: cryptobot.CryptoBotClient("benchmark", keepalive=15, dns_ttl=10),
+            False,
+        ),
+        "tuned + warm-up": (cryptobot.get_crypto_bot_client, True),
+    }
+    try:
+        for name, (factory, warm) in scenarios.items():
+            stub.connections = 0
+            latencies: list[float] = []
+            for _ in range(args.trials):
+                latencies.extend(await _trial(factory(), warm, args.requests, args.concurrency))
+            print(
+                f"{name:<26} p50={statistics.median(latencies) * 1000:7.2f}ms "
+                f"p99={_percentile(latencies, 99) * 1000:7.2f}ms "
+                f"connections/trial={stub.connections / args.trials:.1f}"
+            )
+    finally:
+        await runner.cleanup()
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
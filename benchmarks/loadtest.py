@@ -0,0 +1,412 @@
+"""Local load test: the real Dispatcher and router against a fake Bot API and a fake CryptoBot.
+
+Updates go through ``dp.feed_update`` with the production middleware stack
+(``main.create_dispatcher``). Bot API calls are answered in-process by
+FakeTelegramSession and pay.crypt.bot is replaced by an aiohttp stub on a
+local port, so nothing leaves the machine. The stubs have no flood limits, so
+the notifier and default throttle rates are opened up unless they are set in
+the environment; the per-route limits on the CryptoBot buttons stay in force.
+
+Scenarios run in order against one fresh database:
+
+    start     every user sends /start
+    crypto    the first half taps pay_usdt, then --checks check_invoice taps
+    receipts  the second half taps pay_rub, sends a photo and "I sent the receipt"
+    approve   the admin opens /pending and approves every receipt from it
+
+Latency is measured around ``feed_update``; DB queries and outbound calls are
+counted until the background fan-out and registration flush have drained.
+
+    python -m benchmarks.loadtest --users 500 --concurrency 50
+    PROFILING=1 python -m benchmarks.loadtest --api-ms 20
+"""
+from __future__ import annotations
+
+import argparse
+import asyncio
+from collections import Counter
+from dataclasses import dataclass, field
+from datetime import datetime
+import itertools
+import os
+import tempfile
+import time
+from typing import Any, AsyncGenerator, Iterable, Iterator
+
+from aiogram import Bot
+from aiogram.client.session.base import BaseSession
+from aiogram.methods import CopyMessage, EditMessageText, SendMessage, TelegramMethod
+from aiogram.types import (
+    CallbackQuery,
+    Chat,
+    InlineKeyboardButton,
+    InlineKeyboardMarkup,
+    Message,
+    MessageId,
+    PhotoSize,
+    Update,
+    User,
+)
+from aiohttp import web
+
+ADMIN_ID = 1
+BOT_ID = 123456
+FIRST_USER_ID = 1_000_000
+
+# Opened up because the stubs never answer with 429; override them to test the limiters.
+UNLIMITED_DEFAULTS = {
+    "TELEGRAM_GLOBAL_RATE": "1000000",
+    "TELEGRAM_CHAT_RATE": "1000000",
+    "THROTTLE_RATE": "1000000",
+    "THROTTLE_BURST": "1000000",
+}
+
+
+class FakeTelegramSession(BaseSession):
+    """Answers Bot API methods in-process after a fixed delay and counts them."""
+
+    def __init__(self, latency: float):
+        super().__init__()
+        self.latency = latency
+        self.calls: Counter[str] = Counter()
+        self._message_ids = itertools.count(1)
+
+    async def make_request(self, bot: Bot, method: TelegramMethod[Any], timeout: int | None = None) -> Any:
+        self.calls[method.__api_method__] += 1
+        if self.latency:
+            await asyncio.sleep(self.latency)
+        if isinstance(method, CopyMessage):
+            return MessageId(message_id=next(self._message_ids))
+        if isinstance(method, (SendMessage, EditMessageText)):
+            return Message(
+                message_id=next(self._message_ids),
+                date=datetime.now(),
+                chat=Chat(id=int(method.chat_id or 0), type="private"),
+                text=method.text,
+            ).as_(bot)
+        return True
+
+    async def stream_content(
+        self,
+        url: str,
+        headers: dict[str, Any] | None = None,
+        timeout: int = 30,
+        chunk_size: int = 65536,
+        raise_for_status: bool = True,
+    ) -> AsyncGenerator[bytes, None]:
+        yield b""
+
+    async def close(self) -> None:
+        pass
+
+
+class FakeCryptoBot:
+    """pay.crypt.bot stand-in: every --paid-every-th invoice reports paid on lookup."""
+
+    def __init__(self, latency: float, paid_every: int):
+        self.latency = latency
+        self.paid_every = paid_every
+        self.calls: Counter[str] = Counter()
+        self.invoices: dict[int, dict[str, Any]] = {}
+        self.by_payload: dict[str, int] = {}
+
+    def _lookup(self, invoice_id: int) -> dict[str, Any]:
+        invoice = self.invoices[invoice_id]
+        if self.paid_every and invoice_id % self.paid_every == 0:
+            invoice["status"] = "paid"
+        return invoice
+
+    async def handle(self, request: web.Request) -> web.Response:
+        method = request.match_info["method"]
+        self.calls[method] += 1
+        body = await request.json()
+        if self.latency:
+            await asyncio.sleep(self.latency)
+        if method == "createInvoice":
+            invoice_id = len(self.invoices) + 1
+            result = {
+                "invoice_id": invoice_id,
+                "status": "active",
+                "pay_url": f"https://t.me/CryptoBot?start=IV{invoice_id}",
+                "payload": body.get("payload"),
+            }
+            self.invoices[invoice_id] = result
+            self.by_payload[str(body.get("payload"))] = invoice_id
+        elif method == "getInvoices":
+            ids = [int(value) for value in str(body.get("invoice_ids", "")).split(",") if value]
+            result = {"items": [self._lookup(value) for value in ids if value in self.invoices]}
+        else:
+            result = {}
+        return web.json_response({"ok": True, "result": result})
+
+    async def start(self) -> tuple[web.AppRunner, str]:
+        app = web.Application()
+        app.router.add_post("/api/{method}", self.handle)
+        runner = web.AppRunner(app)
+        await runner.setup()
+        await web.TCPSite(runner, "127.0.0.1", 0).start()
+        port = runner.addresses[0][1]
+        return runner, f"http://127.0.0.1:{port}/api"
+
+
+class UpdateFactory:
+    def __init__(self) -> None:
+        self._ids = itertools.count(1)
+
+    @staticmethod
+    def _user(user_id: int) -> User:
+        return User(id=user_id, is_bot=False, first_name=f"User{user_id}", username=f"user{user_id}")
+
+    def message(self, user_id: int, **fields: Any) -> Update:
+        return Update(
+            update_id=next(self._ids),
+            message=Message(
+                message_id=next(self._ids),
+                date=datetime.now(),
+                chat=Chat(id=user_id, type="private"),
+                from_user=self._user(user_id),
+                **fields,
+            ),
+        )
+
+    def photo(self, user_id: int) -> Update:
+        photo = PhotoSize(file_id=f"receipt-{user_id}", file_unique_id=f"r{user_id}", width=800, height=600)
+        return self.message(user_id, photo=[photo])
+
+    def callback(self, user_id: int, data: str, reply_markup: InlineKeyboardMarkup | None = None) -> Update:
+        bot_message = Message(
+            message_id=next(self._ids),
+            date=datetime.now(),
+            chat=Chat(id=user_id, type="private"),
+            from_user=User(id=BOT_ID, is_bot=True, first_name="Bot"),
+            text="loadtest",
+            reply_markup=reply_markup,
+        )
+        return Update(
+            update_id=next(self._ids),
+            callback_query=CallbackQuery(
+                id=str(next(self._ids)),
+                from_user=self._user(user_id),
+                chat_instance="loadtest",
+                data=data,
+                message=bot_message,
+            ),
+        )
+
+
+@dataclass(slots=True)
+class ScenarioReport:
+    name: str
+    elapsed: float = 0.0
+    latencies: list[float] = field(default_factory=list)
+    totals: Counter[str] = field(default_factory=Counter)
+
+    @property
+    def updates(self) -> int:
+        return len(self.latencies)
+
+    def per_update(self, key: str) -> float:
+        return self.totals[key] / self.updates if self.updates else 0.0
+
+    def percentile_ms(self, pct: float) -> float:
+        return _percentile(self.latencies, pct) * 1000 if self.latencies else 0.0
+
+
+def _percentile(values: list[float], pct: float) -> float:
+    ordered = sorted(values)
+    index = min(len(ordered) - 1, round(pct / 100 * (len(ordered) - 1)))
+    return ordered[index]
+
+
+def _counter_total(counter: Any) -> int:
+    return int(
+        sum(
+            sample.value
+            for metric in counter.collect()
+            for sample in metric.samples
+            if sample.name.endswith("_total")
+        )
+    )
+
+
+def _configure_environment(args: argparse.Namespace, directory: str) -> None:
+    os.environ.update(
+        TOKEN=f"{BOT_ID}:loadtest",
+        CRYPTOBOT_TOKEN="loadtest",
+        DATABASE_URL=args.database_url
+        or f"sqlite+aiosqlite:///{os.path.join(directory, 'loadtest.sqlite3')}",
+        ADMIN_CHAT_IDS=str(ADMIN_ID),
+        RUB_PAY_URL="https://example.com/pay",
+        BOT_MODE="polling",
+        RECONCILE_INTERVAL="0",
+        CRYPTOBOT_WEBHOOK_PATH="",
+        METRICS_PORT="0",
+    )
+    for key, value in UNLIMITED_DEFAULTS.items():
+        os.environ.setdefault(key, value)
+
+
+def _crypto_streams(
+    updates: UpdateFactory,
+    cryptobot: FakeCryptoBot,
+    user_ids: list[int],
+    checks: int,
+) -> list[Iterator[Update]]:
+    def stream(user_id: int) -> Iterator[Update]:
+        yield updates.callback(user_id, "pay_usdt")
+        # Resumed only after pay_usdt was handled, so the invoice exists by now.
+        invoice_id = cryptobot.by_payload.get(str(user_id))
+        for _ in range(checks):
+            yield updates.callback(user_id, f"check_invoice:{invoice_id}")
+
+    return [stream(user_id) for user_id in user_ids]
+
+
+def _receipt_streams(updates: UpdateFactory, user_ids: list[int]) -> list[Iterator[Update]]:
+    def stream(user_id: int) -> Iterator[Update]:
+        yield updates.callback(user_id, "pay_rub")
+        yield updates.photo(user_id)
+        yield updates.callback(user_id, "rub_receipt_sent")
+
+    return [stream(user_id) for user_id in user_ids]
+
+
+def _approve_stream(updates: UpdateFactory, user_ids: list[int]) -> Iterator[Update]:
+    yield updates.message(ADMIN_ID, text="/pending")
+    # Tapped from the dashboard, so every approval also re-renders the page.
+    dashboard = InlineKeyboardMarkup(
+        inline_keyboard=[[InlineKeyboardButton(text="refresh", callback_data="pending:refresh:0")]]
+    )
+    for user_id in user_ids:
+        yield updates.callback(ADMIN_ID, f"admin_approve:{user_id}", reply_markup=dashboard)
+
+
+async def _run(args: argparse.Namespace) -> None:
+    from sqlalchemy import event
+
+    import app.cryptobot as cryptobot_client
+    import app.database.requests as rq
+    from app.config import get_settings
+    from app.database.models import async_main, engine, write_engine
+    from app.database.registration import registration_queue
+    from app.metrics import THROTTLED
+    from app.middlewares import TelegramCallTimer
+    from app.profiling import Profiler
+    from app.services.notifications import notifier
+    from main import create_dispatcher
+
+    settings = get_settings()
+    telegram = FakeTelegramSession(args.api_ms / 1000)
+    cryptobot = FakeCryptoBot(args.cryptobot_ms / 1000, args.paid_every)
+    runner, cryptobot_client.API_URL = await cryptobot.start()
+
+    db_queries = Counter()
+    engines = {engine, write_engine}
+    for counted_engine in engines:
+        event.listen(
+            counted_engine.sync_engine,
+            "before_cursor_execute",
+            lambda *_: db_queries.update(("db",)),
+        )
+
+    profiler = None
+    if settings.profiling:
+        profiler = Profiler.from_settings(settings)
+        for traced_engine in engines:
+            profiler.trace_engine(traced_engine)
+    dp = create_dispatcher(settings, profiler)
+    bot = Bot(settings.token, session=telegram)
+    if profiler:
+        bot.session.middleware(TelegramCallTimer())
+
+    def totals() -> Counter[str]:
+        return Counter(
+            db=db_queries["db"],
+            telegram=telegram.calls.total(),
+            cryptobot=cryptobot.calls.total(),
+            throttled=_counter_total(THROTTLED),
+        )
+
+    async def scenario(name: str, streams: Iterable[Iterator[Update]], concurrency: int) -> ScenarioReport:
+        report = ScenarioReport(name)
+        semaphore = asyncio.Semaphore(concurrency)
+
+        async def feed(stream: Iterator[Update]) -> None:
+            async with semaphore:
+                for update in stream:
+                    started = time.perf_counter()
+                    await dp.feed_update(bot, update)
+                    report.latencies.append(time.perf_counter() - started)
+
+        before = totals()
+        started = time.perf_counter()
+        await asyncio.gather(*(feed(stream) for stream in streams))
+        report.elapsed = time.perf_counter() - started
+        await registration_queue.flush()
+        await notifier.drain()
+        report.totals = totals()
+        report.totals.subtract(before)
+        return report
+
+    try:
+        await async_main()
+        await rq.load_staff_cache()
+        await cryptobot_client.warm_up_crypto_bot_client()
+        await dp.emit_startup(bot=bot, dispatcher=dp)
+
+        updates = UpdateFactory()
+        user_ids = list(range(FIRST_USER_ID, FIRST_USER_ID + args.users))
+        crypto_users = user_ids[: len(user_ids) // 2]
+        rub_users = user_ids[len(user_ids) // 2:]
+        start_streams = [iter([updates.message(user_id, text="/start")]) for user_id in user_ids]
+        reports = [
+            await scenario("start", start_streams, args.concurrency),
+            await scenario(
+                "crypto",
+                _crypto_streams(updates, cryptobot, crypto_users, args.checks),
+                args.concurrency,
+            ),
+            await scenario("receipts", _receipt_streams(updates, rub_users), args.concurrency),
+            await scenario("approve", [_approve_stream(updates, rub_users)], 1),
+        ]
+        await dp.emit_shutdown(bot=bot, dispatcher=dp)
+    finally:
+        await cryptobot_client.close_crypto_bot_client()
+        await runner.cleanup()
+        for counted_engine in engines:
+            await counted_engine.dispose()
+
+    print(
+        f"{'scenario':<10} {'updates':>7} {'upd/s':>8} {'p50 ms':>8} {'p95 ms':>8} {'p99 ms':>8} "
+        f"{'db q/upd':>8} {'tg/upd':>7} {'cb/upd':>7} {'throttled':>9}"
+    )
+    for report in reports:
+        print(
+            f"{report.name:<10} {report.updates:>7} {report.updates / report.elapsed:>8.0f} "
+            f"{report.percentile_ms(50):>8.2f} {report.percentile_ms(95):>8.2f} "
+            f"{report.percentile_ms(99):>8.2f} {report.per_update('db'):>8.2f} "
+            f"{report.per_update('telegram'):>7.2f} {report.per_update('cryptobot'):>7.2f} "
+            f"{report.totals['throttled']:>9}"
+        )
+    print("Bot API calls:", dict(telegram.calls.most_common()))
+    print("CryptoBot calls:", dict(cryptobot.calls.most_common()))
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--users", type=int, default=500)
+    parser.add_argument("--concurrency", type=int, default=50)
+    parser.add_argument("--checks", type=int, default=3, help="check_invoice taps per crypto user")
+    parser.add_argument("--paid-every", type=int, default=2, help="every Nth invoice is paid; 0 = none")
+    parser.add_argument("--api-ms", type=float, default=0, help="fake Bot API latency")
+    parser.add_argument("--cryptobot-ms", type=float, default=0, help="fake CryptoBot latency")
+    parser.add_argument("--database-url", help="defaults to a fresh SQLite file")
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as directory:
+        _configure_environment(args, directory)
+        asyncio.run(_run(args))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,86 @@
+"""Local benchmark: handled updates per second on SQLite, default engine vs SQLITE_TUNING.
+
+Every simulated update does the middleware snapshot read (the user cache is
+disabled) and every --write-every-th update also writes, like /buy_rub does.
+Each mode runs in a fresh subprocess against a fresh database file.
+
+    python -m benchmarks.sqlite_profile --updates 5000 --concurrency 50
+"""
+from __future__ import annotations
+
+import argparse
+import asyncio
+import os
+import subprocess
+import sys
+import tempfile
+import time
+
+
+async def _run_worker(args: argparse.Namespace) -> None:
+    from sqlalchemy.exc import OperationalError
+
+    import app.database.requests as rq
+    from app.database.models import async_main
+
+    await async_main()
+    await rq.set_users(list(range(1, args.users + 1)))
+
+    semaphore = asyncio.Semaphore(args.concurrency)
+    errors = 0
+
+    async def one(index: int) -> None:
+        nonlocal errors
+        user_id = index % args.users + 1
+        async with semaphore:
+            try:
+                await rq.get_user(user_id)
+                if index % args.write_every == 0:
+                    await rq.set_rub_pending(user_id)
+            except OperationalError:
+                errors += 1
+
+    started = time.perf_counter()
+    await asyncio.gather(*(one(index) for index in range(args.updates)))
+    elapsed = time.perf_counter() - started
+    print(f"{args.updates / elapsed:.0f} {errors}")
+
+
+def _run_mode(args: argparse.Namespace, tuned: bool) -> tuple[float, int]:
+    with tempfile.TemporaryDirectory() as tmp:
+        env = dict(
+            os.environ,
+            DATABASE_URL=f"sqlite+aiosqlite:///{os.path.join(tmp, 'bench.sqlite3')}",
+            SQLITE_TUNING="1" if tuned else "0",
+            USER_CACHE_SIZE="0",
+        )
+        output = subprocess.run(
+            [sys.executable, "-m", "benchmarks.sqlite_profile", "--worker", *sys.argv[1:]],
+            env=env,
+            check=True,
+            capture_output=True,
+            text=True,
+        ).stdout.split()
+    return float(output[0]), int(output[1])
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--updates", type=int, default=5000)
+    parser.add_argument("--concurrency", type=int, default=50)
+    parser.add_argument("--users", type=int, default=1000)
+    parser.add_argument("--write-every", type=int, default=5)
+    parser.add_argument("--worker", action="store_true", help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.worker:
+        asyncio.run(_run_worker(args))
+        return
+
+    for name, tuned in (("default engine", False), ("SQLITE_TUNING=1", True)):
+        rate, errors = _run_mode(args, tuned)
+        print(f"{name:<16} {rate:8.0f} updates/s  locked errors={errors}")
+
+
+if __name__ == "__main__":
+    main()
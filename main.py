@@ -1,12 +1,39 @@
 ﻿import asyncio
 import logging
+import signal
 
 from aiogram import Bot, Dispatcher
 
-from app.config import get_settings, log_missing_settings
+from app.config import Settings, get_settings, log_missing_settings
+from app.middlewares import (
+    HandlerProfileMiddleware,
+    MetricsMiddleware,
+    TelegramCallTimer,
+    ThrottlingMiddleware,
+    UpdateTraceMiddleware,
+    UserSnapshotMiddleware,
+)
 from app.routers import router
-from app.database.models import async_main
-from app.cryptobot import close_crypto_bot_client
+from app.database.cache import staff_cache, user_cache
+from app.database.models import async_main, engine, write_engine
+from app.database.registration import registration_queue
+import app.database.requests as rq
+from app.profiling import Profiler
+from app.cryptobot import close_crypto_bot_client, warm_up_crypto_bot_client
+from app.services.broadcast import broadcaster
+from app.services.notifications import global_rate_share, notifier
+from app.services.reconciliation import reconciler
+from app.web import (
+    create_metrics_app,
+    create_web_app,
+    run_web_app,
+    setup_cryptobot_webhook,
+    setup_sharded_webhook,
+    setup_telegram_webhook,
+    start_web_app,
+    stop_on_signals,
+)
+from app.workers import Worker, WorkerPool, WorkerQueue, poll_updates
 
 
 def _setup_logging() -> None:
@@ -17,24 +44,205 @@ def _setup_logging() -> None:
     )
 
 
+async def _on_startup(bot: Bot, dispatcher: Dispatcher) -> None:
+    settings = get_settings()
+    if settings.bot_mode == "webhook" and settings.webhook_base_url:
+        await bot.set_webhook(
+            settings.webhook_base_url.rstrip("/") + settings.webhook_path,
+            secret_token=settings.webhook_secret,
+            allowed_updates=dispatcher.resolve_used_update_types(),
+        )
+
+
+def _create_profiler(settings: Settings, worker_index: int | None = None) -> Profiler | None:
+    if not settings.profiling:
+        return None
+    profiler = Profiler.from_settings(settings, worker_index)
+    for traced_engine in {engine, write_engine}:
+        profiler.trace_engine(traced_engine)
+    return profiler
+
+
+def create_dispatcher(
+    settings: Settings,
+    profiler: Profiler | None = None,
+    worker_index: int | None = None,
+) -> Dispatcher:
+    """The production middleware stack, router and lifecycle hooks.
+
+    With `worker_index` the front-end owns the webhook and only worker 0 runs
+    the reconciler and resumes broadcasts.
+    """
+    dp = Dispatcher()
+    if profiler:
+        dp.update.outer_middleware(UpdateTraceMiddleware(profiler))
+    dp.update.outer_middleware(UserSnapshotMiddleware())
+    metrics = MetricsMiddleware()
+    throttling = ThrottlingMiddleware.from_settings(settings)
+    for observer in (dp.message, dp.callback_query):
+        observer.middleware(metrics)
+        observer.middleware(throttling)
+        if profiler:
+            observer.middleware(HandlerProfileMiddleware(profiler))
+    dp.include_router(router)
+    if worker_index is None:
+        dp.startup.register(_on_startup)
+    if profiler:
+        dp.startup.register(profiler.start)
+        dp.shutdown.register(profiler.stop)
+    dp.startup.register(registration_queue.start)
+    if not worker_index:
+        dp.startup.register(reconciler.start)
+        dp.startup.register(broadcaster.start)
+    dp.shutdown.register(reconciler.stop)
+    dp.shutdown.register(broadcaster.stop)
+    dp.shutdown.register(notifier.drain)
+    dp.shutdown.register(registration_queue.stop)
+    return dp
+
+
+def _run_worker(index: int, queues: list[WorkerQueue]) -> None:
+    """Worker process entry point; shutdown comes from the front-end, not from signals."""
+    for sig in (signal.SIGINT, signal.SIGTERM):
+        signal.signal(sig, signal.SIG_IGN)
+    _setup_logging()
+    asyncio.run(_worker_main(index, queues))
+
+
+async def _worker_main(index: int, queues: list[WorkerQueue]) -> None:
+    settings = get_settings()
+    worker = Worker(index, queues)
+    notifier.global_limit.set_rate(global_rate_share(settings, index))
+    user_cache.on_change = staff_cache.on_change = worker.publish
+    if index:
+        broadcaster.handoff = worker.hand_off_broadcast
+    await rq.load_staff_cache()
+    if settings.cryptobot_token:
+        await warm_up_crypto_bot_client()
+
+    profiler = _create_profiler(settings, index)
+    dp = create_dispatcher(settings, profiler, worker_index=index)
+    bot = Bot(settings.token)
+    if profiler:
+        bot.session.middleware(TelegramCallTimer())
+    metrics_runner = None
+    try:
+        if settings.metrics_port:
+            metrics_runner = await start_web_app(
+                create_metrics_app(),
+                settings.metrics_host,
+                settings.metrics_port + 1 + index,
+            )
+        await worker.run(dp, bot)
+    finally:
+        if metrics_runner:
+            await metrics_runner.cleanup()
+        await bot.session.close()
+        await close_crypto_bot_client()
+
+
+async def _serve_workers(settings: Settings) -> None:
+    """Front-end of the multi-worker mode: receives updates and shards them by user id."""
+    notifier.global_limit.set_rate(global_rate_share(settings, None))
+    pool = WorkerPool(settings.workers, _run_worker)
+    user_cache.on_change = staff_cache.on_change = pool.publish
+    pool.start()
+    bot = Bot(settings.token)
+    dp = create_dispatcher(settings)
+    runner = None
+    metrics_runner = None
+    try:
+        if settings.metrics_port:
+            metrics_runner = await start_web_app(
+                create_metrics_app(),
+                settings.metrics_host,
+                settings.metrics_port,
+            )
+        app = create_web_app()
+        if settings.cryptobot_webhook_path:
+            setup_cryptobot_webhook(app, bot, settings)
+        if settings.bot_mode == "webhook":
+            setup_sharded_webhook(app, pool, settings)
+            await _on_startup(bot, dp)
+            await run_web_app(app, settings.web_host, settings.web_port)
+        else:
+            if settings.cryptobot_webhook_path:
+                runner = await start_web_app(app, settings.web_host, settings.web_port)
+            await poll_updates(bot, pool, dp.resolve_used_update_types(), stop_on_signals())
+    finally:
+        if runner:
+            await runner.cleanup()
+        await pool.stop()
+        await notifier.drain()
+        if metrics_runner:
+            await metrics_runner.cleanup()
+        await bot.session.close()
+        await close_crypto_bot_client()
+
+
 async def main() -> None:
     settings = get_settings()
     if not settings.token:
         raise RuntimeError("TOKEN env var is not set")
     if not settings.database_url:
         raise RuntimeError("DATABASE_URL env var is not set")
+    if settings.bot_mode not in ("polling", "webhook"):
+        raise RuntimeError("BOT_MODE must be 'polling' or 'webhook'")
+    if settings.workers < 1:
+        raise RuntimeError("WORKERS must be at least 1")
+    for name, rate in (
+        ("TELEGRAM_GLOBAL_RATE", settings.telegram_global_rate),
+        ("TELEGRAM_CHAT_RATE", settings.telegram_chat_rate),
+        ("BROADCAST_RATE", settings.broadcast_rate),
+    ):
+        if rate <= 0:
+            raise RuntimeError(f"{name} must be greater than 0")
+    if settings.throttle_rate > 0 and settings.throttle_burst < 1:
+        raise RuntimeError("THROTTLE_BURST must be at least 1 when THROTTLE_RATE is set")
+    if settings.workers > 1 and settings.broadcast_rate >= settings.telegram_global_rate:
+        raise RuntimeError("BROADCAST_RATE must be below TELEGRAM_GLOBAL_RATE when WORKERS > 1")
     log_missing_settings(settings)
 
     _setup_logging()
     await async_main()
+    if settings.workers > 1:
+        await _serve_workers(settings)
+        return
 
+    await rq.load_staff_cache()
+    if settings.cryptobot_token:
+        await warm_up_crypto_bot_client()
+
+    profiler = _create_profiler(settings)
     bot: Bot | None = None
-    dp = Dispatcher()
-    dp.include_router(router)
+    dp = create_dispatcher(settings, profiler)
+    runner = None
+    metrics_runner = None
     try:
+        if settings.metrics_port:
+            metrics_runner = await start_web_app(
+                create_metrics_app(),
+                settings.metrics_host,
+                settings.metrics_port,
+            )
         bot = Bot(settings.token)
-        await dp.start_polling(bot)
+        if profiler:
+            bot.session.middleware(TelegramCallTimer())
+        app = create_web_app()
+        if settings.cryptobot_webhook_path:
+            setup_cryptobot_webhook(app, bot, settings)
+        if settings.bot_mode == "webhook":
+            setup_telegram_webhook(app, dp, bot, settings)
+            await run_web_app(app, settings.web_host, settings.web_port)
+        else:
+            if settings.cryptobot_webhook_path:
+                runner = await start_web_app(app, settings.web_host, settings.web_port)
+            await dp.start_polling(bot)
     finally:
+        if runner:
+            await runner.cleanup()
+        if metrics_runner:
+            await metrics_runner.cleanup()
         if bot:
             await bot.session.close()
         await close_crypto_bot_client()
@@ -0,0 +1,12 @@
+import os
+from pathlib import Path
+import sys
+import tempfile
+
+ROOT = Path(__file__).resolve().parent.parent
+sys.path.insert(0, str(ROOT))
+
+# app.database builds its engine at import time, so the test database has to be chosen first.
+_db_dir = tempfile.mkdtemp(prefix="bot-tests-")
+os.environ.setdefault("DATABASE_URL", f"sqlite+aiosqlite:///{_db_dir}/test.sqlite3")
+os.environ.setdefault("REGISTRATION_FLUSH_MS", "0")
@@ -0,0 +1,81 @@
+import asyncio
+import dataclasses
+import queue
+import time
+
+from aiogram import Dispatcher
+
+import app.database.requests as rq
+from app.config import get_settings
+from app.database.models import async_main, engine, write_engine
+from app.services import broadcast as broadcast_module
+from app.services.broadcast import broadcaster
+from app.services.notifications import global_rate_share, notifier
+from app.workers import STOP, Worker
+
+OWNER_ID = 9_000_000
+TARGETS = [(pk, 9_000_000 + pk) for pk in range(1, 21)]
+
+
+def run(scenario) -> None:
+    async def wrapper():
+        try:
+            await async_main()
+            await scenario()
+        finally:
+            await engine.dispose()
+            await write_engine.dispose()
+
+    asyncio.run(wrapper())
+
+
+class RecordingBot:
+    def __init__(self):
+        self.sent: list[int] = []
+
+    async def send_message(self, chat_id: int, text: str, **kwargs) -> None:
+        self.sent.append(chat_id)
+
+
+def test_broadcast_launched_on_another_shard_runs_on_worker_0(monkeypatch):
+    settings = dataclasses.replace(
+        get_settings(), workers=4, telegram_global_rate=30.0, broadcast_rate=25.0
+    )
+    queues = [queue.Queue() for _ in range(settings.workers)]
+
+    async def get_broadcast_targets(segment, after_pk, limit):
+        return [target for target in TARGETS if target[0] > after_pk][:limit]
+
+    monkeypatch.setattr(broadcast_module.rq, "get_broadcast_targets", get_broadcast_targets)
+    monkeypatch.setattr(broadcaster, "handoff", Worker(1, queues).hand_off_broadcast)
+    rate = notifier.global_limit.rate
+
+    async def scenario():
+        bot = RecordingBot()
+        # Worker 1 handles the owner's /broadcast on its 1.25 msg/s share.
+        notifier.global_limit.set_rate(global_rate_share(settings, 1))
+        broadcast = await broadcaster.launch(bot, "hello", "all", OWNER_ID)
+        assert broadcast is not None
+        assert not broadcaster.running
+        assert queues[0].get_nowait() == ("broadcast",)
+        assert queues[1].empty()
+
+        # Worker 0 picks it up on its share, which includes BROADCAST_RATE.
+        broadcaster.handoff = None
+        notifier.global_limit.set_rate(global_rate_share(settings, 0))
+        queues[0].put(("broadcast",))
+        queues[0].put(STOP)
+        started = time.monotonic()
+        await Worker(0, queues).run(Dispatcher(), bot)
+        assert broadcaster.running
+        await broadcaster._task
+        assert time.monotonic() - started < 5
+        assert sorted(bot.sent[:-1]) == [user_id for _, user_id in TARGETS]
+        assert bot.sent[-1] == OWNER_ID
+        finished = await rq.get_broadcast(broadcast.id)
+        assert (finished.status, finished.sent) == ("done", len(TARGETS))
+
+    try:
+        run(scenario)
+    finally:
+        notifier.global_limit.set_rate(rate)
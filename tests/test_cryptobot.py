@@ -0,0 +1,260 @@
+import asyncio
+
+from aiohttp import web
+from prometheus_client import REGISTRY
+import pytest
+
+import app.cryptobot as cryptobot
+from app.cryptobot import CircuitBreaker, CryptoBotAPIError, CryptoBotClient, CryptoBotUnavailable
+
+
+class ScriptedCryptoBot:
+    """Answers each request with the next handler from `script`."""
+
+    def __init__(self, script):
+        self.script = list(script)
+        self.calls = 0
+        self.release = asyncio.Event()
+
+    async def handle(self, request: web.Request) -> web.StreamResponse:
+        self.calls += 1
+        return await self.script.pop(0)(request)
+
+
+def http_error(status):
+    async def handler(request):
+        return web.Response(status=status, text="bad gateway")
+
+    return handler
+
+
+async def non_json(request):
+    return web.Response(text="<html>maintenance</html>", content_type="text/html")
+
+
+def ok(result):
+    async def handler(request):
+        return web.json_response({"ok": True, "result": result})
+
+    return handler
+
+
+async def not_ok(request):
+    return web.json_response({"ok": False, "error": {"code": 400, "name": "INVOICE_NOT_FOUND"}})
+
+
+STUB_KEY = web.AppKey("stub", ScriptedCryptoBot)
+
+
+async def hang(request):
+    await request.app[STUB_KEY].release.wait()
+    return web.json_response({"ok": True, "result": {}})
+
+
+async def _with_server(monkeypatch, script, scenario):
+    stub = ScriptedCryptoBot(script)
+    app = web.Application()
+    app[STUB_KEY] = stub
+    app.router.add_post("/api/{method}", stub.handle)
+    runner = web.AppRunner(app)
+    await runner.setup()
+    await web.TCPSite(runner, "127.0.0.1", 0).start()
+    monkeypatch.setattr(cryptobot, "API_URL", f"http://127.0.0.1:{runner.addresses[0][1]}/api")
+    client = CryptoBotClient("token", max_retries=0, breaker_threshold=1, breaker_reset=0)
+    try:
+        await scenario(client, stub)
+    finally:
+        stub.release.set()
+        await client.close()
+        await runner.cleanup()
+
+
+def test_non_json_probe_reopens_breaker_instead_of_wedging_it(monkeypatch):
+    async def scenario(client, stub):
+        with pytest.raises(CryptoBotUnavailable):
+            await client.get_invoices(["1"])
+        assert client.breaker.state == CircuitBreaker.HALF_OPEN
+
+        with pytest.raises(CryptoBotUnavailable):
+            await client.get_invoices(["1"])
+        assert client.breaker._state == CircuitBreaker.OPEN
+        assert not client.breaker._probe_in_flight
+
+        assert await client.get_invoices(["1"]) == [{"invoice_id": 1}]
+        assert client.breaker.state == CircuitBreaker.CLOSED
+        assert stub.calls == 3
+        assert client.stats.short_circuited == 0
+
+    asyncio.run(_with_server(
+        monkeypatch,
+        [http_error(502), non_json, ok({"items": [{"invoice_id": 1}]})],
+        scenario,
+    ))
+
+
+def test_not_ok_probe_closes_breaker(monkeypatch):
+    async def scenario(client, stub):
+        with pytest.raises(CryptoBotUnavailable):
+            await client.get_invoices(["1"])
+        with pytest.raises(CryptoBotAPIError):
+            await client.get_invoices(["1"])
+        assert client.breaker.state == CircuitBreaker.CLOSED
+        assert not client.breaker._probe_in_flight
+
+    asyncio.run(_with_server(monkeypatch, [http_error(503), not_ok], scenario))
+
+
+def test_cancelled_probe_frees_the_half_open_slot(monkeypatch):
+    async def scenario(client, stub):
+        with pytest.raises(CryptoBotUnavailable):
+            await client.get_invoices(["1"])
+        probe = asyncio.create_task(client.get_invoices(["1"]))
+        while stub.calls < 2:
+            await asyncio.sleep(0.01)
+        probe.cancel()
+        with pytest.raises(asyncio.CancelledError):
+            await probe
+        assert not client.breaker._probe_in_flight
+
+        assert await client.get_invoices(["1"]) == []
+        assert client.breaker.state == CircuitBreaker.CLOSED
+
+    asyncio.run(_with_server(monkeypatch, [http_error(502), hang, ok({"items": []})], scenario))
+
+
+def _sample(name, **labels):
+    return REGISTRY.get_sample_value(name, labels) or 0.0
+
+
+def test_retries_and_short_circuits_are_exported(monkeypatch):
+    async def scenario(client, stub):
+        client._max_retries = 1
+        client._backoff_base = 0
+        client.breaker.failure_threshold = 2
+        client.breaker.reset_timeout = 60
+        monkeypatch.setattr(cryptobot, "_client_instance", client)
+        retries = _sample("cryptobot_retries_total", method="getInvoices")
+        refused = _sample("cryptobot_short_circuited_total", method="getInvoices")
+        opened = _sample("cryptobot_breaker_opened_total")
+
+        assert await client.get_invoices(["1"]) == []
+        assert _sample("cryptobot_retries_total", method="getInvoices") == retries + 1
+        assert _sample("cryptobot_breaker_state") == 0
+
+        with pytest.raises(CryptoBotUnavailable):
+            await client.get_invoices(["1"])
+        assert _sample("cryptobot_retries_total", method="getInvoices") == retries + 2
+        assert _sample("cryptobot_breaker_opened_total") == opened + 1
+        assert _sample("cryptobot_breaker_state") == 2
+
+        with pytest.raises(CryptoBotUnavailable):
+            await client.get_invoices(["1"])
+        assert _sample("cryptobot_short_circuited_total", method="getInvoices") == refused + 1
+        assert stub.calls == 4
+
+    asyncio.run(_with_server(
+        monkeypatch,
+        [http_error(502), ok({"items": []}), http_error(502), http_error(503)],
+        scenario,
+    ))
+
+
+class StubbedRequests:
+    """Stands in for CryptoBotClient._request, answering getInvoices for the asked ids."""
+
+    def __init__(self, error: Exception | None = None):
+        self.calls: list[list[str]] = []
+        self.error = error
+        self.release = asyncio.Event()
+        self.release.set()
+
+    async def __call__(self, method, payload, idempotent=False):
+        ids = payload["invoice_ids"].split(",")
+        self.calls.append(ids)
+        await self.release.wait()
+        if self.error is not None:
+            raise self.error
+        return {"items": [{"invoice_id": int(invoice_id), "status": "paid"} for invoice_id in ids]}
+
+
+def _coalescing_client(stub, window=0.01):
+    client = CryptoBotClient("token", coalesce_window=window)
+    client._request = stub
+    return client
+
+
+def test_concurrent_lookups_share_one_request():
+    async def scenario():
+        stub = StubbedRequests()
+        client = _coalescing_client(stub)
+        results = await asyncio.gather(*(client.get_invoice(str(i)) for i in (1, 2, 3, 2)))
+        assert [result["invoice_id"] for result in results] == [1, 2, 3, 2]
+        assert stub.calls == [["1", "2", "3"]]
+        assert client._in_flight == {} and client._queued == {}
+
+    asyncio.run(scenario())
+
+
+def test_duplicate_lookups_share_one_future():
+    async def scenario():
+        stub = StubbedRequests()
+        stub.release.clear()
+        client = _coalescing_client(stub)
+        first = asyncio.create_task(client.get_invoice("7"))
+        while not stub.calls:
+            await asyncio.sleep(0.005)
+        # Already in flight: joins the running batch instead of queueing a new one.
+        second = asyncio.create_task(client.get_invoice("7"))
+        await asyncio.sleep(0.05)
+        stub.release.set()
+        assert await first is await second
+        assert stub.calls == [["7"]]
+
+    asyncio.run(scenario())
+
+
+def test_full_batch_is_sent_without_waiting_for_the_window():
+    async def scenario():
+        stub = StubbedRequests()
+        client = _coalescing_client(stub, window=60)
+        ids = [str(i) for i in range(cryptobot.MAX_INVOICE_BATCH)]
+        results = await asyncio.wait_for(asyncio.gather(*(client.get_invoice(i) for i in ids)), 5)
+        assert len(results) == len(ids)
+        assert stub.calls == [ids]
+
+    asyncio.run(scenario())
+
+
+def test_batch_error_reaches_every_waiter():
+    async def scenario():
+        stub = StubbedRequests(CryptoBotUnavailable("down"))
+        client = _coalescing_client(stub)
+        results = await asyncio.gather(
+            *(client.get_invoice(str(i)) for i in (1, 2, 3)),
+            return_exceptions=True,
+        )
+        assert all(isinstance(result, CryptoBotUnavailable) for result in results)
+        assert len(stub.calls) == 1
+        assert client._in_flight == {}
+
+    asyncio.run(scenario())
+
+
+def test_cancelled_caller_does_not_cancel_the_batch():
+    async def scenario():
+        stub = StubbedRequests()
+        stub.release.clear()
+        client = _coalescing_client(stub)
+        cancelled = asyncio.create_task(client.get_invoice("1"))
+        same_id = asyncio.create_task(client.get_invoice("1"))
+        other_id = asyncio.create_task(client.get_invoice("2"))
+        while not stub.calls:
+            await asyncio.sleep(0.005)
+        cancelled.cancel()
+        stub.release.set()
+        assert (await same_id)["invoice_id"] == 1
+        assert (await other_id)["invoice_id"] == 2
+        assert cancelled.cancelled()
+        assert stub.calls == [["1", "2"]]
+
+    asyncio.run(scenario())
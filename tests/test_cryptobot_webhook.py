@@ -0,0 +1,110 @@
+import asyncio
+import dataclasses
+import hashlib
+import hmac
+import json
+
+from aiohttp import web
+from aiohttp.test_utils import TestClient, TestServer
+from sqlalchemy import func, select
+
+import app.database.requests as rq
+import app.web as web_module
+from app.config import get_settings
+from app.database.models import Payment, PaymentEvent, async_main, async_session, engine, write_engine
+from app.web import setup_cryptobot_webhook
+
+TOKEN = "12345:test-token"
+PATH = "/cryptobot/webhook"
+
+
+def run(scenario) -> None:
+    async def wrapper():
+        try:
+            await async_main()
+            await scenario()
+        finally:
+            await engine.dispose()
+            await write_engine.dispose()
+
+    asyncio.run(wrapper())
+
+
+def sign(body: bytes, token: str = TOKEN) -> str:
+    secret = hashlib.sha256(token.encode()).digest()
+    return hmac.new(secret, body, hashlib.sha256).hexdigest()
+
+
+def invoice_paid(invoice_id: str) -> bytes:
+    return json.dumps({
+        "update_id": 1,
+        "update_type": "invoice_paid",
+        "payload": {"invoice_id": invoice_id, "status": "paid"},
+    }).encode()
+
+
+async def _paid_events(invoice_id: str) -> int:
+    async with async_session() as session:
+        return await session.scalar(
+            select(func.count())
+            .select_from(PaymentEvent)
+            .join(Payment, Payment.id == PaymentEvent.payment_id)
+            .where(Payment.invoice_id == invoice_id, PaymentEvent.status == "paid")
+        )
+
+
+async def _with_webhook(monkeypatch, scenario):
+    """Runs `scenario(client, notified, confirmed)` against a local webhook server."""
+    notified: list[int] = []
+    confirmed: list[str] = []
+    confirm = web_module.confirm_crypto_invoice_paid
+
+    async def recording_confirm(invoice_id):
+        confirmed.append(invoice_id)
+        return await confirm(invoice_id)
+
+    def recording_notify(bot, user_ids):
+        notified.extend(user_ids)
+
+    monkeypatch.setattr(web_module, "notify_access_granted", recording_notify)
+    monkeypatch.setattr(web_module, "confirm_crypto_invoice_paid", recording_confirm)
+    settings = dataclasses.replace(get_settings(), cryptobot_token=TOKEN, cryptobot_webhook_path=PATH)
+    app = web.Application()
+    setup_cryptobot_webhook(app, None, settings)
+    async with TestClient(TestServer(app)) as client:
+        await scenario(client, notified, confirmed)
+
+
+def test_duplicate_invoice_paid_delivery_is_applied_once(monkeypatch):
+    user_id = 8_100_000
+    invoice_id = "inv-8100000"
+
+    async def scenario(client, notified, confirmed):
+        await rq.set_invoice(user_id, invoice_id, "crypto")
+        body = invoice_paid(invoice_id)
+        for _ in range(2):
+            response = await client.post(PATH, data=body, headers={"crypto-pay-api-signature": sign(body)})
+            assert response.status == 200
+        assert (await rq.get_user(user_id)).payment_status == "paid"
+        assert await _paid_events(invoice_id) == 1
+        assert notified == [user_id]
+        assert confirmed == [invoice_id, invoice_id]
+
+    run(lambda: _with_webhook(monkeypatch, scenario))
+
+
+def test_unsigned_or_badly_signed_delivery_is_rejected(monkeypatch):
+    user_id = 8_100_001
+    invoice_id = "inv-8100001"
+
+    async def scenario(client, notified, confirmed):
+        await rq.set_invoice(user_id, invoice_id, "crypto")
+        body = invoice_paid(invoice_id)
+        for headers in ({}, {"crypto-pay-api-signature": sign(body, "other-token")}):
+            response = await client.post(PATH, data=body, headers=headers)
+            assert response.status == 401
+        assert confirmed == []
+        assert notified == []
+        assert (await rq.get_user(user_id)).payment_status == "pending"
+
+    run(lambda: _with_webhook(monkeypatch, scenario))
@@ -0,0 +1,23 @@
+import dataclasses
+
+import pytest
+
+from app.config import get_settings
+from app.services.notifications import global_rate_share
+
+
+@pytest.mark.parametrize("workers", [2, 4])
+def test_processes_share_the_global_rate(workers):
+    settings = dataclasses.replace(
+        get_settings(), workers=workers, telegram_global_rate=30.0, broadcast_rate=10.0
+    )
+    rates = [global_rate_share(settings, None)]
+    rates += [global_rate_share(settings, index) for index in range(workers)]
+    assert sum(rates) == pytest.approx(30.0)
+    assert rates[1] - rates[0] == pytest.approx(10.0)
+    assert len(set(rates[:1] + rates[2:])) == 1
+
+
+def test_single_process_keeps_the_global_rate():
+    settings = dataclasses.replace(get_settings(), workers=1, telegram_global_rate=30.0)
+    assert global_rate_share(settings, None) == 30.0
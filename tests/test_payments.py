@@ -0,0 +1,133 @@
+import asyncio
+
+from sqlalchemy import func, select
+
+import app.database.requests as rq
+from app.database.models import Payment, PaymentEvent, async_main, async_session, engine, write_engine
+from app.database.requests import DecisionOutcome
+
+STAFF_ID = 42
+NOT_STAFF_ID = 43
+
+
+def run(scenario) -> None:
+    async def wrapper():
+        try:
+            await async_main()
+            await scenario()
+        finally:
+            await engine.dispose()
+            await write_engine.dispose()
+
+    asyncio.run(wrapper())
+
+
+def test_invoice_expiry_does_not_override_a_staff_decision():
+    user_id = 8_000_000
+
+    async def scenario():
+        await rq.add_admin(STAFF_ID)
+        await rq.set_invoice(user_id, "inv-8000000", "crypto")
+        outcome = await rq.decide_payment(user_id, STAFF_ID, approve=False, paid_method="crypto")
+        assert outcome is rq.DecisionOutcome.DENIED
+        assert await rq.mark_expired_by_invoice("inv-8000000") is None
+        snapshot = await rq.get_user(user_id)
+        assert snapshot.payment_status == "failed"
+
+    run(scenario)
+
+
+def test_invoice_expiry_applies_to_undecided_payment():
+    user_id = 8_000_001
+
+    async def scenario():
+        await rq.set_invoice(user_id, "inv-8000001", "crypto")
+        snapshot = await rq.mark_expired_by_invoice("inv-8000001")
+        assert snapshot is not None and snapshot.payment_status == "expired"
+
+    run(scenario)
+
+
+async def _payment_statuses(user_id: int) -> list[str]:
+    async with async_session() as session:
+        result = await session.scalars(
+            select(Payment.status).where(Payment.user_id == user_id).order_by(Payment.id)
+        )
+        return list(result)
+
+
+async def _decision_events(user_id: int) -> int:
+    async with async_session() as session:
+        return await session.scalar(
+            select(func.count())
+            .select_from(PaymentEvent)
+            .join(Payment, Payment.id == PaymentEvent.payment_id)
+            .where(Payment.user_id == user_id, PaymentEvent.actor_id.is_not(None))
+        )
+
+
+def test_decide_payment_approves_and_denies():
+    async def scenario():
+        await rq.add_admin(STAFF_ID)
+        await rq.set_rub_pending(8_200_000)
+        await rq.set_rub_pending(8_200_001)
+        assert await rq.decide_payment(8_200_000, STAFF_ID, approve=True) is DecisionOutcome.APPROVED
+        assert await rq.decide_payment(8_200_001, STAFF_ID, approve=False) is DecisionOutcome.DENIED
+        assert await _payment_statuses(8_200_000) == ["paid"]
+        assert await _payment_statuses(8_200_001) == ["failed"]
+
+    run(scenario)
+
+
+def test_decide_payment_explains_a_refusal():
+    async def scenario():
+        await rq.add_admin(STAFF_ID)
+        for user_id in (8_200_010, 8_200_011, 8_200_012, 8_200_013):
+            await rq.set_rub_pending(user_id)
+        await rq.ban_user(8_200_011)
+        await rq.decide_payment(8_200_012, STAFF_ID, approve=True)
+        # A newer crypto attempt failed, so the rub payment is no longer current.
+        await rq.mark_failed_by_user(8_200_013, "crypto")
+
+        decide = rq.decide_payment
+        assert await decide(8_200_010, NOT_STAFF_ID, approve=True) is DecisionOutcome.NOT_STAFF
+        assert await decide(8_200_099, STAFF_ID, approve=True) is DecisionOutcome.NOT_FOUND
+        assert await decide(8_200_011, STAFF_ID, approve=True) is DecisionOutcome.BANNED
+        assert await decide(8_200_012, STAFF_ID, approve=False) is DecisionOutcome.ALREADY_HANDLED
+        assert await decide(8_200_013, STAFF_ID, approve=True) is DecisionOutcome.ALREADY_HANDLED
+
+        assert await _payment_statuses(8_200_010) == ["pending"]
+        assert await _payment_statuses(8_200_011) == ["pending"]
+        assert await _payment_statuses(8_200_012) == ["paid"]
+        assert await _payment_statuses(8_200_013) == ["pending", "failed"]
+
+    run(scenario)
+
+
+def test_concurrent_approvals_decide_once():
+    user_id = 8_200_020
+
+    async def scenario():
+        await rq.add_admin(STAFF_ID)
+        await rq.set_rub_pending(user_id)
+        outcomes = await asyncio.gather(
+            rq.decide_payment(user_id, STAFF_ID, approve=True),
+            rq.decide_payment(user_id, STAFF_ID, approve=True),
+        )
+        assert sorted(outcomes) == [DecisionOutcome.ALREADY_HANDLED, DecisionOutcome.APPROVED]
+        assert await _decision_events(user_id) == 1
+
+    run(scenario)
+
+
+def test_paying_in_rub_again_resets_a_sent_receipt():
+    user_id = 8_200_030
+
+    async def scenario():
+        await rq.set_rub_pending(user_id)
+        assert (await rq.mark_rub_receipt_sent(user_id)).payment_status == "receipt_sent"
+        await rq.set_rub_pending(user_id)
+        assert (await rq.get_user(user_id)).payment_status == "pending"
+        assert await _payment_statuses(user_id) == ["pending"]
+
+    run(scenario)
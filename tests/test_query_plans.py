@@ -0,0 +1,86 @@
+"""EXPLAIN QUERY PLAN checks that the hot staff queries hit the migration indexes (SQLite)."""
+import asyncio
+
+from sqlalchemy import event, update
+
+from app.database import repository as repo
+import app.database.requests as rq
+from app.database.models import Payment, async_main, async_session, engine, write_engine
+
+
+def _plans(run_queries) -> list[tuple[str, list[str]]]:
+    """(statement, plan details) for every SELECT/UPDATE the callable issues."""
+
+    async def scenario():
+        captured: list[tuple[str, object]] = []
+
+        def capture(conn, cursor, statement, parameters, context, executemany):
+            if statement.lstrip().startswith(("SELECT", "UPDATE")):
+                captured.append((statement, parameters))
+
+        try:
+            await async_main()
+            event.listen(engine.sync_engine, "before_cursor_execute", capture)
+            try:
+                async with async_session() as session:
+                    await run_queries(session)
+                    await session.rollback()
+            finally:
+                event.remove(engine.sync_engine, "before_cursor_execute", capture)
+            async with engine.connect() as conn:
+                return [
+                    (
+                        statement,
+                        [row[3] for row in await conn.exec_driver_sql(f"EXPLAIN QUERY PLAN {statement}", parameters)],
+                    )
+                    for statement, parameters in captured
+                ]
+        finally:
+            await engine.dispose()
+            await write_engine.dispose()
+
+    return asyncio.run(scenario())
+
+
+def _single_plan(run_queries) -> list[str]:
+    plans = _plans(run_queries)
+    assert len(plans) == 1, plans
+    return plans[0][1]
+
+
+def test_admin_ids_use_partial_admin_index():
+    plan = _single_plan(repo.get_admin_ids)
+    assert any("ix_users_admin_user_id" in step for step in plan), plan
+    assert not any(step == "SCAN users" for step in plan), plan
+
+
+def test_open_payments_page_uses_queue_index():
+    async def run(session):
+        await repo.get_open_payments(session, rq.OPEN_STATUSES, "rub", 20, after_id=10)
+
+    plan = _single_plan(run)
+    assert any(step.startswith("SEARCH payments USING INDEX ix_payments_queue") for step in plan), plan
+    assert any("ix_payments_user_id_id" in step for step in plan), plan
+
+
+def test_pending_crypto_invoices_use_queue_index():
+    async def run(session):
+        await repo.get_pending_crypto_invoices(session, 0, 100)
+
+    plan = _single_plan(run)
+    assert plan == ["SEARCH payments USING INDEX ix_payments_queue (status=? AND method=? AND id>?)"], plan
+
+
+def test_decision_update_probes_indexes_only():
+    """The banned check is a per-row index probe; SQLite picks the unique user_id index."""
+
+    async def run(session):
+        await session.execute(update(Payment).where(*rq._decidable_where(1, False)).values(status="paid"))
+
+    plan = _single_plan(run)
+    assert not any(step.startswith("SCAN") for step in plan), plan
+    assert any(step.startswith("SEARCH payments USING INDEX ix_payments_queue") for step in plan), plan
+    assert any(
+        step.startswith("SEARCH users USING") and "(user_id=?)" in step
+        for step in plan
+    ), plan
@@ -0,0 +1,58 @@
+import asyncio
+
+from prometheus_client import REGISTRY
+import pytest
+
+from app.database import registration
+from app.database.registration import RegistrationQueue
+
+
+def test_stop_retries_a_failed_final_flush(monkeypatch):
+    calls = []
+
+    async def set_users(batch):
+        calls.append(list(batch))
+        if len(calls) == 1:
+            raise RuntimeError("database is locked")
+        return len(batch)
+
+    monkeypatch.setattr(registration.rq, "set_users", set_users)
+    monkeypatch.setattr(registration, "STOP_RETRY_DELAY", 0)
+
+    async def scenario():
+        queue = RegistrationQueue(flush_interval=60, max_batch=100)
+        await queue.start()
+        for user_id in (1, 2, 3):
+            await queue.register(user_id)
+        await queue.stop()
+        assert queue.stats().depth == 0
+
+    asyncio.run(scenario())
+    assert calls == [[1, 2, 3], [1, 2, 3]]
+
+
+def test_cancelled_flush_keeps_its_batch(monkeypatch):
+    started = asyncio.Event()
+
+    async def set_users(batch):
+        started.set()
+        await asyncio.sleep(60)
+
+    monkeypatch.setattr(registration.rq, "set_users", set_users)
+
+    async def scenario():
+        queue = RegistrationQueue(flush_interval=60, max_batch=100)
+        queue._pending = {1: None, 2: None}
+        flush = asyncio.create_task(queue.flush())
+        await started.wait()
+        flush.cancel()
+        with pytest.raises(asyncio.CancelledError):
+            await flush
+        assert queue.stats().depth == 2
+
+    asyncio.run(scenario())
+
+
+def test_queue_stats_are_exported(monkeypatch):
+    monkeypatch.setattr(registration.registration_queue, "_pending", {1: None, 2: None, 3: None})
+    assert REGISTRY.get_sample_value("registration_queue_depth") == 3
@@ -0,0 +1,106 @@
+import asyncio
+import dataclasses
+from datetime import datetime
+
+from aiogram.dispatcher.event.handler import HandlerObject
+from aiogram.types import CallbackQuery, Chat, Message, User
+import pytest
+
+import main
+from app import texts
+from app.config import get_settings
+from app.middlewares import THROTTLED_KEY, ThrottlingMiddleware
+from app.services.rate_limit import MemoryThrottleStorage, RateLimit
+
+USER = User(id=1, is_bot=False, first_name="user")
+# Slow enough that no token comes back while a test runs.
+SLOW = 0.001
+
+
+def message() -> Message:
+    chat = Chat(id=USER.id, type="private")
+    return Message(message_id=1, date=datetime.now(), chat=chat, from_user=USER)
+
+
+def callback() -> CallbackQuery:
+    return CallbackQuery(id="1", from_user=USER, chat_instance="chat")
+
+
+async def handle_tap(event, data):
+    return "handled"
+
+
+async def handle_other_tap(event, data):
+    return "handled"
+
+
+def feed(middleware, event, callback=handle_tap, **flags):
+    data = {"event_from_user": USER, "handler": HandlerObject(callback=callback, flags=flags)}
+    result = asyncio.run(middleware(callback, event, data))
+    return result, data
+
+
+def middleware(default: RateLimit | None = RateLimit(rate=SLOW, burst=1), max_keys=100):
+    return ThrottlingMiddleware(MemoryThrottleStorage(max_keys), default)
+
+
+def test_throttled_callback_gets_the_cached_reply(monkeypatch):
+    answers = []
+
+    async def answer(self, text=None, **kwargs):
+        answers.append(text)
+
+    monkeypatch.setattr(CallbackQuery, "answer", answer)
+    throttling = middleware()
+    assert feed(throttling, callback())[0] == "handled"
+    result, data = feed(throttling, callback())
+    assert result is None and data[THROTTLED_KEY] is True
+    assert answers == [texts.THROTTLED_TEXT]
+    assert throttling.throttled == 1
+
+
+def test_throttled_message_is_dropped_silently():
+    throttling = middleware()
+    assert feed(throttling, message())[0] == "handled"
+    result, data = feed(throttling, message())
+    assert result is None and data[THROTTLED_KEY] is True
+
+
+def test_handler_flags_override_the_default():
+    throttling = middleware()
+    wider = RateLimit(rate=SLOW, burst=3)
+    assert [feed(throttling, message(), rate_limit=wider)[0] for _ in range(4)] == ["handled"] * 3 + [None]
+    assert all(feed(throttling, message(), handle_other_tap, rate_limit=False)[0] for _ in range(5))
+
+    shared = RateLimit(rate=SLOW, burst=1, key="check")
+    assert feed(throttling, message(), handle_tap, rate_limit=shared)[0] == "handled"
+    assert feed(throttling, message(), handle_other_tap, rate_limit=shared)[0] is None
+
+
+def test_no_default_limit_when_throttle_rate_is_zero():
+    settings = dataclasses.replace(get_settings(), throttle_rate=0)
+    throttling = ThrottlingMiddleware.from_settings(settings)
+    assert all(feed(throttling, message())[0] for _ in range(10))
+
+
+def test_bucket_storage_evicts_the_least_recently_used_user():
+    storage = MemoryThrottleStorage(max_keys=2)
+
+    async def scenario():
+        for key in ("1:tap", "2:tap", "1:tap", "3:tap"):
+            await storage.consume(key, SLOW, 2)
+        # 2 was the least recently used; 1 is kept with both tokens spent.
+        assert len(storage) == 2
+        assert await storage.consume("1:tap", SLOW, 2) > 0
+        # A forgotten user starts over with a full burst.
+        assert await storage.consume("2:tap", SLOW, 2) == 0
+        assert len(storage) == 2
+
+    asyncio.run(scenario())
+
+
+def test_zero_throttle_burst_is_rejected(monkeypatch):
+    settings = dataclasses.replace(get_settings(), token="token", throttle_rate=2, throttle_burst=0)
+    monkeypatch.setattr(main, "get_settings", lambda: settings)
+    with pytest.raises(RuntimeError, match="THROTTLE_BURST"):
+        asyncio.run(main.main())
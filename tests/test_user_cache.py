@@ -0,0 +1,53 @@
+from prometheus_client import REGISTRY
+
+from app.database.cache import UserCache, user_cache
+from app.database.repository import UserSnapshot
+
+
+def _snapshot(user_id: int, status: str | None = None) -> UserSnapshot:
+    return UserSnapshot(user_id=user_id, payment_status=status, registered=True)
+
+
+def test_populate_is_dropped_after_a_concurrent_invalidation():
+    cache = UserCache(max_size=10, ttl=60)
+    token = cache.read_token()
+    cache.invalidate(1)  # another worker approved the user while our read was in flight
+    cache.put(_snapshot(1, "receipt_sent"), token=token)
+    assert cache.get(1) is None
+
+    token = cache.read_token()
+    cache.put(_snapshot(1, "paid"), token=token)
+    assert cache.get(1).payment_status == "paid"
+
+
+def test_populate_does_not_overwrite_a_local_write():
+    cache = UserCache(max_size=10, ttl=60)
+    token = cache.read_token()
+    cache.put(_snapshot(1, "paid"), publish=True)
+    cache.put(_snapshot(1, "receipt_sent"), token=token)
+    assert cache.get(1).payment_status == "paid"
+
+
+def test_other_users_are_unaffected():
+    cache = UserCache(max_size=10, ttl=60)
+    token = cache.read_token()
+    cache.invalidate(2)
+    cache.put(_snapshot(1), token=token)
+    assert cache.get(1) is not None
+
+
+def test_forgotten_stamps_stay_conservative():
+    cache = UserCache(max_size=2, ttl=60)
+    token = cache.read_token()
+    for user_id in (1, 2, 3):
+        cache.invalidate(user_id)
+    cache.put(_snapshot(1), token=token)
+    assert cache.get(1) is None
+
+
+def test_cache_stats_are_exported():
+    hits = REGISTRY.get_sample_value("user_cache_hits_total")
+    user_cache.put(_snapshot(9_200_000))
+    assert user_cache.get(9_200_000) is not None
+    assert REGISTRY.get_sample_value("user_cache_hits_total") == hits + 1
+    assert REGISTRY.get_sample_value("user_cache_max_entries") == user_cache.max_size
@@ -0,0 +1,80 @@
+import asyncio
+
+import pytest
+from sqlalchemy import func, select
+
+from app.database import repository
+import app.database.requests as rq
+from app.database.cache import user_cache
+from app.database.models import User, async_main, async_session, engine, write_engine
+
+
+def run(scenario) -> None:
+    """Each test has its own event loop, so pooled connections must not outlive it."""
+
+    async def wrapper():
+        try:
+            await async_main()
+            await scenario()
+        finally:
+            await engine.dispose()
+            await write_engine.dispose()
+
+    asyncio.run(wrapper())
+
+
+@pytest.fixture(params=["on_conflict", "portable"])
+def upsert_mode(request, monkeypatch):
+    if request.param == "portable":
+        monkeypatch.setattr(repository, "_insert_users", lambda session: None)
+    return request.param
+
+
+async def _count_users(user_ids: list[int]) -> tuple[int, int]:
+    async with async_session() as session:
+        rows = await session.scalar(select(func.count()).where(User.user_id.in_(user_ids)))
+        distinct = await session.scalar(
+            select(func.count(func.distinct(User.user_id))).where(User.user_id.in_(user_ids))
+        )
+    return rows, distinct
+
+
+def test_concurrent_start_registers_each_user_once(upsert_mode):
+    first = 5_000_000 if upsert_mode == "on_conflict" else 6_000_000
+    user_ids = list(range(first, first + 100))
+
+    async def scenario():
+        user_cache.clear()
+        results = await asyncio.gather(
+            *(rq.set_user(user_id) for user_id in user_ids * 3),
+            return_exceptions=True,
+        )
+        assert [result for result in results if isinstance(result, Exception)] == []
+        assert await _count_users(user_ids) == (100, 100)
+
+    run(scenario)
+
+
+def test_hundreds_of_concurrent_starts_for_one_user(upsert_mode):
+    user_id = 7_100_000 if upsert_mode == "on_conflict" else 7_100_001
+
+    async def scenario():
+        user_cache.clear()
+        results = await asyncio.gather(
+            *(rq.set_user(user_id) for _ in range(300)),
+            return_exceptions=True,
+        )
+        assert [result for result in results if isinstance(result, Exception)] == []
+        assert await _count_users([user_id]) == (1, 1)
+
+    run(scenario)
+
+
+def test_concurrent_upserts_keep_one_row(upsert_mode):
+    user_id = 7_000_000 if upsert_mode == "on_conflict" else 7_000_001
+
+    async def scenario():
+        await asyncio.gather(*(rq.ban_user(user_id) for _ in range(200)))
+        assert await _count_users([user_id]) == (1, 1)
+
+    run(scenario)
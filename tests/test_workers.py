@@ -0,0 +1,116 @@
+import asyncio
+import queue
+import random
+
+import pytest
+from sqlalchemy import update
+
+import app.database.requests as rq
+from app.database.cache import user_cache
+from app.database.models import User, async_main, async_write_session, engine, write_engine
+from app.workers import STOP, Worker, WorkerPool, shard_for
+
+
+def run(scenario) -> None:
+    async def wrapper():
+        try:
+            await async_main()
+            await scenario()
+        finally:
+            await engine.dispose()
+            await write_engine.dispose()
+
+    asyncio.run(wrapper())
+
+
+def message_update(update_id: int, user_id: int) -> dict:
+    return {
+        "update_id": update_id,
+        "message": {"message_id": update_id, "from": {"id": user_id}, "chat": {"id": user_id}},
+    }
+
+
+class RecordingDispatcher:
+    """Handles each raw update after a random delay and records the finish order."""
+
+    def __init__(self):
+        self.handled: list[tuple[int, int]] = []
+
+    async def emit_startup(self, **kwargs) -> None:
+        pass
+
+    async def emit_shutdown(self, **kwargs) -> None:
+        pass
+
+    async def feed_raw_update(self, bot, update: dict) -> None:
+        await asyncio.sleep(random.uniform(0, 0.02))
+        self.handled.append((update["message"]["from"]["id"], update["update_id"]))
+
+
+def test_updates_are_routed_to_their_users_shard():
+    pool = WorkerPool(3, lambda index, queues: None)
+    for update_id, user_id in enumerate((30, 31, 32, 61)):
+        pool.dispatch(message_update(update_id, user_id))
+    callback = {"update_id": 9, "callback_query": {"id": "1", "from": {"id": 44}, "chat_instance": "x"}}
+    pool.dispatch(callback)
+    expected = {0: [0], 1: [1, 3], 2: [2, 9]}
+    routed = {
+        index: [inbox.get(timeout=5)[1]["update_id"] for _ in expected[index]]
+        for index, inbox in enumerate(pool.queues)
+    }
+    assert routed == expected
+    for inbox in pool.queues:
+        with pytest.raises(queue.Empty):
+            inbox.get(timeout=0.1)
+    assert shard_for({"update_id": 10, "poll": {"id": "p"}}, 3) == 0
+
+
+def test_worker_keeps_each_users_updates_in_order():
+    queues = [queue.Queue()]
+    updates = [message_update(update_id, 1 + update_id % 2) for update_id in range(40)]
+    for update in updates:
+        queues[0].put(("update", update))
+    queues[0].put(STOP)
+    dp = RecordingDispatcher()
+    asyncio.run(Worker(0, queues).run(dp, None))
+    assert len(dp.handled) == len(updates)
+    for user_id in (1, 2):
+        handled = [update_id for handled_user, update_id in dp.handled if handled_user == user_id]
+        assert handled == sorted(handled)
+
+
+def test_invalidation_during_a_cache_fill_drops_the_fill(monkeypatch):
+    user_id = 9_100_000
+    read_started = asyncio.Event()
+    release_read = asyncio.Event()
+    read_snapshot = rq.repo_get_user_snapshot
+
+    async def slow_read(session, user_id):
+        snapshot = await read_snapshot(session, user_id)
+        read_started.set()
+        await release_read.wait()
+        return snapshot
+
+    async def scenario():
+        await rq.set_user(user_id)
+        user_cache.clear()
+        monkeypatch.setattr(rq, "repo_get_user_snapshot", slow_read)
+        fill = asyncio.create_task(rq.get_user(user_id))
+        await read_started.wait()
+
+        # Another worker bans the user and publishes the change to this one.
+        async with async_write_session() as session:
+            await session.execute(update(User).where(User.user_id == user_id).values(is_banned=True))
+            await session.commit()
+        queues = [queue.Queue()]
+        queues[0].put(("cache", "user", user_id))
+        queues[0].put(STOP)
+        await Worker(0, queues).run(RecordingDispatcher(), None)
+
+        release_read.set()
+        assert (await fill).is_banned is False
+        assert user_cache.get(user_id) is None
+        assert (await rq.get_user(user_id)).is_banned is True
+        assert user_cache.get(user_id).is_banned is True
+
+    run(scenario)